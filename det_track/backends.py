@@ -0,0 +1,132 @@
+# det_track/backends.py
+# CPU inference backends for the YOLO scripts.
+#
+#   torch          - the .pt weights in PyTorch eager mode (default)
+#   onnx           - exported once to ONNX, run by ONNX Runtime
+#   openvino       - exported once to OpenVINO IR (FP32)
+#   openvino-int8  - OpenVINO IR quantized to INT8 (NNCF), calibrated on
+#                    frames sampled from our own videos (--calib_source)
+#
+# Exports are cached next to the weights, keyed by image size (and INT8):
+#   yolov8n.pt -> yolov8n_640.onnx, yolov8n_640_openvino_model/, yolov8n_640_int8_openvino_model/
+# A <artifact>.json stamp records the weights' size/mtime; a changed .pt re-exports.
+# Ultralytics' AutoBackend runs every artifact, so predict()/track() are unchanged.
+
+import json, os, shutil, tempfile
+from pathlib import Path
+import cv2
+from ultralytics import YOLO
+
+BACKENDS = ["torch", "onnx", "openvino", "openvino-int8"]
+
+def artifact_path(weights, backend, imgsz=640):
+    w = Path(weights)
+    stem = f"{w.stem}_{imgsz}"
+    if backend == "onnx":
+        return w.with_name(stem + ".onnx")
+    if backend == "openvino":
+        return w.with_name(stem + "_openvino_model")
+    if backend == "openvino-int8":
+        return w.with_name(stem + "_int8_openvino_model")
+    raise SystemExit(f"Unknown backend {backend!r}; choose from {BACKENDS}")
+
+def _stamp(weights, backend, imgsz, calib=None):
+    st = os.stat(weights)
+    return {"weights": str(Path(weights).resolve()), "size": st.st_size, "mtime": int(st.st_mtime),
+            "backend": backend, "imgsz": imgsz, "calib": calib}
+
+def _stamp_path(art):
+    return Path(str(art) + ".json")
+
+def calibration_data(sources, n_frames, out_dir, names):
+    """Sample `n_frames` frames evenly from `sources` into `out_dir`/images
+    and write the dataset yaml Ultralytics' INT8 export calibrates on."""
+    img_dir = Path(out_dir) / "images"
+    img_dir.mkdir(parents=True, exist_ok=True)
+    per = max(1, n_frames // len(sources))
+    n = 0
+    for src in sources:
+        cap = cv2.VideoCapture(str(src))
+        if not cap.isOpened():
+            raise SystemExit(f"Cannot open calibration video: {src}")
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        step = max(1, total // per) if total else 1
+        for k in range(per):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, k * step)
+            ok, frame = cap.read()
+            if not ok:
+                break
+            cv2.imwrite(str(img_dir / f"calib_{n:05d}.jpg"), frame)
+            n += 1
+        cap.release()
+    if not n:
+        raise SystemExit("No calibration frames could be read")
+    yaml_path = Path(out_dir) / "calib.yaml"
+    lines = [f"path: {Path(out_dir).resolve()}", "train: images", "val: images", "names:"]
+    lines += [f"  {k}: {v}" for k, v in sorted(names.items())]
+    yaml_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return yaml_path, n
+
+def export(weights, backend, imgsz=640, calib_source=None, calib_frames=300, force=False):
+    """Export `weights` for `backend` unless a matching cached artifact exists.
+    Returns the artifact path."""
+    # load first: Ultralytics downloads a missing stock .pt (yolov8n.pt) here,
+    # and ckpt_path is the file it actually read - that is what gets stamped
+    model = YOLO(weights)
+    weights = model.ckpt_path or weights
+    art = artifact_path(weights, backend, imgsz)
+    calib = None
+    if backend == "openvino-int8":
+        if not calib_source:
+            raise SystemExit("--backend openvino-int8 needs --calib_source (video(s) to calibrate on)")
+        calib = {"sources": [str(Path(s).resolve()) for s in calib_source], "frames": calib_frames}
+    stamp = _stamp(weights, backend, imgsz, calib)
+    sp = _stamp_path(art)
+    if not force and art.exists() and sp.exists():
+        if json.loads(sp.read_text(encoding="utf-8")) == stamp:
+            return art
+
+    kw = dict(imgsz=imgsz, dynamic=True)  # dynamic batch so --batch N still works
+    tmp = None
+    if backend == "onnx":
+        kw.update(format="onnx", simplify=True)
+    else:
+        kw.update(format="openvino", half=False)
+        if backend == "openvino-int8":
+            tmp = tempfile.mkdtemp(prefix="calib_")
+            data, n = calibration_data(calib_source, calib_frames, tmp, model.names)
+            kw.update(int8=True, data=str(data), fraction=1.0)
+            print(f"Calibrating INT8 on {n} frames from {len(calib_source)} video(s)")
+    try:
+        produced = Path(model.export(**kw))
+    finally:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    # Ultralytics names exports after the weights; move them to the keyed name
+    if produced.resolve() != art.resolve():
+        if art.is_dir():
+            shutil.rmtree(art)
+        elif art.exists():
+            art.unlink()
+        shutil.move(str(produced), str(art))
+    sp.write_text(json.dumps(stamp, indent=2), encoding="utf-8")
+    print("Exported:", art)
+    return art
+
+def load_model(weights, backend="torch", imgsz=640, calib_source=None, calib_frames=300):
+    """YOLO model for `backend`, exporting (once) if needed."""
+    if backend == "torch":
+        return YOLO(weights)
+    art = export(weights, backend, imgsz, calib_source, calib_frames)
+    return YOLO(str(art), task="detect")
+
+def add_backend_args(ap):
+    ap.add_argument("--backend", choices=BACKENDS, default="torch",
+                    help="Inference backend; non-torch backends export the weights once and cache the result")
+    ap.add_argument("--calib_source", nargs="+", default=None,
+                    help="Video(s) whose frames calibrate --backend openvino-int8")
+    ap.add_argument("--calib_frames", type=int, default=300, help="Frames sampled for INT8 calibration")
+
+def model_from_args(args, imgsz=640):
+    return load_model(args.weights, args.backend, imgsz, args.calib_source, args.calib_frames)
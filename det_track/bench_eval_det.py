@@ -0,0 +1,106 @@
+# det_track/bench_eval_det.py
+# Benchmark eval_det.py's NumPy matcher against the old iterrows() loop on
+# synthetic labels, and check that both give the same TP / FP / FN / IoUs.
+# Usage (from project root):
+#   python det_track/bench_eval_det.py                        # 10k, 100k, 500k GT boxes
+#   python det_track/bench_eval_det.py --gt_boxes 20000 --loop_max 20000
+#
+# Synthetic frames: --per_frame GT boxes each; predictions are jittered
+# copies (some missed), plus random false positives and duplicates, with
+# confidences rounded to 2 decimals so ties occur. Predictions on frames
+# without GT are also present (the matcher ignores them, as before).
+
+import argparse, json, os, time
+import numpy as np
+import pandas as pd
+from eval_det import iou_xyxy, match_detections
+
+def match_detections_loop(pred, gt, iou_thr=0.5):
+    """The previous matcher (nested iterrows), kept as the reference."""
+    tp, fp, fn = 0, 0, 0
+    ious = []
+    for f in sorted(gt["frame"].unique()):
+        gt_f = gt[gt.frame == f].copy().reset_index(drop=True)
+        pr_f = pred[pred.frame == f].copy()
+        if pr_f.empty:
+            fn += len(gt_f); continue
+        pr_f = pr_f.sort_values("conf", ascending=False).reset_index(drop=True)
+        used = np.zeros(len(gt_f), dtype=bool)
+        for _, r in pr_f.iterrows():
+            pb = [r.xmin, r.ymin, r.xmax, r.ymax]
+            best_j, best_iou = -1, 0.0
+            for j, g in gt_f.iterrows():
+                if used[j]: continue
+                gb = [g.xmin, g.ymin, g.xmax, g.ymax]
+                iou = iou_xyxy(pb, gb)
+                if iou > best_iou:
+                    best_iou, best_j = iou, j
+            if best_j >= 0 and best_iou >= iou_thr:
+                tp += 1
+                used[best_j] = True
+                ious.append(best_iou)
+            else:
+                fp += 1
+        fn += int((~used).sum())
+    return tp, fp, fn, ious
+
+def synthetic(n_gt, per_frame=8, seed=0):
+    rng = np.random.default_rng(seed)
+    n_frames = max(1, n_gt // per_frame)
+    frame = np.repeat(np.arange(1, n_frames + 1), per_frame)[:n_gt]
+    xy = rng.uniform(0, 1200, (n_gt, 2)); wh = rng.uniform(20, 160, (n_gt, 2))
+    gt = pd.DataFrame({"frame": frame, "xmin": xy[:, 0], "ymin": xy[:, 1],
+                       "xmax": xy[:, 0] + wh[:, 0], "ymax": xy[:, 1] + wh[:, 1], "cls": 2})
+    hit = rng.random(n_gt) < 0.85
+    p = gt[hit].copy()
+    p[["xmin", "ymin", "xmax", "ymax"]] += rng.normal(0, 6, (len(p), 4))
+    n_fp = n_gt // 4
+    xy = rng.uniform(0, 1200, (n_fp, 2)); wh = rng.uniform(20, 160, (n_fp, 2))
+    fp = pd.DataFrame({"frame": rng.integers(1, n_frames + 20, n_fp), "xmin": xy[:, 0], "ymin": xy[:, 1],
+                       "xmax": xy[:, 0] + wh[:, 0], "ymax": xy[:, 1] + wh[:, 1], "cls": 2})
+    dup = p.sample(frac=0.1, random_state=seed)  # second box on the same object
+    pred = pd.concat([p, fp, dup], ignore_index=True).sample(frac=1.0, random_state=seed).reset_index(drop=True)
+    pred["conf"] = np.round(rng.uniform(0.05, 1.0, len(pred)), 2).astype(np.float32)
+    cols = ["xmin", "ymin", "xmax", "ymax"]
+    gt[cols] = gt[cols].astype(np.float32); pred[cols] = pred[cols].astype(np.float32)
+    return pred, gt
+
+def timed(fn, *a):
+    t = time.perf_counter()
+    out = fn(*a)
+    return out, time.perf_counter() - t
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the vectorized detection matcher")
+    ap.add_argument("--gt_boxes", type=int, nargs="+", default=[10_000, 100_000, 500_000])
+    ap.add_argument("--per_frame", type=int, default=8, help="GT boxes per labelled frame")
+    ap.add_argument("--loop_max", type=int, default=10_000,
+                    help="skip the (slow) iterrows reference above this many GT boxes")
+    ap.add_argument("--iou_thr", type=float, default=0.5)
+    ap.add_argument("--out_json", default="det_track/outputs/bench_eval_det.json")
+    args = ap.parse_args()
+
+    results = []
+    for n in args.gt_boxes:
+        pred, gt = synthetic(n, args.per_frame)
+        new, t_new = timed(match_detections, pred, gt, args.iou_thr)
+        rec = {"gt_boxes": n, "pred_boxes": len(pred), "numpy_s": round(t_new, 3),
+               "gt_boxes_per_s": round(n / t_new), "tp": new[0], "fp": new[1], "fn": new[2]}
+        if n <= args.loop_max:
+            old, t_old = timed(match_detections_loop, pred, gt, args.iou_thr)
+            rec.update(loop_s=round(t_old, 3), speedup=round(t_old / t_new, 1), identical=old == new)
+        results.append(rec)
+        print(rec)
+
+    print("\n| GT boxes | predictions | numpy s | loop s | speedup | identical |")
+    print("|----------|-------------|---------|--------|---------|-----------|")
+    for r in results:
+        print(f"| {r['gt_boxes']:,} | {r['pred_boxes']:,} | {r['numpy_s']:.2f} | "
+              f"{r.get('loop_s', float('nan')):.2f} | {r.get('speedup', float('nan')):.1f}x | {r.get('identical', '-')} |")
+    os.makedirs(os.path.dirname(args.out_json), exist_ok=True)
+    with open(args.out_json, "w", encoding="utf-8") as f:
+        json.dump({"per_frame": args.per_frame, "iou_thr": args.iou_thr, "results": results}, f, indent=2)
+    print("Wrote:", args.out_json)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# det_track/bench_speed_engine.py
+# Benchmark speed_engine.py (summarize_tracks.py's speed/parked step) against
+# the old pandas groupby + per-ID rolling lambda on synthetic tracks.
+# Usage (from project root):
+#   python det_track/bench_speed_engine.py                       # 100k, 1M, 10M rows
+#   python det_track/bench_speed_engine.py --rows 1000000 --pandas_max 1000000
+#
+# Synthetic tracks: --track_len rows per ID on average, random-walk centres
+# with some IDs standing still (parked). Where both engines run, their
+# outputs are compared (is_parked exactly, speeds to float rounding).
+# "presorted" times the same rows in (id, frame) order, as read from a store.
+
+import argparse, json, os, time
+import numpy as np
+import pandas as pd
+from speed_engine import sort_order, speed_columns
+
+def synthetic(n_rows, track_len=300, seed=0):
+    rng = np.random.default_rng(seed)
+    n_ids = max(1, n_rows // track_len)
+    ids = rng.integers(1, n_ids + 1, n_rows).astype(np.int32)
+    frames = np.arange(1, n_rows + 1, dtype=np.int32)  # unique per row; order shuffled below
+    step = rng.normal(0, 2.0, (n_rows, 2)) * (rng.random(n_ids + 1)[ids] > 0.3)[:, None]
+    order = np.lexsort((frames, ids))
+    xy = np.empty_like(step)
+    xy[order] = np.cumsum(step[order], axis=0)  # walk (drift across IDs is harmless)
+    perm = rng.permutation(n_rows)               # tracks arrive interleaved, as from track.py
+    return pd.DataFrame({"frame": frames[perm], "id": ids[perm],
+                         "cx": 500 + xy[perm, 0], "cy": 300 + xy[perm, 1]})
+
+def run_pandas(df, win, thr):
+    df = df.sort_values(["id", "frame"])
+    df["dx"] = df.groupby("id")["cx"].diff().fillna(0.0)
+    df["dy"] = df.groupby("id")["cy"].diff().fillna(0.0)
+    df["speed_px"] = np.hypot(df["dx"], df["dy"])
+    df["speed_ma"] = df.groupby("id")["speed_px"].transform(
+        lambda s: s.rolling(win, min_periods=max(2, win // 2)).mean())
+    df["is_parked"] = (df["speed_ma"] < thr).astype(int)
+    return df
+
+def run_engine(df, win, thr):
+    df = df.iloc[sort_order(df["id"].to_numpy(), df["frame"].to_numpy())]
+    for col, v in speed_columns(df["id"].to_numpy(), df["cx"].to_numpy(), df["cy"].to_numpy(), win, thr).items():
+        df[col] = v
+    return df
+
+def timed(fn, *a):
+    t = time.perf_counter()
+    out = fn(*a)
+    return out, time.perf_counter() - t
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the vectorized speed/parked engine")
+    ap.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000, 10_000_000])
+    ap.add_argument("--track_len", type=int, default=300, help="average rows per track ID")
+    ap.add_argument("--pandas_max", type=int, default=1_000_000,
+                    help="skip the (slow) pandas baseline above this many rows")
+    ap.add_argument("--park_win", type=int, default=10)
+    ap.add_argument("--park_thr", type=float, default=0.5)
+    ap.add_argument("--out_json", default="det_track/outputs/bench_speed_engine.json")
+    args = ap.parse_args()
+
+    results = []
+    for n in args.rows:
+        df = synthetic(n, args.track_len)
+        new, t_new = timed(run_engine, df, args.park_win, args.park_thr)
+        # track-store input arrives already in (id, frame) order
+        _, t_pre = timed(run_engine, new[["frame", "id", "cx", "cy"]], args.park_win, args.park_thr)
+        rec = {"rows": n, "ids": int(df["id"].nunique()), "engine_s": round(t_new, 3),
+               "engine_rows_per_s": round(n / t_new), "engine_presorted_s": round(t_pre, 3)}
+        if n <= args.pandas_max:
+            old, t_old = timed(run_pandas, df, args.park_win, args.park_thr)
+            rec.update(pandas_s=round(t_old, 3), speedup=round(t_old / t_new, 1),
+                       parked_equal=bool((old["is_parked"].to_numpy() == new["is_parked"].to_numpy()).all()),
+                       speed_ma_max_abs_diff=float(np.nanmax(np.abs(old["speed_ma"].to_numpy()
+                                                                    - new["speed_ma"].to_numpy()))))
+        results.append(rec)
+        print(rec)
+
+    print("\n| rows | IDs | engine s | engine s (presorted) | pandas s | speedup |")
+    print("|------|-----|----------|----------------------|----------|---------|")
+    for r in results:
+        print(f"| {r['rows']:,} | {r['ids']:,} | {r['engine_s']:.2f} | {r['engine_presorted_s']:.2f} | "
+              f"{r.get('pandas_s', float('nan')):.2f} | {r.get('speedup', float('nan')):.1f}x |")
+    os.makedirs(os.path.dirname(args.out_json), exist_ok=True)
+    with open(args.out_json, "w", encoding="utf-8") as f:
+        json.dump({"track_len": args.track_len, "park_win": args.park_win, "results": results}, f, indent=2)
+    print("Wrote:", args.out_json)
+
+if __name__ == "__main__":
+    main()
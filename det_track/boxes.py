@@ -0,0 +1,71 @@
+# det_track/boxes.py
+# Small vectorized box helpers shared by the tracking / evaluation scripts.
+import numpy as np
+
+def iou_matrix(a, b):
+    """Pairwise IoU between boxes a (N,4) and b (M,4) in xyxy -> (N,M).
+
+    Same arithmetic as the scalar eval_det.iou_xyxy, so results agree
+    bit for bit; pairs with a non-positive union get 0.
+    """
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float64).reshape(-1, 4)
+    ix1 = np.maximum(a[:, None, 0], b[None, :, 0]); iy1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    ix2 = np.minimum(a[:, None, 2], b[None, :, 2]); iy2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    iw = np.maximum(0.0, ix2 - ix1); ih = np.maximum(0.0, iy2 - iy1)
+    inter = iw * ih
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    ua = area_a[:, None] + area_b[None, :] - inter
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = np.where(ua > 0, inter / ua, 0.0)
+    return out
+
+def iou_pairs(a, b):
+    """IoU of a[i] with b[i] for paired boxes (N,4), (N,4) -> (N,), with the
+    same arithmetic as iou_matrix."""
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float64).reshape(-1, 4)
+    iw = np.maximum(0.0, np.minimum(a[:, 2], b[:, 2]) - np.maximum(a[:, 0], b[:, 0]))
+    ih = np.maximum(0.0, np.minimum(a[:, 3], b[:, 3]) - np.maximum(a[:, 1], b[:, 1]))
+    inter = iw * ih
+    ua = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1]) + (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1]) - inter
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(ua > 0, inter / ua, 0.0)
+
+def greedy_match(score, thr, by_row=False):
+    """One-to-one greedy assignment on a score matrix (IoU, votes, ...) (N, M).
+
+    A pair can match only if its score is > 0 and >= thr. By default pairs
+    are taken by descending score (ties in row-major order); with by_row the
+    rows are taken in order and each gets its best unused column (first on
+    ties) - detection matching, rows in confidence order.
+    Returns (matched column or -1, score of the match or 0) per row.
+    """
+    score = np.asarray(score, dtype=np.float64)
+    n_r, n_c = score.shape
+    match, best = np.full(n_r, -1), np.zeros(n_r)
+    if not n_r or not n_c:
+        return match, best
+    row_max = score.max(axis=1)
+    cand = np.flatnonzero((row_max > 0) & (row_max >= thr))  # the others can never match
+    first = score[cand].argmax(axis=1)
+    if len(np.unique(first)) == len(first):  # no two want the same column: nothing to resolve
+        match[cand], best[cand] = first, score[cand, first]
+        return match, best
+    used = np.zeros(n_c, dtype=bool)
+    if by_row:
+        for i in cand:
+            row = np.where(used, 0.0, score[i])
+            j = int(row.argmax())
+            if row[j] > 0 and row[j] >= thr:
+                match[i], best[i], used[j] = j, row[j], True
+                if used.all():
+                    break
+        return match, best
+    pairs = np.argwhere((score > 0) & (score >= thr))
+    pairs = pairs[np.argsort(-score[pairs[:, 0], pairs[:, 1]], kind="stable")]
+    for i, j in pairs:
+        if match[i] < 0 and not used[j]:
+            match[i], best[i], used[j] = j, score[i, j], True
+    return match, best
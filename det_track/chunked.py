@@ -0,0 +1,62 @@
+# det_track/chunked.py
+# Helpers for the out-of-core (--chunk_rows) modes of summarize_tracks.py,
+# gis/export_linestrings.py and robustness/run_robustness.py.
+#
+# Tracks are read as frame-ordered chunks (track_store.iter_frame_chunks).
+# Per-key distinct-ID counts are merged across chunks by holding back only
+# the time bin that is still open at the chunk boundary; every earlier bin
+# is final and is reduced right away, so memory follows the chunk size.
+
+import numpy as np
+import pandas as pd
+from track_store import iter_frame_chunks
+
+def cut_edges(mn, mx, bins):
+    """The edges pd.cut(x, bins=<int>) derives from min(x) / max(x)."""
+    if mn == mx:
+        adj = 0.001 * abs(mn) if mn != 0 else 0.001
+        return np.linspace(mn - adj, mx + adj, bins + 1, endpoint=True)
+    edges = np.linspace(mn, mx, bins + 1, endpoint=True)
+    edges[0] -= (mx - mn) * 0.001
+    return edges
+
+def cx_range(path, chunk_rows):
+    """(min, max) of the box centre x over a whole track file, chunk by chunk."""
+    mn, mx = np.inf, -np.inf
+    for df in iter_frame_chunks(path, ["xmin", "xmax"], chunk_rows):
+        cx = (df["xmin"].astype("float64") + df["xmax"].astype("float64")) / 2.0
+        if len(cx):
+            mn, mx = min(mn, cx.min()), max(mx, cx.max())
+    return float(mn), float(mx)
+
+class UniqueByBin:
+    """df.groupby(keys)["id"].nunique() over frame-ordered chunks.
+
+    `keys` ends with the time bin column. add() gets each chunk and the
+    time bin of its last frame (the only bin the next chunk can extend).
+    """
+    def __init__(self, keys, name):
+        self.keys, self.name = list(keys), name
+        self.tbin = self.keys[-1]
+        self.pending, self.done = None, []
+
+    def _reduce(self, part):
+        if len(part):
+            self.done.append(part.groupby(self.keys, observed=True)["id"].nunique().reset_index(name=self.name))
+
+    def add(self, df, open_tbin):
+        part = df[self.keys + ["id"]].drop_duplicates()
+        if self.pending is not None:
+            part = pd.concat([self.pending, part], ignore_index=True).drop_duplicates()
+        still_open = (part[self.tbin] == open_tbin).to_numpy()
+        self._reduce(part[~still_open])
+        self.pending = part[still_open]
+
+    def result(self):
+        if self.pending is not None:
+            self._reduce(self.pending)
+            self.pending = None
+        if not self.done:
+            return pd.DataFrame(columns=self.keys + [self.name])
+        out = pd.concat(self.done, ignore_index=True)
+        return out.sort_values(self.keys, kind="stable").reset_index(drop=True)
@@ -0,0 +1,119 @@
+# det_track/compare_backends.py
+# Compare inference backends (backends.py) on the same frames:
+# detector fps on CPU, and precision / recall against labels.csv.
+# Usage (from project root):
+#   python det_track/compare_backends.py
+#   python det_track/compare_backends.py --calib_source det_track/sample_video.mp4   # adds openvino-int8
+#
+# Timing runs on frames already decoded into memory (batch 1, after warmup),
+# so only the detector is measured. Accuracy uses the labelled frames and the
+# same greedy matching as eval_det.py.
+
+import argparse, json, os, time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import cv2
+from backends import BACKENDS, load_model, artifact_path
+from eval_det import match_detections
+from track_store import read_tracks
+
+def read_frame_list(source, frames):
+    """{frame (1-based): BGR image} for the requested frame numbers."""
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        raise SystemExit(f"Cannot open video: {source}")
+    out = {}
+    for f in sorted(frames):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, f - 1)
+        ok, img = cap.read()
+        if ok:
+            out[f] = img
+    cap.release()
+    return out
+
+def predict_rows(model, frames, kw):
+    rows = []
+    for f, img in frames.items():
+        b = model.predict(img, verbose=False, **kw)[0].boxes
+        for (x1, y1, x2, y2), c, p in zip(b.xyxy.cpu().numpy(), b.cls.cpu().numpy(), b.conf.cpu().numpy()):
+            rows.append({"frame": f, "xmin": x1, "ymin": y1, "xmax": x2, "ymax": y2, "conf": p, "cls": int(c)})
+    return pd.DataFrame(rows, columns=["frame", "xmin", "ymin", "xmax", "ymax", "conf", "cls"])
+
+def time_backend(model, imgs, kw, warmup=5):
+    for img in imgs[:warmup]:
+        model.predict(img, verbose=False, **kw)
+    t = time.perf_counter()
+    for img in imgs:
+        model.predict(img, verbose=False, **kw)
+    dt = time.perf_counter() - t
+    return len(imgs) / dt if dt > 0 else 0.0
+
+def artifact_mb(weights, backend, imgsz):
+    p = Path(weights) if backend == "torch" else artifact_path(weights, backend, imgsz)
+    if p.is_dir():
+        return sum(f.stat().st_size for f in p.rglob("*") if f.is_file()) / 1e6
+    return p.stat().st_size / 1e6 if p.exists() else 0.0
+
+def main():
+    ap = argparse.ArgumentParser(description="fps and accuracy of each inference backend")
+    ap.add_argument("--source", default="det_track/sample_video.mp4")
+    ap.add_argument("--gt", "--gt_csv", dest="gt", default="det_track/outputs/labels.csv",
+                    help="from label_click.py (CSV or track store)")
+    ap.add_argument("--weights", default="yolov8n.pt")
+    ap.add_argument("--backends", nargs="+", choices=BACKENDS, default=None,
+                    help="default: torch onnx openvino (+ openvino-int8 with --calib_source)")
+    ap.add_argument("--calib_source", nargs="+", default=None, help="Video(s) for INT8 calibration")
+    ap.add_argument("--calib_frames", type=int, default=300)
+    ap.add_argument("--imgsz", type=int, default=640)
+    ap.add_argument("--conf", type=float, default=0.25)
+    ap.add_argument("--iou", type=float, default=0.7, help="NMS IoU threshold")
+    ap.add_argument("--classes", type=int, nargs="*", default=None)
+    ap.add_argument("--iou_thr", type=float, default=0.5, help="IoU for a true positive")
+    ap.add_argument("--time_frames", type=int, default=100, help="Frames used for the fps measurement")
+    ap.add_argument("--out_json", default="det_track/outputs/backend_compare.json")
+    args = ap.parse_args()
+
+    backends = args.backends or (["torch", "onnx", "openvino"] + (["openvino-int8"] if args.calib_source else []))
+    gt = read_tracks(args.gt, ["frame", "xmin", "ymin", "xmax", "ymax", "cls"])
+    if gt.empty:
+        raise SystemExit("Empty ground truth. Run label_click.py first.")
+    labelled = read_frame_list(args.source, gt["frame"].unique().tolist())
+    timing = list(read_frame_list(args.source, range(1, args.time_frames + 1)).values())
+    if not timing or not labelled:
+        raise SystemExit(f"Could not read frames from {args.source}")
+    kw = dict(imgsz=args.imgsz, conf=args.conf, iou=args.iou, classes=args.classes)
+
+    results = []
+    for b in backends:
+        try:
+            model = load_model(args.weights, b, args.imgsz, args.calib_source, args.calib_frames)
+        except Exception as e:  # e.g. openvino not installed - report and go on
+            print(f"{b}: skipped ({e})")
+            results.append({"backend": b, "error": str(e)})
+            continue
+        fps = time_backend(model, timing, kw)
+        tp, fp, fn, ious = match_detections(predict_rows(model, labelled, kw), gt, args.iou_thr)
+        results.append({"backend": b, "fps": round(fps, 2), "ms_per_frame": round(1000 / fps, 2) if fps else None,
+                        "tp": tp, "fp": fp, "fn": fn,
+                        "precision": round(tp / (tp + fp), 4) if tp + fp else 0.0,
+                        "recall": round(tp / (tp + fn), 4) if tp + fn else 0.0,
+                        "mean_iou_on_tps": round(float(np.mean(ious)), 4) if ious else 0.0,
+                        "size_mb": round(artifact_mb(args.weights, b, args.imgsz), 2)})
+
+    print("\n| backend | fps | ms/frame | precision | recall | mean IoU | size MB |")
+    print("|---------|-----|----------|-----------|--------|----------|---------|")
+    for r in results:
+        if "error" in r:
+            print(f"| {r['backend']} | - | - | - | - | - | - |")
+        else:
+            print(f"| {r['backend']} | {r['fps']:.1f} | {r['ms_per_frame']:.1f} | {r['precision']:.3f} "
+                  f"| {r['recall']:.3f} | {r['mean_iou_on_tps']:.3f} | {r['size_mb']:.1f} |")
+    os.makedirs(os.path.dirname(args.out_json), exist_ok=True)
+    with open(args.out_json, "w", encoding="utf-8") as f:
+        json.dump({"source": args.source, "gt": args.gt, "weights": args.weights, "imgsz": args.imgsz,
+                   "timed_frames": len(timing), "labelled_frames": len(labelled), "results": results}, f, indent=2)
+    print("Wrote:", args.out_json)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+# det_track/curb_zones.py
+# Curb zones (stalls, loading zones, hydrants, ...) from a GeoJSON polygon file,
+# and a grid-indexed, vectorized point-in-polygon assignment of track centres.
+# Usage (from project root):
+#   python det_track/curb_zones.py strips --frame_w 1280 --frame_h 720 --bins 4 --out gis/curb_zones.geojson
+#   python det_track/summarize_tracks.py --zones gis/curb_zones.geojson     # segment = zone id
+#   python det_track/curb_zones.py assign --zones gis/curb_zones.geojson --tracks det_track/outputs/tracks.trk
+#   python det_track/curb_zones.py bench --zones 400 --points 5000000
+#
+# Zone file: a FeatureCollection of Polygon / MultiPolygon features. The zone
+# id is properties.zone_id (else id / name, else the feature's index).
+# Coordinates are image pixels, or a projected CRS when the collection has an
+# "image_to_world" member: a 3x3 homography taking pixels to that CRS.
+# Holes count as outside (even-odd rule). Where zones overlap, the first one
+# in the file wins.
+#
+# Index: a uniform grid over the zones' extent (~4 cells per zone), listing
+# per cell the zones whose bounding box touches it. A point is only tested
+# against its cell's candidates, and the crossing-number test runs on flat
+# (point, edge) arrays, block by block.
+
+import argparse, json, math, time
+import numpy as np
+import pandas as pd
+
+def _rings(geom):
+    """Rings (each (n, 2) closed or not) of a Polygon / MultiPolygon."""
+    if geom["type"] == "Polygon":
+        return [np.asarray(r, dtype=np.float64)[:, :2] for r in geom["coordinates"]]
+    if geom["type"] == "MultiPolygon":
+        return [np.asarray(r, dtype=np.float64)[:, :2] for poly in geom["coordinates"] for r in poly]
+    raise SystemExit(f"Zone geometry must be Polygon or MultiPolygon, got {geom['type']}")
+
+class CurbZones:
+    def __init__(self, ids, rings, image_to_world=None):
+        self.ids = [str(i) for i in ids]
+        if len(set(self.ids)) != len(self.ids):
+            raise SystemExit("Zone ids must be unique")
+        self.H = None if image_to_world is None else np.asarray(image_to_world, dtype=np.float64).reshape(3, 3)
+        # flat edge list, zone by zone
+        ex0, ey0, ex1, ey1, n_edges, boxes = [], [], [], [], [], []
+        for zone_rings in rings:
+            n = 0
+            for r in zone_rings:
+                if len(r) < 3:
+                    continue
+                nxt = np.roll(r, -1, axis=0)  # closes the ring; a repeated closing vertex gives one empty edge
+                ex0.append(r[:, 0]); ey0.append(r[:, 1]); ex1.append(nxt[:, 0]); ey1.append(nxt[:, 1])
+                n += len(r)
+            pts = np.concatenate(zone_rings) if zone_rings else np.zeros((1, 2))
+            boxes.append([pts[:, 0].min(), pts[:, 1].min(), pts[:, 0].max(), pts[:, 1].max()])
+            n_edges.append(n)
+        self.ex0, self.ey0 = np.concatenate(ex0), np.concatenate(ey0)
+        self.ex1, self.ey1 = np.concatenate(ex1), np.concatenate(ey1)
+        self.zoff = np.r_[0, np.cumsum(n_edges)]
+        self.box = np.asarray(boxes, dtype=np.float64)
+        self._build_grid()
+
+    @classmethod
+    def from_geojson(cls, path):
+        with open(path, encoding="utf-8") as f:
+            gj = json.load(f)
+        feats = gj["features"] if gj.get("type") == "FeatureCollection" else [gj]
+        if not feats:
+            raise SystemExit(f"{path} has no zones")
+        ids, rings = [], []
+        for k, ft in enumerate(feats):
+            p = ft.get("properties") or {}
+            ids.append(p.get("zone_id", p.get("id", p.get("name", ft.get("id", k)))))
+            rings.append(_rings(ft["geometry"]))
+        return cls(ids, rings, gj.get("image_to_world"))
+
+    def _build_grid(self):
+        x0, y0 = self.box[:, 0].min(), self.box[:, 1].min()
+        x1, y1 = self.box[:, 2].max(), self.box[:, 3].max()
+        w, h = max(x1 - x0, 1e-9), max(y1 - y0, 1e-9)
+        cell = math.sqrt(w * h / (4 * len(self.ids))) or max(w, h)
+        self.origin, self.cell = (x0, y0), cell
+        self.nx, self.ny = max(1, math.ceil(w / cell)), max(1, math.ceil(h / cell))
+        ix = np.clip(((self.box[:, [0, 2]] - x0) // cell).astype(np.int64), 0, self.nx - 1)
+        iy = np.clip(((self.box[:, [1, 3]] - y0) // cell).astype(np.int64), 0, self.ny - 1)
+        cells, zones = [], []
+        for z in range(len(self.ids)):  # hundreds of zones: a one-off loop
+            gx, gy = np.meshgrid(np.arange(ix[z, 0], ix[z, 1] + 1), np.arange(iy[z, 0], iy[z, 1] + 1))
+            cells.append((gy * self.nx + gx).ravel())
+            zones.append(np.full(gx.size, z))
+        cells, zones = np.concatenate(cells), np.concatenate(zones)
+        order = np.argsort(cells, kind="stable")  # zones stay in file order within a cell
+        self.cell_zone = zones[order]
+        self.cell_off = np.searchsorted(cells[order], np.arange(self.nx * self.ny + 1))
+
+    def to_zone_coords(self, x, y):
+        x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+        if self.H is None:
+            return x, y
+        H = self.H
+        d = H[2, 0] * x + H[2, 1] * y + H[2, 2]
+        return (H[0, 0] * x + H[0, 1] * y + H[0, 2]) / d, (H[1, 0] * x + H[1, 1] * y + H[1, 2]) / d
+
+    def assign(self, x, y, block=1 << 18):
+        """Zone index (into self.ids) of each point (x, y) in image pixels, -1 outside every zone."""
+        x, y = self.to_zone_coords(np.ravel(x), np.ravel(y))
+        out = np.full(len(x), -1, dtype=np.int32)
+        for lo in range(0, len(x), block):
+            out[lo:lo + block] = self._assign_block(x[lo:lo + block], y[lo:lo + block])
+        return out
+
+    def _assign_block(self, x, y):
+        out = np.full(len(x), -1, dtype=np.int32)
+        ix = np.floor((x - self.origin[0]) / self.cell)
+        iy = np.floor((y - self.origin[1]) / self.cell)
+        ok = np.flatnonzero((ix >= 0) & (ix < self.nx) & (iy >= 0) & (iy < self.ny))
+        c = iy[ok].astype(np.int64) * self.nx + ix[ok].astype(np.int64)
+        # (point, candidate zone) pairs from the point's cell, then a bounding box check
+        n = self.cell_off[c + 1] - self.cell_off[c]
+        pi = np.repeat(ok, n)
+        zi = self.cell_zone[np.repeat(self.cell_off[c], n) + np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)]
+        px, py = x[pi], y[pi]
+        b = self.box[zi]
+        keep = (px >= b[:, 0]) & (px <= b[:, 2]) & (py >= b[:, 1]) & (py <= b[:, 3])
+        pi, zi, px, py = pi[keep], zi[keep], px[keep], py[keep]
+        if not len(pi):
+            return out
+        # crossing number over every (pair, edge of the pair's zone)
+        ne = self.zoff[zi + 1] - self.zoff[zi]
+        q = np.repeat(np.arange(len(pi)), ne)
+        e = np.repeat(self.zoff[zi], ne) + np.arange(ne.sum()) - np.repeat(np.cumsum(ne) - ne, ne)
+        qx, qy = px[q], py[q]
+        y0, y1, x0, x1 = self.ey0[e], self.ey1[e], self.ex0[e], self.ex1[e]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cross = ((y0 > qy) != (y1 > qy)) & (qx < (x1 - x0) * (qy - y0) / (y1 - y0) + x0)
+        inside = np.bincount(q, weights=cross, minlength=len(pi)).astype(np.int64) % 2 == 1
+        # first zone in file order per point (pairs run point by point, zones ascending)
+        pi, zi = pi[inside], zi[inside]
+        if not len(pi):
+            return out
+        first = np.r_[True, pi[1:] != pi[:-1]]
+        out[pi[first]] = zi[first]
+        return out
+
+    def segments(self, x, y):
+        """Zone ids as a Categorical (NaN outside), a drop-in for the pd.cut segments."""
+        return pd.Categorical.from_codes(self.assign(x, y), categories=self.ids)
+
+def assign_loop(zones, x, y):
+    """Reference: every point against every zone, edge by edge (slow)."""
+    out = np.full(len(x), -1, dtype=np.int32)
+    x, y = zones.to_zone_coords(x, y)
+    for k in range(len(x)):
+        for z in range(len(zones.ids)):
+            lo, hi = zones.zoff[z], zones.zoff[z + 1]
+            inside = False
+            for e in range(lo, hi):
+                x0, y0, x1, y1 = zones.ex0[e], zones.ey0[e], zones.ex1[e], zones.ey1[e]
+                if (y0 > y[k]) != (y1 > y[k]) and x[k] < (x1 - x0) * (y[k] - y0) / (y1 - y0) + x0:
+                    inside = not inside
+            if inside:
+                out[k] = z
+                break
+    return out
+
+def strip_features(frame_w, frame_h, bins):
+    """--bins equal vertical strips as zone features, ids S1..Sn: the
+    summarize_tracks.py --frame_w segments, except that a centre exactly on
+    an inner edge goes to the strip on its right."""
+    edges = np.linspace(0.0, float(frame_w), bins + 1)
+    return [{"type": "Feature", "properties": {"zone_id": f"S{i+1}"},
+             "geometry": {"type": "Polygon", "coordinates": [[[edges[i], 0.0], [edges[i + 1], 0.0],
+                                                              [edges[i + 1], frame_h], [edges[i], frame_h],
+                                                              [edges[i], 0.0]]]}}
+            for i in range(bins)]
+
+def synthetic_stalls(n, seed=0):
+    """n rotated rectangular stalls along a few curb lines, some with a hole."""
+    rng = np.random.default_rng(seed)
+    ids, rings = [], []
+    per_row = max(1, int(math.sqrt(n)) * 2)
+    for k in range(n):
+        cx, cy = 60.0 * (k % per_row) + 30, 90.0 * (k // per_row) + 40
+        a = rng.uniform(-0.3, 0.3)
+        R = np.array([[math.cos(a), -math.sin(a)], [math.sin(a), math.cos(a)]])
+        rect = np.array([[-25, -35], [25, -35], [25, 35], [-25, 35]], dtype=np.float64) @ R.T + [cx, cy]
+        zr = [rect]
+        if k % 7 == 0:
+            zr.append(np.array([[-5, -5], [5, -5], [5, 5], [-5, 5]], dtype=np.float64) + [cx, cy])
+        ids.append(f"stall_{k}"); rings.append(zr)
+    return CurbZones(ids, rings)
+
+def main():
+    ap = argparse.ArgumentParser(description="Curb zone polygons and point-in-zone assignment")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("strips", help="write --bins equal vertical strips over [0, frame_w] as a zone file")
+    s.add_argument("--frame_w", type=float, required=True)
+    s.add_argument("--frame_h", type=float, required=True)
+    s.add_argument("--bins", type=int, default=4)
+    s.add_argument("--out", default="gis/curb_zones.geojson")
+    a = sub.add_parser("assign", help="rows and distinct IDs per zone for a track file")
+    a.add_argument("--zones", required=True)
+    a.add_argument("--tracks", default="det_track/outputs/tracks.trk")
+    b = sub.add_parser("bench", help="time the indexed assignment on synthetic stalls")
+    b.add_argument("--zones", type=int, default=400, help="synthetic stall polygons")
+    b.add_argument("--points", type=int, default=2_000_000)
+    b.add_argument("--loop_points", type=int, default=2000, help="points checked against the slow reference")
+    args = ap.parse_args()
+
+    if args.cmd == "strips":
+        import os
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"type": "FeatureCollection", "features": strip_features(args.frame_w, args.frame_h, args.bins)},
+                      f, indent=1)
+        print("Wrote:", args.out)
+    elif args.cmd == "assign":
+        from track_store import read_tracks
+        zones = CurbZones.from_geojson(args.zones)
+        df = read_tracks(args.tracks, ["id", "xmin", "ymin", "xmax", "ymax"])
+        t = time.perf_counter()
+        df["zone"] = zones.segments((df["xmin"].astype("float64") + df["xmax"]) / 2.0,
+                                    (df["ymin"].astype("float64") + df["ymax"]) / 2.0)
+        dt = time.perf_counter() - t
+        per = df.groupby("zone", observed=True)["id"].agg(rows="size", ids="nunique").reset_index()
+        print(f"{len(df):,} centres -> {len(zones.ids)} zones in {dt:.3f}s ({int(df['zone'].isna().sum()):,} outside)")
+        print("| zone | rows | ids |")
+        print("|------|------|-----|")
+        for r in per.itertuples(index=False):
+            print(f"| {r.zone} | {r.rows} | {r.ids} |")
+    else:
+        zones = synthetic_stalls(args.zones)
+        rng = np.random.default_rng(1)
+        x = rng.uniform(zones.box[:, 0].min() - 20, zones.box[:, 2].max() + 20, args.points)
+        y = rng.uniform(zones.box[:, 1].min() - 20, zones.box[:, 3].max() + 20, args.points)
+        t = time.perf_counter()
+        got = zones.assign(x, y)
+        dt = time.perf_counter() - t
+        m = min(args.loop_points, args.points)
+        t = time.perf_counter()
+        ref = assign_loop(zones, x[:m], y[:m])
+        dt_loop = time.perf_counter() - t
+        print(f"{args.points:,} points x {args.zones} zones ({zones.nx}x{zones.ny} grid): {dt:.2f}s "
+              f"({args.points / dt / 1e6:.1f} M points/s), {100 * (got >= 0).mean():.1f}% inside")
+        print(f"loop reference on {m:,} points: {dt_loop:.2f}s (~{dt_loop / m * args.points / dt:.0f}x slower), "
+              f"identical: {bool((ref == got[:m]).all())}")
+
+if __name__ == "__main__":
+    main()
@@ -1,63 +1,132 @@
 # det_track/detect_to_csv.py
-from ultralytics import YOLO
 from pathlib import Path
-import argparse, csv, os
+import argparse, csv, os, time
+from track_store import is_csv, write_store
+from frame_pipeline import read_frames, run_pipeline, log_throughput
+from motion_gate import add_gate_args, gate_from_args
+from roi import load_roi
+from backends import add_backend_args, model_from_args
+from make_variants import TRANSFORMS, get_transforms
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--source", default="det_track/sample_video.mp4", help="video or image path")
     ap.add_argument("--weights", default="yolov8n.pt", help="YOLOv8 model weights")
-    ap.add_argument("--conf", type=float, default=0.25, help="confidence threshold")
+    ap.add_argument("--conf", type=float, default=0.25,
+                    help="confidence threshold (dump with ~0.01 for eval_det.py --sweep)")
     ap.add_argument("--iou", type=float, default=0.7, help="NMS IoU threshold")
     ap.add_argument("--imgsz", type=int, default=640, help="inference image size")
     ap.add_argument("--max_frames", type=int, default=50, help="number of frames to process")
     ap.add_argument("--classes", type=int, nargs="*", default=None,
                     help="optional list of class indices to keep (e.g. 2 3 5 7 for vehicles)")
-    ap.add_argument("--out_csv", default="det_track/outputs/detect50.csv", help="output CSV path")
+    ap.add_argument("--out", "--out_csv", dest="out", default="det_track/outputs/detect50.trk",
+                    help="output path (track store directory, or a .csv path)")
+    ap.add_argument("--export_csv", default=None, help="also write the detections to this CSV")
+    ap.add_argument("--queue_depth", type=int, default=8, help="frames buffered between decode/infer/write stages")
+    ap.add_argument("--batch", type=int, default=1, help="frames per detector call")
+    ap.add_argument("--throughput_log", default="det_track/outputs/throughput.jsonl",
+                    help="append achieved fps for this run (compare --batch sizes per machine)")
+    add_gate_args(ap)
+    ap.add_argument("--roi_mask", default=None,
+                    help="curb ROI mask PNG (segmentation/roi_mask.py): detect on its crop, drop boxes outside")
+    ap.add_argument("--variant", default=None,
+                    help=f"detect on a degraded copy, made in memory (registered: {sorted(TRANSFORMS)})")
+    add_backend_args(ap)
     args = ap.parse_args()
 
-    out_dir = Path(args.out_csv).parent
+    out_dir = Path(args.out).parent
     os.makedirs(out_dir, exist_ok=True)
 
-    model = YOLO(args.weights)
-
-    rows, seen = [], 0
-    # stream=True yields results per frame
-    for r in model.predict(source=args.source,
-                           stream=True,
-                           imgsz=args.imgsz,
-                           conf=args.conf,
-                           iou=args.iou,
-                           classes=args.classes,
-                           save=False,
-                           vid_stride=1):
-        seen += 1
-        if seen > args.max_frames:
-            break
+    model = model_from_args(args, args.imgsz)
+    roi = load_roi(args.roi_mask) if args.roi_mask else None
 
+    def unpack(r):
         boxes = getattr(r, "boxes", None)
         if boxes is None or boxes.xyxy is None:
-            continue
-
+            return None
         xyxy = boxes.xyxy.cpu().numpy()
         clss = boxes.cls.cpu().numpy() if boxes.cls is not None else []
         conf = boxes.conf.cpu().numpy() if boxes.conf is not None else []
+        if roi is not None and len(xyxy):
+            xyxy, keep = roi.keep(xyxy)  # back to full-frame coords, inside the mask only
+            xyxy, clss, conf = xyxy[keep], clss[keep], conf[keep]
+        return xyxy, clss, conf
+
+    def detect(frames):
+        # one detector call per batch; Results come back in input order
+        results = model.predict(frames, imgsz=args.imgsz, conf=args.conf, iou=args.iou,
+                                classes=args.classes, save=False, verbose=False)
+        return [unpack(r) for r in results]
 
-        for (x1, y1, x2, y2), c, p in zip(xyxy, clss, conf):
+    gate = gate_from_args(args)
+    last = [None]  # detections of the most recent detector frame
+    def infer(idxs, frames):
+        if gate is None:
+            return detect(frames)
+        # gate frames in order; only the ones with motion go to the detector
+        run = [gate(f) for f in frames]
+        t = time.perf_counter()
+        dets = iter(detect([f for f, r in zip(frames, run) if r]) if any(run) else [])
+        gate.infer_seconds += time.perf_counter() - t
+        out = []
+        for r in run:
+            if r:
+                last[0] = next(dets)
+            out.append((last[0], int(r)))
+        return out
+
+    rows = []
+    def write(idx, frame, res):
+        extra = {}
+        if gate is not None:
+            res, inferred = res
+            extra = {"inferred": inferred}  # 0 = boxes carried over from the last detector frame
+        if res is None:
+            return
+        for (x1, y1, x2, y2), c, p in zip(*res):
             rows.append({
-                "frame": seen,
+                "frame": idx + 1,   # 1-based frame numbers
                 "xmin": float(x1), "ymin": float(y1),
                 "xmax": float(x2), "ymax": float(y2),
-                "conf": float(p), "cls": int(c)
+                "conf": float(p), "cls": int(c), **extra
             })
 
+    # decode, inference and row building overlap on separate threads
+    frames = read_frames(args.source, limit=args.max_frames)
+    if args.variant:
+        degrade = get_transforms([args.variant])[0][1]
+        frames = ((i, degrade(f)) for i, f in frames)  # on the decode thread, nothing re-encoded
+    if roi is not None:
+        frames = ((i, roi.crop(f)) for i, f in frames)  # crop on the decode thread
+    stats = run_pipeline(frames, infer, write,
+                         depth=args.queue_depth, batch=max(1, args.batch))
+    seen = stats["frames"]
+    print(f"Processed {seen} frames at {stats['fps']:.1f} fps, batch {stats['batch']} "
+          f"(busy s: {stats['busy_seconds']})")
+    if args.throughput_log:
+        log_throughput(args.throughput_log, stats, script="detect_to_csv", source=args.source,
+                       weights=args.weights, backend=args.backend, imgsz=args.imgsz)
+    if roi is not None and roi.shape:
+        print(f"ROI crop: detector saw {100 * roi.pixel_fraction():.1f}% of each frame's pixels")
+    if gate is not None:
+        rep_path = str(args.out) + ".gate.json"
+        rep = gate.write_report(rep_path)
+        print(f"Motion gate: detector ran on {rep['inferred']}/{rep['frames']} frames "
+              f"({100 * rep['skipped_fraction']:.1f}% skipped) -> {rep_path}")
+
     if rows:
-        with open(args.out_csv, "w", newline="", encoding="utf-8") as f:
-            fieldnames = ["frame", "xmin", "ymin", "xmax", "ymax", "conf", "cls"]
-            w = csv.DictWriter(f, fieldnames=fieldnames)
-            w.writeheader()
-            w.writerows(rows)
-        print("Wrote:", args.out_csv, f"({len(rows)} detections over {min(seen, args.max_frames)} frames)")
+        fieldnames = ["frame", "xmin", "ymin", "xmax", "ymax", "conf", "cls"] + (["inferred"] if gate is not None else [])
+        for path in [args.out, args.export_csv]:
+            if not path:
+                continue
+            if is_csv(path):
+                with open(path, "w", newline="", encoding="utf-8") as f:
+                    w = csv.DictWriter(f, fieldnames=fieldnames)
+                    w.writeheader()
+                    w.writerows(rows)
+            else:
+                write_store(path, {c: [r[c] for r in rows] for c in fieldnames})
+            print("Wrote:", path, f"({len(rows)} detections over {min(seen, args.max_frames)} frames)")
     else:
         print("No detections saved. Check --conf/--classes or your video path.")
 
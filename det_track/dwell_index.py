@@ -0,0 +1,414 @@
+# det_track/dwell_index.py
+# Parked dwell sessions as intervals, plus an index that answers curb
+# occupancy questions without rescanning the per-frame tracks.
+# Usage (from project root):
+#   python det_track/summarize_tracks.py                # also writes dwell_intervals.csv + dwell.idx
+#   python det_track/dwell_index.py build --intervals rec1/dwell_intervals.csv --start_time 2025-10-21T14:00:00
+#   python det_track/dwell_index.py build --intervals rec2/dwell_intervals.csv --start_time 2025-10-22T09:00:00 --append
+#   python det_track/dwell_index.py at 14:05 --segment S3        # parked right then (+ --list for the sessions)
+#   python det_track/dwell_index.py range 14:00 15:00            # sessions, vehicle-seconds, mean occupancy
+#   python det_track/dwell_index.py turnover 14:00 18:00 --step 900
+#   python det_track/dwell_index.py hist --edges 0 60 300 900 3600
+#   python det_track/dwell_index.py bench --intervals 2000000    # synthetic months, query latency
+#
+# A session is a run of one ID's is_parked rows in one segment, at most
+# --max_gap frames apart; it covers [start, end) with end = last frame + 1.
+# Times are seconds from the index origin (the first --start_time, or the
+# video start). Time arguments take seconds, an ISO datetime, or HH:MM[:SS]
+# on the origin's day.
+#
+# Index layout (dwell.idx/, one .npy per column, memory-mapped on read):
+#   sessions sorted by (segment, start); seg_offsets.npy = each segment's
+#   [lo, hi) block; end_sorted.npy = the block's ends sorted; start_cum.npy /
+#   end_cum.npy = prefix sums of both. Then, per segment,
+#     parked at t        = #(start <= t) - #(end <= t)           two binary searches
+#     vehicle-seconds    = integral of that over [t0, t1]         four searches + prefix sums
+#     arrivals in range  = #(t0 <= start < t1)
+# so a query costs O(segments * log n) whatever the length of the record.
+
+import argparse, json, shutil, time
+from datetime import datetime, timedelta
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+INTERVAL_COLS = ["id", "segment", "start_frame", "end_frame", "start_sec", "end_sec", "dwell_sec", "n_rows", "cx", "cy"]
+
+# ---------------------------------------------------------------- building
+
+def dwell_intervals(ids, frames, parked, seg, fps, cx, cy, labels, max_gap=30):
+    """Parked sessions from rows sorted by (id, frame).
+
+    `seg` is the segment code per row (-1 outside every segment). The
+    columns head / tail mark sessions that start at their ID's first row
+    or end at its last row, which DwellChunks uses to join sessions that
+    straddle a chunk boundary.
+    """
+    ids = np.asarray(ids); frames = np.asarray(frames, dtype=np.int64); seg = np.asarray(seg)
+    ok = (np.asarray(parked) == 1) & (seg >= 0)
+    n = len(ids)
+    same_id = np.zeros(n, dtype=bool)
+    same_id[1:] = ids[1:] == ids[:-1]
+    joined = np.zeros(n, dtype=bool)  # row i continues the session of row i-1
+    joined[1:] = ok[1:] & ok[:-1] & same_id[1:] & (seg[1:] == seg[:-1]) & (frames[1:] - frames[:-1] <= max_gap)
+    s = np.flatnonzero(ok & ~joined)
+    e = np.flatnonzero(ok & ~np.r_[joined[1:], False])
+    n_rows = e - s + 1
+    cxs = np.r_[0.0, np.cumsum(cx, dtype=np.float64)]
+    cys = np.r_[0.0, np.cumsum(cy, dtype=np.float64)]
+    start_frame, end_frame = frames[s], frames[e]
+    return pd.DataFrame({
+        "id": ids[s], "segment": np.asarray(labels, dtype=object)[seg[s]],
+        "start_frame": start_frame, "end_frame": end_frame,
+        "start_sec": (start_frame - 1) / fps, "end_sec": end_frame / fps,
+        "dwell_sec": (end_frame - start_frame + 1) / fps,
+        "n_rows": n_rows, "cx": (cxs[e + 1] - cxs[s]) / n_rows, "cy": (cys[e + 1] - cys[s]) / n_rows,
+        "head": ~same_id[s], "tail": ~np.r_[same_id[1:], False][e],
+    })
+
+class DwellChunks:
+    """dwell_intervals() over frame-ordered chunks.
+
+    A chunk never splits a frame, so a session cut by a chunk boundary ends
+    at its ID's last row of one chunk and resumes at the ID's first row of a
+    later one; those pieces are joined in result().
+    """
+    def __init__(self, fps, max_gap=30):
+        self.fps, self.max_gap = fps, max_gap
+        self.parts = []
+
+    def add(self, part):
+        self.parts.append(part)
+
+    def result(self):
+        if not self.parts:
+            return pd.DataFrame(columns=INTERVAL_COLS)
+        df = pd.concat(self.parts, ignore_index=True).sort_values(["id", "start_frame"], kind="stable")
+        prev = df.shift(1)
+        joined = (df["head"] & prev["tail"].fillna(False).astype(bool) & (df["id"] == prev["id"])
+                  & (df["segment"] == prev["segment"])
+                  & (df["start_frame"] - prev["end_frame"] <= self.max_gap)).to_numpy()
+        df["group"] = np.cumsum(~joined)
+        df["cx_sum"] = df["cx"] * df["n_rows"]
+        df["cy_sum"] = df["cy"] * df["n_rows"]
+        out = df.groupby("group", sort=False).agg(
+            id=("id", "first"), segment=("segment", "first"), start_frame=("start_frame", "first"),
+            end_frame=("end_frame", "last"), n_rows=("n_rows", "sum"),
+            cx_sum=("cx_sum", "sum"), cy_sum=("cy_sum", "sum")).reset_index(drop=True)
+        out["start_sec"] = (out["start_frame"] - 1) / self.fps
+        out["end_sec"] = out["end_frame"] / self.fps
+        out["dwell_sec"] = (out["end_frame"] - out["start_frame"] + 1) / self.fps
+        out["cx"] = out["cx_sum"] / out["n_rows"]
+        out["cy"] = out["cy_sum"] / out["n_rows"]
+        return out[INTERVAL_COLS]
+
+def finish_intervals(df):
+    """Drop the chunk-join flags and order sessions by (start, segment, id)."""
+    return (df[INTERVAL_COLS].sort_values(["start_sec", "segment", "id"], kind="stable")
+            .reset_index(drop=True))
+
+def write_index(path, sessions, labels, meta_extra=None):
+    """Write a dwell index. `sessions` has INTERVAL_COLS with start/end in
+    seconds from the origin, plus a `rec` column (recording number)."""
+    path = Path(path)
+    code = {l: i for i, l in enumerate(labels)}
+    seg = sessions["segment"].map(code).to_numpy(np.int16)
+    start = sessions["start_sec"].to_numpy(np.float64)
+    end = sessions["end_sec"].to_numpy(np.float64)
+    order = np.lexsort((start, seg))
+    seg, start, end = seg[order], start[order], end[order]
+    offsets = np.searchsorted(seg, np.arange(len(labels) + 1), "left").astype(np.int64)
+    end_sorted = end.copy()
+    for lo, hi in zip(offsets[:-1], offsets[1:]):
+        end_sorted[lo:hi].sort()
+    max_dwell = [float((end[lo:hi] - start[lo:hi]).max()) if hi > lo else 0.0
+                 for lo, hi in zip(offsets[:-1], offsets[1:])]
+
+    tmp = path.with_name(path.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    cols = {"segment": seg, "start": start, "end": end, "end_sorted": end_sorted,
+            "start_cum": np.r_[0.0, np.cumsum(start)], "end_cum": np.r_[0.0, np.cumsum(end_sorted)],
+            "seg_offsets": offsets,
+            "id": sessions["id"].to_numpy(np.int64)[order],
+            "rec": sessions["rec"].to_numpy(np.int32)[order],
+            "start_frame": sessions["start_frame"].to_numpy(np.int64)[order],
+            "end_frame": sessions["end_frame"].to_numpy(np.int64)[order],
+            "n_rows": sessions["n_rows"].to_numpy(np.int64)[order],
+            "cx": sessions["cx"].to_numpy(np.float32)[order],
+            "cy": sessions["cy"].to_numpy(np.float32)[order]}
+    for c, v in cols.items():
+        np.save(tmp / f"{c}.npy", v)
+    meta = {"n_sessions": int(len(start)), "segments": list(labels), "max_dwell_sec": max_dwell}
+    meta.update(meta_extra or {})
+    (tmp / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    shutil.rmtree(path, ignore_errors=True)
+    tmp.rename(path)
+    return path
+
+def index_from_intervals(path, intervals, labels, fps, source="", start_time=None, append=False):
+    """Build (or extend, with append=True) a dwell index from one recording's
+    sessions. start_time (ISO) places the recording on a shared timeline."""
+    sessions = intervals.copy()
+    recordings, origin, old = [], None, None
+    if append and Path(path, "meta.json").exists():
+        idx = DwellIndex(path)
+        old, recordings, origin = idx.sessions(), idx.meta["recordings"], idx.meta.get("origin")
+        labels = list(dict.fromkeys(idx.labels + list(labels)))
+        if (origin is None) != (start_time is None):
+            raise SystemExit("--start_time must be given for every recording of an index, or for none")
+    shift = 0.0
+    if start_time is not None:
+        t = datetime.fromisoformat(start_time)
+        origin = origin or t.isoformat()
+        shift = (t - datetime.fromisoformat(origin)).total_seconds()
+    sessions["start_sec"] += shift
+    sessions["end_sec"] += shift
+    sessions["rec"] = len(recordings)
+    recordings.append({"source": str(source), "start_time": start_time, "fps": fps, "sessions": int(len(sessions))})
+    if old is not None:
+        sessions = pd.concat([old, sessions], ignore_index=True)
+    return write_index(path, sessions, labels, {"origin": origin, "recordings": recordings})
+
+# ---------------------------------------------------------------- querying
+
+class DwellIndex:
+    """Read-only view of a dwell index (arrays memory-mapped)."""
+    def __init__(self, path):
+        self.path = Path(path)
+        if not (self.path / "meta.json").exists():
+            raise SystemExit(f"No dwell index at {self.path} — run summarize_tracks.py first.")
+        self.meta = json.loads((self.path / "meta.json").read_text(encoding="utf-8"))
+        self.labels = self.meta["segments"]
+        empty = self.meta["n_sessions"] == 0  # empty files cannot be memory-mapped
+        self.a = {p.stem: np.load(p, mmap_mode=None if empty else "r") for p in self.path.glob("*.npy")}
+        self.offsets = np.asarray(self.a["seg_offsets"])
+
+    def _blocks(self, segment=None):
+        if segment is None:
+            segs = range(len(self.labels))
+        else:
+            if segment not in self.labels:
+                raise SystemExit(f"Unknown segment {segment!r}; index has {self.labels}")
+            segs = [self.labels.index(segment)]
+        return [(int(self.offsets[s]), int(self.offsets[s + 1])) for s in segs]
+
+    def _count(self, key, lo, hi, t, side="right"):
+        return int(np.searchsorted(self.a[key][lo:hi], t, side))
+
+    def _area(self, key, cum, lo, hi, t0, t1):
+        # integral over [t0, t1] of #(x <= t) = sum over x <= t1 of (t1 - max(x, t0))
+        a, b = self._count(key, lo, hi, t0), self._count(key, lo, hi, t1)
+        c = self.a[cum]
+        return a * (t1 - t0) + (b - a) * t1 - (c[lo + b] - c[lo + a])
+
+    def parked_at(self, t, segment=None):
+        """Vehicles parked at time t."""
+        return sum(self._count("start", lo, hi, t) - self._count("end_sorted", lo, hi, t)
+                   for lo, hi in self._blocks(segment))
+
+    def sessions_at(self, t, segment=None):
+        """The sessions active at time t (start <= t < end)."""
+        rows = []
+        for s, (lo, hi) in zip([segment] if segment else self.labels, self._blocks(segment)):
+            # only sessions that started within the segment's longest dwell can still be active
+            i0 = lo + self._count("start", lo, hi, t - self.meta["max_dwell_sec"][self.labels.index(s)], "left")
+            i1 = lo + self._count("start", lo, hi, t)
+            live = np.flatnonzero(np.asarray(self.a["end"][i0:i1]) > t) + i0
+            rows.append(live)
+        return self._frame(np.concatenate(rows) if rows else np.arange(0))
+
+    def occupancy(self, t0, t1, segment=None):
+        """Sessions overlapping [t0, t1), vehicle-seconds parked and mean occupancy."""
+        sessions = vsec = 0
+        for lo, hi in self._blocks(segment):
+            sessions += self._count("start", lo, hi, t1, "left") - self._count("end_sorted", lo, hi, t0)
+            vsec += (self._area("start", "start_cum", lo, hi, t0, t1)
+                     - self._area("end_sorted", "end_cum", lo, hi, t0, t1))
+        return {"sessions": sessions, "vehicle_sec": float(vsec),
+                "mean_occupancy": float(vsec / (t1 - t0)) if t1 > t0 else 0.0}
+
+    def turnover(self, t0, t1, segment=None):
+        """Arrivals (sessions starting) and departures (sessions ending) in [t0, t1)."""
+        arr = dep = 0
+        for lo, hi in self._blocks(segment):
+            arr += self._count("start", lo, hi, t1, "left") - self._count("start", lo, hi, t0, "left")
+            dep += self._count("end_sorted", lo, hi, t1, "left") - self._count("end_sorted", lo, hi, t0, "left")
+        hours = (t1 - t0) / 3600.0
+        return {"arrivals": arr, "departures": dep, "arrivals_per_hour": arr / hours if hours > 0 else 0.0}
+
+    def dwell_hist(self, edges, t0=-np.inf, t1=np.inf, segment=None):
+        """Histogram of dwell seconds for sessions starting in [t0, t1)."""
+        counts = np.zeros(len(edges) - 1, dtype=np.int64)
+        for lo, hi in self._blocks(segment):
+            i0 = lo + self._count("start", lo, hi, t0, "left")
+            i1 = lo + self._count("start", lo, hi, t1, "left")
+            counts += np.histogram(np.asarray(self.a["end"][i0:i1]) - np.asarray(self.a["start"][i0:i1]), edges)[0]
+        return counts
+
+    def dwell_stats(self, t0=-np.inf, t1=np.inf):
+        """Per segment: sessions starting in [t0, t1), mean and median dwell."""
+        rows = []
+        for s, (lo, hi) in zip(self.labels, self._blocks()):
+            i0 = lo + self._count("start", lo, hi, t0, "left")
+            i1 = lo + self._count("start", lo, hi, t1, "left")
+            d = np.asarray(self.a["end"][i0:i1]) - np.asarray(self.a["start"][i0:i1])
+            rows.append({"segment": s, "sessions": len(d),
+                         "mean_dwell_sec": float(d.mean()) if len(d) else 0.0,
+                         "median_dwell_sec": float(np.median(d)) if len(d) else 0.0})
+        return pd.DataFrame(rows)
+
+    def _frame(self, rows):
+        df = pd.DataFrame({c: np.asarray(self.a[c][rows]) for c in
+                           ["rec", "id", "start", "end", "start_frame", "end_frame", "n_rows", "cx", "cy"]})
+        df.insert(2, "segment", np.asarray(self.labels, dtype=object)[np.asarray(self.a["segment"][rows])])
+        return df
+
+    def sessions(self):
+        """All sessions in the interval-table layout (used to extend an index)."""
+        df = self._frame(np.arange(self.meta["n_sessions"])).rename(columns={"start": "start_sec", "end": "end_sec"})
+        df["dwell_sec"] = df["end_sec"] - df["start_sec"]
+        return df[INTERVAL_COLS + ["rec"]]
+
+    def parse_time(self, s):
+        """Seconds, ISO datetime, or HH:MM[:SS] on the origin's day -> index seconds."""
+        try:
+            return float(s)
+        except ValueError:
+            pass
+        origin = self.meta.get("origin")
+        if origin is None:
+            raise SystemExit(f"Index has no --start_time; give {s!r} as seconds from the video start")
+        origin = datetime.fromisoformat(origin)
+        if ":" in s and "-" not in s and "T" not in s:
+            h, m, *sec = (int(x) for x in s.split(":"))
+            t = datetime.combine(origin.date(), datetime.min.time()) + timedelta(hours=h, minutes=m,
+                                                                                 seconds=sec[0] if sec else 0)
+        else:
+            t = datetime.fromisoformat(s)
+        return (t - origin).total_seconds()
+
+    def fmt_time(self, t):
+        origin = self.meta.get("origin")
+        if origin is None:
+            return f"{t:.1f}s"
+        return (datetime.fromisoformat(origin) + timedelta(seconds=float(t))).isoformat(sep=" ", timespec="seconds")
+
+# ---------------------------------------------------------------- CLI
+
+def synthetic_sessions(n, labels, days=90, seed=0):
+    rng = np.random.default_rng(seed)
+    start = np.sort(rng.uniform(0, days * 86400.0, n))
+    dwell = rng.lognormal(np.log(600), 1.0, n)
+    return pd.DataFrame({"id": np.arange(n), "segment": rng.choice(labels, n), "start_frame": 0, "end_frame": 0,
+                         "start_sec": start, "end_sec": start + dwell, "dwell_sec": dwell,
+                         "n_rows": 1, "cx": 0.0, "cy": 0.0, "rec": 0})
+
+def bench(args):
+    labels = [f"S{i+1}" for i in range(args.bins)]
+    path = Path(args.index)
+    t = time.perf_counter()
+    write_index(path, synthetic_sessions(args.intervals, labels, args.days), labels,
+                {"origin": None, "recordings": [{"source": "synthetic", "start_time": None, "fps": 0, "sessions": args.intervals}]})
+    print(f"built {args.intervals:,} sessions over {args.days} days in {time.perf_counter() - t:.2f} s")
+    idx = DwellIndex(path)
+    rng = np.random.default_rng(1)
+    ts = rng.uniform(0, args.days * 86400.0, args.queries)
+    queries = [("parked_at (all)", lambda t: idx.parked_at(t)),
+               ("parked_at (S1)", lambda t: idx.parked_at(t, "S1")),
+               ("sessions_at (S1)", lambda t: idx.sessions_at(t, "S1")),
+               ("occupancy 1h (all)", lambda t: idx.occupancy(t, t + 3600)),
+               ("turnover 1h (all)", lambda t: idx.turnover(t, t + 3600)),
+               ("dwell_hist 1h (all)", lambda t: idx.dwell_hist(np.array([0, 60, 300, 900, 3600, np.inf]), t, t + 3600))]
+    print("\n| query | µs / query |")
+    print("|-------|------------|")
+    for name, fn in queries:
+        t = time.perf_counter()
+        for q in ts:
+            fn(q)
+        print(f"| {name} | {(time.perf_counter() - t) / len(ts) * 1e6:.1f} |")
+
+def main():
+    ap = argparse.ArgumentParser(description="Dwell-session index: curb occupancy, turnover and dwell queries")
+    ap.add_argument("--index", default="det_track/outputs/dwell.idx")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="index a dwell_intervals.csv from summarize_tracks.py")
+    b.add_argument("--intervals", default="det_track/outputs/dwell_intervals.csv")
+    b.add_argument("--start_time", default=None, help="wall-clock ISO time of the recording's first frame")
+    b.add_argument("--fps", type=float, default=0.0, help="recorded in the index metadata only")
+    b.add_argument("--append", action="store_true", help="add to an existing index (a new recording)")
+    p = sub.add_parser("at", help="vehicles parked at one time")
+    p.add_argument("t")
+    p.add_argument("--list", action="store_true", help="print the active sessions")
+    for name, hlp in [("range", "sessions, vehicle-seconds and mean occupancy in [t0, t1)"),
+                      ("turnover", "arrivals / departures in [t0, t1)")]:
+        r = sub.add_parser(name, help=hlp)
+        r.add_argument("t0")
+        r.add_argument("t1")
+        r.add_argument("--step", type=float, default=None, help="split the range into steps of this many seconds")
+    h = sub.add_parser("hist", help="dwell histogram and per-segment dwell stats")
+    h.add_argument("--edges", type=float, nargs="+", default=[0, 60, 300, 900, 1800, 3600, np.inf])
+    h.add_argument("--t0", default=None)
+    h.add_argument("--t1", default=None)
+    for q in [p, h] + [sub.choices["range"], sub.choices["turnover"]]:
+        q.add_argument("--segment", default=None, help="e.g. S3 (default: all segments)")
+    bb = sub.add_parser("bench", help="query latency on a synthetic index")
+    bb.add_argument("--intervals", type=int, default=2_000_000)
+    bb.add_argument("--days", type=int, default=90)
+    bb.add_argument("--bins", type=int, default=4)
+    bb.add_argument("--queries", type=int, default=10_000)
+    args = ap.parse_args()
+
+    if args.cmd == "build":
+        df = pd.read_csv(args.intervals)
+        df["segment"] = df["segment"].astype(str)  # zone ids may be read back as numbers
+        labels = sorted(df["segment"].unique(), key=lambda s: (len(s), s))
+        index_from_intervals(args.index, df, labels, args.fps, args.intervals, args.start_time, args.append)
+        print("Wrote:", args.index)
+        return
+    if args.cmd == "bench":
+        if args.index == ap.get_default("index"):
+            args.index = "det_track/outputs/dwell_bench.idx"
+        bench(args)
+        return
+
+    idx = DwellIndex(args.index)
+    seg = args.segment or "all"
+    if args.cmd == "at":
+        t = idx.parse_time(args.t)
+        print(f"{idx.parked_at(t, args.segment)} parked in {seg} at {idx.fmt_time(t)}")
+        if args.list:
+            print(idx.sessions_at(t, args.segment).to_string(index=False))
+    elif args.cmd in ("range", "turnover"):
+        t0, t1 = idx.parse_time(args.t0), idx.parse_time(args.t1)
+        steps = np.arange(t0, t1, args.step).tolist() + [t1] if args.step else [t0, t1]
+        if args.cmd == "range":
+            print(f"\n| from | to | sessions | vehicle-min | mean parked ({seg}) |")
+            print("|------|----|----------|-------------|-------------|")
+        else:
+            print(f"\n| from | to | arrivals | departures | arrivals / h ({seg}) |")
+            print("|------|----|----------|------------|--------------|")
+        for a, z in zip(steps[:-1], steps[1:]):
+            if args.cmd == "range":
+                r = idx.occupancy(a, z, args.segment)
+                print(f"| {idx.fmt_time(a)} | {idx.fmt_time(z)} | {r['sessions']} | "
+                      f"{r['vehicle_sec'] / 60:.1f} | {r['mean_occupancy']:.2f} |")
+            else:
+                r = idx.turnover(a, z, args.segment)
+                print(f"| {idx.fmt_time(a)} | {idx.fmt_time(z)} | {r['arrivals']} | {r['departures']} | "
+                      f"{r['arrivals_per_hour']:.1f} |")
+    elif args.cmd == "hist":
+        t0 = idx.parse_time(args.t0) if args.t0 else -np.inf
+        t1 = idx.parse_time(args.t1) if args.t1 else np.inf
+        counts = idx.dwell_hist(np.asarray(args.edges), t0, t1, args.segment)
+        print(f"\n| dwell (s) | sessions ({seg}) |")
+        print("|-----------|----------|")
+        for lo, hi, c in zip(args.edges[:-1], args.edges[1:], counts):
+            print(f"| {lo:g}-{hi:g} | {c} |")
+        print("\n| segment | sessions | mean dwell s | median dwell s |")
+        print("|---------|----------|--------------|----------------|")
+        for r in idx.dwell_stats(t0, t1).itertuples():
+            print(f"| {r.segment} | {r.sessions} | {r.mean_dwell_sec:.1f} | {r.median_dwell_sec:.1f} |")
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,10 @@
 # det_track/eval_det.py
 import pandas as pd, numpy as np, argparse, json, os
+from pathlib import Path
+from track_store import read_tracks
+from boxes import iou_pairs, greedy_match
+
+BOX = ["xmin", "ymin", "xmax", "ymax"]
 
 def iou_xyxy(a, b):
     # a,b = [xmin,ymin,xmax,ymax]
@@ -10,49 +15,175 @@ def iou_xyxy(a, b):
     ua = (a[2]-a[0])*(a[3]-a[1]) + (b[2]-b[0])*(b[3]-b[1]) - inter
     return 0.0 if ua <= 0 else inter/ua
 
+def by_frame(df, cols):
+    """One stable sort by frame: (sorted frames, {col: sorted values})."""
+    order = np.argsort(df["frame"].to_numpy(), kind="stable")
+    return df["frame"].to_numpy()[order], {c: df[c].to_numpy()[order] for c in cols}
+
+def conf_order(conf):
+    """Descending order exactly as DataFrame.sort_values("conf", ascending=False)."""
+    n = len(conf)
+    return np.arange(n)[::-1][conf[::-1].argsort(kind="quicksort")][::-1]
+
+def frame_matrices(pred, gt):
+    """Per labelled frame, the IoU matrix of its predictions (rows, in
+    confidence order) against its GT boxes. Returns (frames, conf, matrices,
+    number of GT boxes); frames / conf are per prediction, in matching order."""
+    pf, pc = by_frame(pred, BOX + ["conf"])
+    gf, gc = by_frame(gt, BOX)
+    frames = np.unique(gf)
+    p_lo, p_hi = np.searchsorted(pf, frames, "left"), np.searchsorted(pf, frames, "right")
+    g_lo, g_hi = np.searchsorted(gf, frames, "left"), np.searchsorted(gf, frames, "right")
+    pbox = np.stack([pc[c] for c in BOX], axis=1)
+    gbox = np.stack([gc[c] for c in BOX], axis=1)
+    keep = p_hi > p_lo
+    p_lo, p_hi, g_lo, g_hi = p_lo[keep], p_hi[keep], g_lo[keep], g_hi[keep]
+    # confidence order inside each frame, then every (prediction, GT) pair of a
+    # frame in one flat IoU pass; frame k's matrix is a contiguous slice
+    rows = np.concatenate([a + conf_order(pc["conf"][a:b]) for a, b in zip(p_lo, p_hi)]) \
+        if len(p_lo) else np.arange(0)
+    n_p, n_g = p_hi - p_lo, g_hi - g_lo
+    per_pred = np.repeat(n_g, n_p)
+    pair_pred = np.repeat(rows, per_pred)
+    first_gt = np.repeat(np.repeat(g_lo, n_p), per_pred)
+    pair_gt = first_gt + np.arange(len(pair_pred)) - np.repeat(np.cumsum(per_pred) - per_pred, per_pred)
+    flat = iou_pairs(pbox[pair_pred], gbox[pair_gt])
+    off = np.r_[0, np.cumsum(n_p * n_g)]
+    mats = [flat[off[k]:off[k + 1]].reshape(n_p[k], n_g[k]) for k in range(len(n_p))]
+    return pf[rows], pc["conf"][rows], mats, len(gf)
+
+def match_frames(pred, gt, iou_thr=0.5):
+    """Greedy per-frame matching of predictions (by confidence) to GT boxes,
+    on the frames that have GT. Returns per-prediction arrays in matching
+    order (frame, conf, tp, iou) and the number of GT boxes."""
+    frames, conf, mats, n_gt = frame_matrices(pred, gt)
+    res = [greedy_match(m, iou_thr, by_row=True) for m in mats]
+    return {"frame": frames, "conf": conf,
+            "tp": np.concatenate([m >= 0 for m, _ in res]) if res else np.zeros(0, dtype=bool),
+            "iou": np.concatenate([b for _, b in res]) if res else np.zeros(0)}, n_gt
+
+def match_detections(pred, gt, iou_thr=0.5):
+    """Returns (tp, fp, fn, IoUs of the true positives)."""
+    m, n_gt = match_frames(pred, gt, iou_thr)
+    tp = int(m["tp"].sum())
+    return tp, int(len(m["tp"]) - tp), n_gt - tp, m["iou"][m["tp"]].tolist()
+
+def pr_curve(conf, tp, n_gt):
+    """Precision / recall / F1 at every confidence threshold, from one sort.
+
+    Greedy matching takes each frame's predictions in confidence order, so
+    matching a low-conf dump once gives the matches of every higher --conf:
+    keeping conf >= t just drops a suffix. One row per distinct conf value.
+    """
+    o = np.argsort(-conf, kind="stable")
+    c, t = conf[o], tp[o]
+    ctp, cfp = np.cumsum(t), np.cumsum(~t)
+    last = np.flatnonzero(np.r_[c[1:] != c[:-1], True]) if len(c) else np.arange(0)
+    prec = ctp[last] / np.maximum(ctp[last] + cfp[last], 1)
+    rec = ctp[last] / n_gt if n_gt else np.zeros(len(last))
+    with np.errstate(invalid="ignore"):
+        f1 = np.nan_to_num(2 * prec * rec / (prec + rec))
+    return pd.DataFrame({"conf": c[last], "precision": prec, "recall": rec, "f1": f1,
+                         "tp": ctp[last], "fp": cfp[last]})
+
+def average_precision(curve):
+    """All-point interpolated AP (area under the monotone precision envelope)."""
+    mrec = np.r_[0.0, curve["recall"].to_numpy(), 1.0]
+    mpre = np.r_[0.0, curve["precision"].to_numpy(), 0.0]
+    mpre = np.maximum.accumulate(mpre[::-1])[::-1]
+    i = np.flatnonzero(mrec[1:] != mrec[:-1])
+    return float(((mrec[i + 1] - mrec[i]) * mpre[i + 1]).sum())
+
+def sweep(preds, gt, iou_thrs):
+    """PR curves, AP per IoU threshold and the best-F1 conf for every
+    (variant, class); class "all" matches class-agnostically, as
+    match_detections does. Returns (summary rows, curve rows)."""
+    summary, curves = [], []
+    for variant, pred in preds.items():
+        groups = [("all", pred, gt)] + [(int(k), pred[pred["cls"] == k], gt[gt["cls"] == k])
+                                        for k in sorted(gt["cls"].unique())]
+        for cls, p, g in groups:
+            _, conf, mats, n_gt = frame_matrices(p, g)  # IoUs once, then one greedy pass per threshold
+            row = {"variant": variant, "cls": cls, "gt": n_gt}
+            for k, thr in enumerate(iou_thrs):
+                tp = (np.concatenate([greedy_match(m, thr, by_row=True)[0] >= 0 for m in mats]) if mats
+                      else np.zeros(0, dtype=bool))
+                curve = pr_curve(conf, tp, n_gt)
+                row[f"ap{thr:g}"] = average_precision(curve)
+                if k == 0 and len(curve):  # best F1 at the primary IoU
+                    b = curve.iloc[int(curve["f1"].to_numpy().argmax())]
+                    row.update(best_conf=float(b["conf"]), best_f1=float(b["f1"]),
+                               precision=float(b["precision"]), recall=float(b["recall"]))
+                curves.append(curve.assign(variant=variant, cls=cls, iou_thr=thr))
+            summary.append(row)
+    return summary, curves
+
+def main_sweep(args):
+    """--sweep: one low-conf dump per variant instead of a detector run per --conf."""
+    gt = read_tracks(args.gt_csv, ["frame", "xmin", "ymin", "xmax", "ymax", "cls"])
+    if gt.empty:
+        raise SystemExit("Empty ground truth. Run label_click.py first.")
+    scales = args.pred_scale or [1.0] * len(args.pred_csv)
+    if len(scales) != len(args.pred_csv):
+        raise SystemExit("Give one --pred_scale per --pred")
+    preds = {}
+    for spec, scale in zip(args.pred_csv, scales):
+        name, _, path = spec.rpartition("=")
+        pred = read_tracks(path, ["frame", "xmin", "ymin", "xmax", "ymax", "conf", "cls"])
+        pred[BOX] = pred[BOX].astype("float64") * scale  # variant pixels -> GT pixels
+        preds[name or Path(path).stem] = pred
+
+    summary, curves = sweep(preds, gt, args.iou_thrs)
+    aps = [f"ap{t:g}" for t in args.iou_thrs]
+    print(f"\n| variant | class | GT | {' | '.join(f'AP@{t:g}' for t in args.iou_thrs)} | "
+          f"best F1 | conf @ best F1 | P | R |")
+    print("|" + "---|" * (8 + len(aps) - 1))
+    for r in summary:
+        print(f"| {r['variant']} | {r['cls']} | {r['gt']} | " + " | ".join(f"{r[a]:.3f}" for a in aps) +
+              f" | {r.get('best_f1', 0.0):.3f} | {r.get('best_conf', float('nan')):.3f} | "
+              f"{r.get('precision', 0.0):.3f} | {r.get('recall', 0.0):.3f} |")
+    os.makedirs(os.path.dirname(args.out_json), exist_ok=True)
+    curve_path = os.path.splitext(args.out_json)[0] + "_pr.csv"
+    cols = ["variant", "cls", "iou_thr", "conf", "precision", "recall", "f1", "tp", "fp"]
+    pd.concat(curves, ignore_index=True)[cols].to_csv(curve_path, index=False)
+    with open(args.out_json, "w", encoding="utf-8") as f:
+        json.dump({"iou_thrs": args.iou_thrs, "gt_path": args.gt_csv, "pred_paths": args.pred_csv,
+                   "results": summary}, f, indent=2)
+    print("Wrote:", args.out_json)
+    print("Wrote:", curve_path)
+
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--pred_csv", default="det_track/outputs/detect50.csv", help="from detect_to_csv.py")
-    ap.add_argument("--gt_csv",   default="det_track/outputs/labels.csv", help="from label_click.py")
+    ap.add_argument("--pred", "--pred_csv", dest="pred_csv", nargs="+", default=["det_track/outputs/detect50.trk"],
+                    help="from detect_to_csv.py (track store or CSV); with --sweep several, as [variant=]path")
+    ap.add_argument("--gt", "--gt_csv", dest="gt_csv", default="det_track/outputs/labels.csv",
+                    help="from label_click.py (CSV or track store)")
     ap.add_argument("--iou_thr", type=float, default=0.5)
-    ap.add_argument("--out_json", default="det_track/outputs/metrics.json")
+    ap.add_argument("--out_json", default=None,
+                    help="default: det_track/outputs/metrics.json (sweep.json with --sweep)")
+    ap.add_argument("--sweep", action="store_true",
+                    help="PR curve / AP / best-F1 conf from one low-conf dump (detect_to_csv.py --conf 0.01)")
+    ap.add_argument("--iou_thrs", type=float, nargs="+", default=[0.5, 0.75],
+                    help="with --sweep: IoU thresholds for AP (best F1 uses the first)")
+    ap.add_argument("--pred_scale", type=float, nargs="*", default=None,
+                    help="with --sweep: per --pred factor to GT pixels (e.g. 1920/854 for a low-res variant)")
     args = ap.parse_args()
 
-    pred = pd.read_csv(args.pred_csv)  # frame,xmin,ymin,xmax,ymax,conf,cls
-    gt   = pd.read_csv(args.gt_csv)    # frame,xmin,ymin,xmax,ymax,cls
+    if args.sweep:
+        args.out_json = args.out_json or "det_track/outputs/sweep.json"
+        return main_sweep(args)
+    args.out_json = args.out_json or "det_track/outputs/metrics.json"
+    if len(args.pred_csv) > 1:
+        raise SystemExit("Several --pred need --sweep")
+    args.pred_csv = args.pred_csv[0]
+
+    pred = read_tracks(args.pred_csv, ["frame", "xmin", "ymin", "xmax", "ymax", "conf", "cls"])
+    gt   = read_tracks(args.gt_csv,   ["frame", "xmin", "ymin", "xmax", "ymax", "cls"])
 
     if pred.empty or gt.empty:
-        raise SystemExit("Empty CSV(s). Ensure you ran detect_to_csv.py and label_click.py.")
-
-    tp, fp, fn = 0, 0, 0
-    ious = []
-
-    for f in sorted(gt["frame"].unique()):
-        gt_f = gt[gt.frame == f].copy().reset_index(drop=True)
-        pr_f = pred[pred.frame == f].copy()
-        if pr_f.empty:
-            fn += len(gt_f); continue
-
-        pr_f = pr_f.sort_values("conf", ascending=False).reset_index(drop=True)
-        used = np.zeros(len(gt_f), dtype=bool)
-
-        for _, r in pr_f.iterrows():
-            pb = [r.xmin, r.ymin, r.xmax, r.ymax]
-            best_j, best_iou = -1, 0.0
-            for j, g in gt_f.iterrows():
-                if used[j]: continue
-                gb = [g.xmin, g.ymin, g.xmax, g.ymax]
-                iou = iou_xyxy(pb, gb)
-                if iou > best_iou:
-                    best_iou, best_j = iou, j
-            if best_j >= 0 and best_iou >= args.iou_thr:
-                tp += 1
-                used[best_j] = True
-                ious.append(best_iou)
-            else:
-                fp += 1
-
-        fn += int((~used).sum())
+        raise SystemExit("Empty input(s). Ensure you ran detect_to_csv.py and label_click.py.")
+
+    tp, fp, fn, ious = match_detections(pred, gt, args.iou_thr)
 
     precision = tp / (tp + fp) if (tp + fp) else 0.0
     recall    = tp / (tp + fn) if (tp + fn) else 0.0
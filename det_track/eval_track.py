@@ -0,0 +1,237 @@
+# det_track/eval_track.py
+# Tracking metrics for track.py output against a ground-truth track file:
+# CLEAR MOT (MOTA, MOTP, ID switches, Frag, MT/ML), identity (IDF1, IDP, IDR)
+# and HOTA (DetA, AssA, LocA), with the TrackEval definitions.
+# Usage (from project root):
+#   python det_track/eval_track.py --gt det_track/outputs/gt_tracks.csv --pred det_track/outputs/tracks.trk
+#   python det_track/eval_track.py --gt gt/gt.txt --pred bytetrack=out/bt.trk botsort=out/bs.trk
+#   python det_track/eval_track.py --gt det_track/outputs/gt_tracks.csv \
+#       --source det_track/sample_video.mp4 --trackers bytetrack.yaml botsort.yaml   # runs track.py per config
+#
+# GT: a track store / CSV with frame, id, xmin..ymax, or a MOTChallenge
+# gt.txt (frame, id, left, top, width, height, consider flag, ...; rows
+# flagged 0 are dropped). Predictions outside GT's frame span are ignored.
+#
+# Every (GT, prediction) box pair sharing a frame is generated and scored in
+# one flat IoU pass. Per-ID-pair overlaps (IDF1 counts, HOTA alignment and
+# association) are accumulated sparsely over packed (gt id, pred id) keys,
+# never as dense per-frame ID x ID arrays. Only the per-frame Hungarian
+# assignments of CLEAR MOT and HOTA loop over frames, each on its own small
+# matrix.
+
+import argparse, json, os, subprocess, sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from scipy.optimize import linear_sum_assignment  # ships with ultralytics
+from track_store import read_tracks
+from boxes import iou_pairs
+
+BOX = ["xmin", "ymin", "xmax", "ymax"]
+ALPHAS = np.arange(0.05, 0.99, 0.05)  # HOTA localization thresholds
+EPS = np.finfo(float).eps
+
+def load_tracks(path):
+    """frame, id and box columns sorted by frame (MOT gt.txt or a track file)."""
+    if str(path).lower().endswith(".txt"):
+        m = pd.read_csv(path, header=None)
+        if m.shape[1] > 6:
+            m = m[m[6] != 0]
+        df = pd.DataFrame({"frame": m[0], "id": m[1], "xmin": m[2], "ymin": m[3],
+                           "xmax": m[2] + m[4], "ymax": m[3] + m[5]})
+    else:
+        df = read_tracks(path, ["frame", "id"] + BOX)
+    return df.sort_values("frame", kind="stable").reset_index(drop=True)
+
+def frame_pairs(gf, pf):
+    """All (gt row, pred row) pairs in the same frame; both inputs sorted by
+    frame. Pairs come grouped by frame, then gt row."""
+    lo, hi = np.searchsorted(pf, gf, "left"), np.searchsorted(pf, gf, "right")
+    n = hi - lo
+    gi = np.repeat(np.arange(len(gf)), n)
+    pj = np.repeat(lo, n) + np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+    return gi, pj
+
+class Sequence:
+    """GT and predictions of one sequence, with every same-frame pair scored."""
+    def __init__(self, gt, pred):
+        self.gf, self.pf = gt["frame"].to_numpy(), pred["frame"].to_numpy()
+        self.g_ids, self.g = np.unique(gt["id"].to_numpy(), return_inverse=True)
+        self.p_ids, self.p = np.unique(pred["id"].to_numpy(), return_inverse=True)
+        self.n_g, self.n_p = len(self.g_ids), len(self.p_ids)
+        self.gi, self.pj = frame_pairs(self.gf, self.pf)
+        self.sim = iou_pairs(gt[BOX].to_numpy(np.float64)[self.gi], pred[BOX].to_numpy(np.float64)[self.pj])
+        # sparse ID-pair keys: pair -> index into the distinct (gt id, pred id) keys
+        self.keys, self.key_of = np.unique(self.g[self.gi].astype(np.int64) * self.n_p + self.p[self.pj],
+                                           return_inverse=True)
+        self.key_g, self.key_p = self.keys // self.n_p, self.keys % self.n_p
+        self.g_count = np.bincount(self.g, minlength=self.n_g)
+        self.p_count = np.bincount(self.p, minlength=self.n_p)
+
+    def frames(self):
+        """Per frame: (gt rows, pred rows, pair slice) - pair slices are ordered
+        gt row-major, so each reshapes to that frame's (n_gt, n_pred) matrix."""
+        frames = np.union1d(self.gf, self.pf)
+        g_lo, g_hi = np.searchsorted(self.gf, frames, "left"), np.searchsorted(self.gf, frames, "right")
+        p_lo, p_hi = np.searchsorted(self.pf, frames, "left"), np.searchsorted(self.pf, frames, "right")
+        off = np.r_[0, np.cumsum((g_hi - g_lo) * (p_hi - p_lo))]
+        for k in range(len(frames)):
+            yield (g_lo[k], g_hi[k]), (p_lo[k], p_hi[k]), (off[k], off[k + 1])
+
+def clear_mot(seq, iou_thr=0.5):
+    tp = fn = fp = idsw = 0
+    motp_sum = 0.0
+    prev_id = np.full(seq.n_g, -1)       # last pred ID matched to each GT ID
+    prev_step = np.full(seq.n_g, -1)     # pred ID matched in the previous frame (-1: none)
+    matched_count = np.zeros(seq.n_g, dtype=np.int64)
+    frag_count = np.zeros(seq.n_g, dtype=np.int64)
+    for (g0, g1), (p0, p1), (s0, s1) in seq.frames():
+        ng, npr = g1 - g0, p1 - p0
+        mg = mp = np.zeros(0, dtype=np.int64)
+        if ng and npr:
+            sim = seq.sim[s0:s1].reshape(ng, npr)
+            g_ids, p_ids = seq.g[g0:g1], seq.p[p0:p1]
+            score = 1000.0 * (p_ids[None, :] == prev_step[g_ids][:, None]) + sim  # keep existing matches
+            score[sim < iou_thr - EPS] = 0.0
+            r, c = linear_sum_assignment(-score)
+            ok = score[r, c] > 0
+            r, c = r[ok], c[ok]
+            mg, mp = g_ids[r], p_ids[c]
+            motp_sum += sim[r, c].sum()
+            last = prev_id[mg]
+            idsw += int(((last >= 0) & (last != mp)).sum())
+        not_tracked = prev_step < 0
+        prev_step[:] = -1
+        prev_step[mg] = mp
+        prev_id[mg] = mp
+        frag_count[not_tracked & (prev_step >= 0)] += 1
+        matched_count[mg] += 1
+        tp += len(mg); fn += ng - len(mg); fp += npr - len(mg)
+    ratio = matched_count / np.maximum(seq.g_count, 1)
+    return {"MOTA": (tp - fp - idsw) / max(1, tp + fn), "MOTP": motp_sum / max(1, tp),
+            "IDSW": idsw, "Frag": int((frag_count[frag_count > 0] - 1).sum()),
+            "MT": int((ratio > 0.8).sum()), "ML": int((ratio < 0.2).sum()),
+            "CLR_TP": int(tp), "CLR_FN": int(fn), "CLR_FP": int(fp)}
+
+def identity(seq, iou_thr=0.5):
+    # frames where a GT ID and a pred ID overlap >= iou_thr, per ID pair (sparse);
+    # the best one-to-one ID assignment maximises their total (= IDTP)
+    hit = seq.sim >= iou_thr - EPS
+    counts = np.bincount(seq.key_of[hit], minlength=len(seq.keys))
+    live = counts > 0
+    kg, kp, kc = seq.key_g[live], seq.key_p[live], counts[live]
+    idtp = 0
+    if len(kc):
+        ug, rg = np.unique(kg, return_inverse=True)
+        up, rp = np.unique(kp, return_inverse=True)
+        m = np.zeros((len(ug), len(up)))
+        m[rg, rp] = kc
+        r, c = linear_sum_assignment(-m)
+        idtp = int(m[r, c].sum())
+    n_gt, n_pr = int(seq.g_count.sum()), int(seq.p_count.sum())
+    idfn, idfp = n_gt - idtp, n_pr - idtp
+    return {"IDF1": 2 * idtp / max(1, 2 * idtp + idfn + idfp), "IDP": idtp / max(1, idtp + idfp),
+            "IDR": idtp / max(1, idtp + idfn), "IDTP": idtp, "IDFN": idfn, "IDFP": idfp}
+
+def hota(seq):
+    sim = seq.sim
+    # global alignment score per ID pair from the per-frame Jaccard-normalised similarity
+    row = np.bincount(seq.gi, sim, minlength=len(seq.gf))
+    col = np.bincount(seq.pj, sim, minlength=len(seq.pf))
+    denom = row[seq.gi] + col[seq.pj] - sim
+    sim_iou = np.where(denom > EPS, sim / np.maximum(denom, EPS), 0.0)
+    pot = np.bincount(seq.key_of, sim_iou, minlength=len(seq.keys))
+    align = pot / (seq.g_count[seq.key_g] + seq.p_count[seq.key_p] - pot)
+    score_all = align[seq.key_of] * sim
+
+    matched = []  # pair indices chosen by the per-frame assignment
+    for (g0, g1), (p0, p1), (s0, s1) in seq.frames():
+        ng, npr = g1 - g0, p1 - p0
+        if ng and npr:
+            r, c = linear_sum_assignment(-score_all[s0:s1].reshape(ng, npr))
+            matched.append(s0 + r * npr + c)
+    matched = np.concatenate(matched) if matched else np.zeros(0, dtype=np.int64)
+    n_gt, n_pr = int(seq.g_count.sum()), int(seq.p_count.sum())
+    det, ass, loc = [], [], []
+    for a in ALPHAS:
+        m = matched[sim[matched] >= a - EPS]
+        tp = len(m)
+        mc = np.bincount(seq.key_of[m], minlength=len(seq.keys)).astype(float)
+        ass_a = mc / np.maximum(seq.g_count[seq.key_g] + seq.p_count[seq.key_p] - mc, 1)
+        det.append(tp / max(1, n_gt + n_pr - tp))
+        ass.append((mc * ass_a).sum() / max(1, tp))
+        loc.append(max(EPS, sim[m].sum()) / max(EPS, tp))
+    det, ass = np.array(det), np.array(ass)
+    return {"HOTA": float(np.sqrt(det * ass).mean()), "DetA": float(det.mean()), "AssA": float(ass.mean()),
+            "LocA": float(np.mean(loc)), "HOTA@0.5": float(np.sqrt(det * ass)[9])}
+
+def evaluate(gt, pred, iou_thr=0.5):
+    lo, hi = gt["frame"].min(), gt["frame"].max()
+    pred = pred[(pred["frame"] >= lo) & (pred["frame"] <= hi)]
+    seq = Sequence(gt, pred)
+    out = {"gt_ids": seq.n_g, "pred_ids": seq.n_p, "gt_boxes": int(len(gt)), "pred_boxes": int(len(pred))}
+    out.update(hota(seq))
+    out.update(clear_mot(seq, iou_thr))
+    out.update(identity(seq, iou_thr))
+    return out
+
+def run_trackers(source, trackers, extra):
+    """Track `source` once per tracker config; returns {name: tracks path}."""
+    here = Path(__file__).resolve().parent
+    preds = {}
+    for t in trackers:
+        out = here / "outputs" / f"tracks_{Path(t).stem}.trk"
+        cmd = [sys.executable, str(here / "track.py"), "--source", str(source), "--tracker", t, "--out", str(out)] + extra
+        print(">>", " ".join(cmd))
+        r = subprocess.run(cmd, capture_output=True, text=True)
+        if r.returncode != 0:
+            print(r.stdout); print(r.stderr)
+            raise SystemExit(r.returncode)
+        preds[Path(t).stem] = str(out)
+    return preds
+
+def main():
+    ap = argparse.ArgumentParser(description="MOTA / IDF1 / HOTA of track files against ground-truth tracks")
+    ap.add_argument("--gt", required=True, help="GT tracks: track store / CSV (frame,id,xmin..ymax) or MOT gt.txt")
+    ap.add_argument("--pred", nargs="*", default=[], help="[name=]tracks from track.py, one or more")
+    ap.add_argument("--source", default=None, help="with --trackers: video to track")
+    ap.add_argument("--trackers", nargs="*", default=[], help="tracker configs to run first, e.g. bytetrack.yaml botsort.yaml")
+    ap.add_argument("--track_args", nargs=argparse.REMAINDER, default=[],
+                    help="passed on to track.py (put last), e.g. --track_args --conf 0.2")
+    ap.add_argument("--iou_thr", type=float, default=0.5, help="IoU for CLEAR MOT / IDF1 matches")
+    ap.add_argument("--out_json", default="det_track/outputs/track_metrics.json")
+    args = ap.parse_args()
+
+    preds = {}
+    for spec in args.pred:
+        name, _, path = spec.rpartition("=")
+        preds[name or Path(path).stem] = path
+    if args.trackers:
+        if not args.source:
+            raise SystemExit("--trackers needs --source")
+        preds.update(run_trackers(args.source, args.trackers, args.track_args))
+    if not preds:
+        raise SystemExit("Nothing to evaluate: give --pred and/or --source with --trackers")
+
+    gt = load_tracks(args.gt)
+    if gt.empty:
+        raise SystemExit(f"{args.gt} has no rows")
+    results = {}
+    for name, path in preds.items():
+        results[name] = evaluate(gt, load_tracks(path), args.iou_thr)
+
+    keys = ["HOTA", "DetA", "AssA", "LocA", "MOTA", "MOTP", "IDF1", "IDP", "IDR", "IDSW", "Frag", "MT", "ML",
+            "gt_ids", "pred_ids"]
+    names = list(results)
+    print("\n| metric | " + " | ".join(names) + " |")
+    print("|--------|" + "|".join("-" * (len(n) + 2) for n in names) + "|")
+    for k in keys:
+        vals = [results[n][k] for n in names]
+        print(f"| {k} | " + " | ".join(f"{v:.3f}" if isinstance(v, float) else str(v) for v in vals) + " |")
+    os.makedirs(os.path.dirname(args.out_json), exist_ok=True)
+    with open(args.out_json, "w", encoding="utf-8") as f:
+        json.dump({"gt": args.gt, "iou_thr": args.iou_thr, "pred": preds, "results": results}, f, indent=2)
+    print("Wrote:", args.out_json)
+
+if __name__ == "__main__":
+    main()
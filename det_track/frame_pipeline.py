@@ -0,0 +1,191 @@
+# det_track/frame_pipeline.py
+# Threaded decode -> infer -> write pipeline shared by the per-frame scripts
+# (detect_to_csv.py, make_demo_overlay.py, segmentation/apply_segformer.py).
+#
+#   decode thread --[queue, depth]--> infer (caller's thread) --[queue, depth]--> write thread
+#
+# Queues are bounded, so a slow stage blocks the one feeding it (backpressure)
+# and at most ~2*depth frames are in memory. OpenCV decode/encode and torch
+# inference all release the GIL, so the three stages really overlap.
+# With batch=N the infer stage collects N decoded frames per model call.
+
+import json, os, platform, queue, threading, time
+from pathlib import Path
+import cv2
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp"}
+_DONE = object()
+
+def read_frames(source, start=0, stop=None, stride=1, limit=None):
+    """Yield (frame_index, BGR frame) for a video (0-based source indices).
+
+    Decodes frames start, start+stride, ... up to (not including) `stop`,
+    and at most `limit` of them. A single image yields (0, image).
+    """
+    if Path(str(source)).suffix.lower() in IMAGE_EXTS:
+        img = cv2.imread(str(source))
+        if img is None:
+            raise SystemExit(f"Cannot read image: {source}")
+        yield 0, img
+        return
+    cap = cv2.VideoCapture(str(source))
+    if not cap.isOpened():
+        raise SystemExit(f"Cannot open video: {source}")
+    stride = max(1, stride)
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    i, n = start, 0
+    try:
+        while stop is None or i < stop:
+            if limit is not None and n >= limit:
+                break
+            if (i - start) % stride:
+                if not cap.grab():  # skip without converting the frame
+                    break
+                i += 1
+                continue
+            ok, frame = cap.read()
+            if not ok:
+                break
+            yield i, frame
+            i += 1; n += 1
+    finally:
+        cap.release()
+
+def seek_frames(source, indices, max_grab=8):
+    """Yield (frame_index, BGR frame) for ascending 0-based `indices`.
+
+    Far-apart indices are reached with a seek (the decoder restarts at the
+    preceding keyframe), so sparse samples of a long video do not decode
+    every frame in between; gaps of up to `max_grab` frames are skipped
+    with grab() instead. Stops at the first frame that cannot be read.
+    """
+    cap = cv2.VideoCapture(str(source))
+    if not cap.isOpened():
+        raise SystemExit(f"Cannot open video: {source}")
+    pos = 0  # index of the next frame read() would return
+    try:
+        for i in indices:
+            i = int(i)
+            if i < pos or i - pos > max_grab:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, i)
+            else:
+                while pos < i and cap.grab():
+                    pos += 1
+            ok, frame = cap.read()
+            if not ok:
+                break
+            pos = i + 1
+            yield i, frame
+    finally:
+        cap.release()
+
+def _put(q, item, stop):
+    # blocking put that still notices when the pipeline is shutting down
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def _get(q, stop):
+    # blocking get that gives up once the pipeline is shutting down
+    while True:
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            if stop.is_set():
+                return _DONE
+
+def run_pipeline(frames, infer, write, depth=8, batch=None):
+    """Run `infer(index, frame)` on every item of `frames`, and
+    `write(index, frame, result)` on a writer thread, in frame order.
+
+    `frames` is any iterable of (index, frame), e.g. read_frames(...).
+    With batch=N, `infer(indices, frames)` instead gets lists of up to N
+    frames and must return one result per frame.
+    Returns throughput stats; busy seconds per stage show the bottleneck.
+    """
+    depth = max(1, depth, batch or 1)  # the input queue must hold a full batch
+    q_in, q_out = queue.Queue(depth), queue.Queue(depth)
+    stop = threading.Event()
+    errors = []
+    busy = {"decode": 0.0, "infer": 0.0, "write": 0.0}
+
+    def decoder():
+        try:
+            it = iter(frames)
+            while not stop.is_set():
+                t = time.perf_counter()
+                item = next(it, _DONE)
+                busy["decode"] += time.perf_counter() - t
+                if not _put(q_in, item, stop) or item is _DONE:
+                    break
+        except BaseException as e:
+            errors.append(e); _put(q_in, _DONE, stop)
+
+    def writer():
+        try:
+            while True:
+                item = q_out.get()
+                if item is _DONE:
+                    break
+                t = time.perf_counter()
+                write(*item)
+                busy["write"] += time.perf_counter() - t
+        except BaseException as e:
+            errors.append(e); stop.set()
+            while q_out.get() is not _DONE:  # keep draining so infer never blocks
+                pass
+
+    threads = [threading.Thread(target=decoder, daemon=True), threading.Thread(target=writer, daemon=True)]
+    for th in threads:
+        th.start()
+
+    n, t0 = 0, time.perf_counter()
+    size = batch or 1
+    try:
+        done = False
+        while not done:
+            items = []
+            while len(items) < size:
+                item = _get(q_in, stop)
+                if item is _DONE:
+                    done = True
+                    break
+                items.append(item)
+            if not items:
+                break
+            t = time.perf_counter()
+            if batch:
+                idxs, imgs = [i for i, _ in items], [f for _, f in items]
+                results = infer(idxs, imgs)
+            else:
+                results = [infer(*items[0])]
+            busy["infer"] += time.perf_counter() - t
+            for (idx, frame), res in zip(items, results):
+                q_out.put((idx, frame, res))
+            n += len(items)
+    finally:
+        q_out.put(_DONE)
+        threads[1].join()
+        stop.set()
+        threads[0].join()
+    if errors:
+        raise errors[0]
+
+    dt = time.perf_counter() - t0
+    return {"frames": n, "seconds": round(dt, 3), "fps": round(n / dt, 2) if dt > 0 else 0.0,
+            "busy_seconds": {k: round(v, 3) for k, v in busy.items()}, "queue_depth": depth,
+            "batch": batch or 1}
+
+def log_throughput(path, stats, **info):
+    """Append one JSON line (stats + run settings + machine) to `path`,
+    so batch sizes can be compared per machine later."""
+    os.makedirs(Path(path).parent, exist_ok=True)
+    rec = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "host": platform.node(),
+           "cpus": os.cpu_count(), **info, **stats}
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(rec) + "\n")
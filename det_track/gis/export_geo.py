@@ -1,19 +1,34 @@
 # gis/export_geo.py (unchanged idea, now uses time_sec if present)
-import csv, json, os
-IN_CSV = "det_track/outputs/tracks_with_speed.csv"
+# A run-length encoded track store (track_rle.py) gives one point per
+# stationary run (frame .. end_frame) instead of one per frame; add --expand
+# to get every frame anyway.
+import json, os, sys
+from pathlib import Path
+import pandas as pd
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # det_track/
+from track_store import read_tracks, read_store, is_csv
+from track_rle import read_runs
+
+args = [a for a in sys.argv[1:] if a != "--expand"]
+IN_TRACKS = args[0] if args else "det_track/outputs/tracks_with_speed.trk"  # store or CSV
 OUT = "gis/outputs/detections.geojson"
 os.makedirs("gis/outputs", exist_ok=True)
 
 LON0, LAT0, SCALE = -113.49, 53.54, 1e-5
+runs = None if is_csv(IN_TRACKS) or "--expand" in sys.argv else read_runs(IN_TRACKS)
+if runs is None:
+    parts = [read_tracks(IN_TRACKS)]
+else:  # per-frame rows as stored, runs as single points - nothing is expanded
+    parts = [pd.DataFrame(read_store(IN_TRACKS, runs=False)), pd.DataFrame(runs)]
 features = []
-with open(IN_CSV, newline="", encoding="utf-8") as f:
-    for row in csv.DictReader(f):
-        cx = (float(row["xmin"]) + float(row["xmax"])) / 2
-        cy = (float(row["ymin"]) + float(row["ymax"])) / 2
-        lon = LON0 + cx*SCALE; lat = LAT0 - cy*SCALE
-        props = {k: row[k] for k in row if k not in ["xmin","ymin","xmax","ymax"]}
-        features.append({"type":"Feature",
-                         "geometry":{"type":"Point","coordinates":[lon,lat]},
-                         "properties":props})
+for df in parts:
+    # columnar: compute all coordinates at once instead of per CSV row
+    lon = LON0 + (df["xmin"].astype(float) + df["xmax"].astype(float)) / 2 * SCALE
+    lat = LAT0 - (df["ymin"].astype(float) + df["ymax"].astype(float)) / 2 * SCALE
+    props = df.drop(columns=["xmin","ymin","xmax","ymax"]).to_dict("records")
+    features += [{"type":"Feature",
+                  "geometry":{"type":"Point","coordinates":[x,y]},
+                  "properties":p}
+                 for x, y, p in zip(lon.tolist(), lat.tolist(), props)]
 open(OUT,"w",encoding="utf-8").write(json.dumps({"type":"FeatureCollection","features":features}))
 print("Wrote:", OUT)
@@ -1,61 +1,106 @@
-# Build GeoJSON LineStrings from det_track/outputs/tracks_with_speed.csv
+# Build GeoJSON LineStrings from det_track/outputs/tracks_with_speed.trk (or a CSV)
 # Coordinates are in image pixels (x=cx, y=cy). QGIS will open this fine;
 # treat it as a local/pseudo CRS for visualization.
+# With --chunk_rows the tracks are streamed in frame-ordered chunks: points are
+# collected per open track and its feature is written once the ID has been
+# gone for --evict_after frames (features then come out in end-time order).
+# An ID that comes back after such a gap gets a second LineString, where the
+# in-memory export writes one line through both visits.
 
-import json, argparse
+import json, argparse, sys
 from pathlib import Path
 import pandas as pd
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # det_track/
+from track_store import read_tracks, store_columns, iter_frame_chunks
+
+FC_INFO = {
+    "type": "FeatureCollection",
+    "name": "tracks_lines (image pixels)",
+    # Optional hint: this is a pixel-based local CRS, not lon/lat
+    "crs": {"type": "name", "properties": {"name": "EPSG:0 (image-pixels)"}},
+}
+
+def make_feature(tid, g):
+    coords = [[float(x), float(y)] for x, y in zip(g["cx"], g["cy"])]
+    props = {
+        "id": int(tid),
+        "n_pts": int(len(g)),
+        "start_time": float(g["time_sec"].iloc[0]),
+        "end_time": float(g["time_sec"].iloc[-1]),
+        "avg_speed_px": float(g["speed_px"].mean()) if "speed_px" in g else None,
+        "avg_speed_ma": float(g["speed_ma"].mean()) if "speed_ma" in g else None,
+        "parked_frames": int((g.get("is_parked", 0) == 1).sum()),
+    }
+    return {
+        "type": "Feature",
+        "geometry": {"type": "LineString", "coordinates": coords},
+        "properties": props,
+    }
+
+def export_chunked(tracks, cols, out_path, min_points, chunk_rows, evict_after):
+    """Stream features to `out_path`; only open tracks are held in memory."""
+    open_tracks, last_seen, n = {}, {}, 0
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(FC_INFO, ensure_ascii=False)[:-1] + ', "features": [')
+
+        def emit(ids):
+            nonlocal n
+            for tid in sorted(ids):
+                g = pd.concat(open_tracks.pop(tid), ignore_index=True)
+                del last_seen[tid]
+                if len(g) >= min_points:
+                    f.write((", " if n else "") + json.dumps(make_feature(tid, g), ensure_ascii=False))
+                    n += 1
+
+        for df in iter_frame_chunks(tracks, list(dict.fromkeys(cols + ["frame"])), chunk_rows):
+            df = df.sort_values(["id", "time_sec"], kind="mergesort")
+            for tid, g in df.groupby("id", sort=False):
+                open_tracks.setdefault(tid, []).append(g.drop(columns="frame"))
+                last_seen[tid] = int(g["frame"].max())
+            if evict_after:
+                horizon = int(df["frame"].max()) - evict_after
+                emit([t for t, fr in last_seen.items() if fr < horizon])
+        emit(list(open_tracks))
+        f.write("]}")
+    return n
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--tracks_csv", default="det_track/outputs/tracks_with_speed.csv")
+    ap.add_argument("--tracks", "--tracks_csv", dest="tracks_csv", default="det_track/outputs/tracks_with_speed.trk",
+                    help="tracks_with_speed from summarize_tracks.py (track store or CSV)")
     ap.add_argument("--out_geojson", default="gis/outputs/tracks_lines.geojson")
     ap.add_argument("--min_points", type=int, default=2, help="min points per track to keep")
+    ap.add_argument("--chunk_rows", type=int, default=0,
+                    help="stream the tracks this many rows at a time (0 = load everything)")
+    ap.add_argument("--evict_after", type=int, default=900,
+                    help="with --chunk_rows: write a track once its ID is gone this many frames "
+                         "(an ID seen again later gets a second feature)")
     args = ap.parse_args()
 
     tracks_csv = Path(args.tracks_csv)
     out_path = Path(args.out_geojson)
     out_path.parent.mkdir(parents=True, exist_ok=True)
 
-    df = pd.read_csv(tracks_csv)
-    if df.empty:
-        raise SystemExit(f"No rows in {tracks_csv}")
-
-    # Ensure we have what we need
-    missing = [c for c in ["id", "time_sec", "cx", "cy"] if c not in df.columns]
+    # Ensure we have what we need, then load only those columns
+    available = store_columns(tracks_csv)
+    missing = [c for c in ["id", "time_sec", "cx", "cy"] if c not in available]
     if missing:
         raise SystemExit(f"Missing columns in {tracks_csv}: {missing}")
+    wanted = ["id", "time_sec", "cx", "cy", "speed_px", "speed_ma", "is_parked"]
+    cols = [c for c in wanted if c in available]
+    if args.chunk_rows:
+        n = export_chunked(tracks_csv, cols, out_path, args.min_points, args.chunk_rows, args.evict_after)
+        print("Wrote:", out_path, f"({n} features)")
+        return
+    df = read_tracks(tracks_csv, cols)
+    if df.empty:
+        raise SystemExit(f"No rows in {tracks_csv}")
 
     # Sort consistently
     df = df.sort_values(["id", "time_sec"], kind="mergesort")
 
-    features = []
-    for tid, g in df.groupby("id"):
-        if len(g) < args.min_points:
-            continue
-        coords = [[float(x), float(y)] for x, y in zip(g["cx"], g["cy"])]
-        props = {
-            "id": int(tid),
-            "n_pts": int(len(g)),
-            "start_time": float(g["time_sec"].iloc[0]),
-            "end_time": float(g["time_sec"].iloc[-1]),
-            "avg_speed_px": float(g["speed_px"].mean()) if "speed_px" in g else None,
-            "avg_speed_ma": float(g["speed_ma"].mean()) if "speed_ma" in g else None,
-            "parked_frames": int((g.get("is_parked", 0) == 1).sum()),
-        }
-        features.append({
-            "type": "Feature",
-            "geometry": {"type": "LineString", "coordinates": coords},
-            "properties": props,
-        })
-
-    fc = {
-        "type": "FeatureCollection",
-        "name": "tracks_lines (image pixels)",
-        "features": features,
-        # Optional hint: this is a pixel-based local CRS, not lon/lat
-        "crs": {"type": "name", "properties": {"name": "EPSG:0 (image-pixels)"}}
-    }
+    features = [make_feature(tid, g) for tid, g in df.groupby("id") if len(g) >= args.min_points]
+    fc = dict(FC_INFO, features=features)
 
     out_path.write_text(json.dumps(fc, ensure_ascii=False), encoding="utf-8")
     print("Wrote:", out_path, f"({len(features)} features)")
@@ -1,59 +1,98 @@
-import cv2, os, imageio, imageio_ffmpeg as ioff
-import argparse
-import numpy as np
-
-def open_writer(path, fps, W, H):
-    writer = imageio.get_writer(
-        path, fps=fps, codec="libx264",
-        quality=None,  # use bitrate
-        bitrate="2000k", pixelformat="yuv420p"
-    )
-    return writer
+# det_track/make_variants.py
+# Degraded versions of a video (dark, blur, lowres, ...) for robustness checks.
+# Transforms live in a registry and work on decoded BGR frames in memory:
+# track.py --variants and detect_to_csv.py --variant apply them on the fly
+# (the source is decoded once, nothing is re-encoded). Writing the variants
+# to .mp4 with this script is only needed to look at them.
+# Usage (from project root):
+#   python det_track/make_variants.py --source det_track/sample_video.mp4 --outdir robustness
+#   python det_track/make_variants.py --variants dark lowres --max_frames 300
+#
+# Add a variant with @register("name") on a frame -> frame function.
+
+import argparse, os
+import cv2, imageio, imageio_ffmpeg as ioff
+from frame_pipeline import read_frames
+
+TRANSFORMS = {}
+
+def register(name):
+    """Decorator adding a BGR frame -> BGR frame transform under `name`."""
+    def deco(fn):
+        TRANSFORMS[name] = fn
+        return fn
+    return deco
+
+def resize_width(frame, w):
+    H, W = frame.shape[:2]
+    return cv2.resize(frame, (w, int(w * H / W)))
+
+@register("dark")
+def dark(frame):
+    return cv2.convertScaleAbs(frame, alpha=1.1, beta=-12)  # contrast up, brightness down
+
+@register("blur")
+def blur(frame):
+    return resize_width(cv2.GaussianBlur(frame, (0, 0), 2.0), 1280)
+
+@register("lowres")
+def lowres(frame):
+    return resize_width(frame, 854)
+
+def get_transforms(names):
+    """[(name, transform)] for registered variant names, in the given order."""
+    unknown = [n for n in names if n not in TRANSFORMS]
+    if unknown:
+        raise SystemExit(f"Unknown variant(s) {unknown}; registered: {sorted(TRANSFORMS)}")
+    return [(n, TRANSFORMS[n]) for n in names]
+
+def variant_width(name, source):
+    """Frame width of `source` after the `name` transform (from its first frame)."""
+    for _, frame in read_frames(source, limit=1):
+        return get_transforms([name])[0][1](frame).shape[1]
+    return 0
+
+def open_video_writer(path, fps):
+    os.makedirs(os.path.dirname(str(path)) or ".", exist_ok=True)
+    return imageio.get_writer(str(path), fps=fps, codec="libx264", quality=None,
+                              bitrate="2000k", pixelformat="yuv420p")
+
+class VariantWriters:
+    """Optional inspection copies: one .mp4 per variant in `outdir`."""
+    def __init__(self, outdir, names, fps):
+        _ = ioff.get_ffmpeg_exe()  # use imageio's bundled ffmpeg (avoids DLL mismatch)
+        self.paths = {n: os.path.join(str(outdir), f"{n}.mp4") for n in names}
+        self.writers = {n: open_video_writer(p, fps) for n, p in self.paths.items()}
+
+    def add(self, name, frame):
+        self.writers[name].append_data(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+    def close(self):
+        for w in self.writers.values():
+            w.close()
+        for p in self.paths.values():
+            print("Wrote:", p)
 
 def main():
-    ap = argparse.ArgumentParser()
+    ap = argparse.ArgumentParser(description="Write degraded variants of a video (for inspection)")
     ap.add_argument("--source", default="det_track/sample_video.mp4")
     ap.add_argument("--outdir", default="robustness")
-    ap.add_argument("--fps", type=int, default=15)
+    ap.add_argument("--variants", nargs="+", default=list(TRANSFORMS), help=f"any of {sorted(TRANSFORMS)}")
+    ap.add_argument("--fps", type=float, default=None, help="output fps (default: the source's)")
+    ap.add_argument("--max_frames", type=int, default=None)
     args = ap.parse_args()
 
-    os.makedirs(args.outdir, exist_ok=True)
+    transforms = get_transforms(args.variants)
     cap = cv2.VideoCapture(args.source)
-    fps_in = cap.get(cv2.CAP_PROP_FPS) or args.fps
-    W = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 1280)
-    H = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 720)
-
-    dark_w = open_writer(os.path.join(args.outdir, "dark.mp4"), args.fps, W, H)
-    blur_w = open_writer(os.path.join(args.outdir, "blur.mp4"), args.fps, 1280, int(1280*H/W))
-    lr_w   = open_writer(os.path.join(args.outdir, "lowres.mp4"), args.fps, 854, int(854*H/W))
-
-    frame_idx = 0
-    while True:
-        ok, frame = cap.read()
-        if not ok:
-            break
-        frame_idx += 1
-
-        # ---- dark/contrast ----
-        dark = cv2.convertScaleAbs(frame, alpha=1.1, beta=-12)  # contrast↑, brightness↓
-        dark_w.append_data(cv2.cvtColor(dark, cv2.COLOR_BGR2RGB))
-
-        # ---- blur ----
-        blur = cv2.GaussianBlur(frame, (0,0), 2.0)
-        blur = cv2.resize(blur, (1280, int(1280*H/W)))
-        blur_w.append_data(cv2.cvtColor(blur, cv2.COLOR_BGR2RGB))
-
-        # ---- low resolution ----
-        lr = cv2.resize(frame, (854, int(854*H/W)))
-        lr_w.append_data(cv2.cvtColor(lr, cv2.COLOR_BGR2RGB))
-
+    fps = args.fps or cap.get(cv2.CAP_PROP_FPS) or 15
     cap.release()
-    dark_w.close(); blur_w.close(); lr_w.close()
-    print("Wrote:", os.path.join(args.outdir, "dark.mp4"))
-    print("Wrote:", os.path.join(args.outdir, "blur.mp4"))
-    print("Wrote:", os.path.join(args.outdir, "lowres.mp4"))
+    out = VariantWriters(args.outdir, args.variants, fps)
+    try:
+        for _, frame in read_frames(args.source, limit=args.max_frames):
+            for name, fn in transforms:
+                out.add(name, fn(frame))
+    finally:
+        out.close()
 
 if __name__ == "__main__":
-    # force imageio-ffmpeg to use its own bundled ffmpeg binary (avoids DLL issues)
-    _ = ioff.get_ffmpeg_exe()
-    main()
\ No newline at end of file
+    main()
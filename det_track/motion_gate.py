@@ -0,0 +1,82 @@
+# det_track/motion_gate.py
+# Cheap motion gate: only run the detector when the scene changed.
+#
+# Each frame is shrunk to a small blurred grayscale image and compared with
+# the image from the last frame the detector ran on. If more than
+# `area_thr` of the pixels changed by more than `diff_thr` grey levels - or
+# `keyframe_every` frames passed without a detector run - the gate opens.
+# Otherwise callers carry the previous boxes forward ("propagated" frames).
+
+import json
+import cv2
+import numpy as np
+
+class MotionGate:
+    def __init__(self, width=160, diff_thr=25, area_thr=0.002, keyframe_every=30):
+        self.width = width
+        self.diff_thr = diff_thr
+        self.area_thr = area_thr
+        self.keyframe_every = max(1, keyframe_every)
+        self.ref = None
+        self.since = 0
+        self.inferred = 0
+        self.propagated = 0
+        self.infer_seconds = 0.0  # callers add their detector time here
+
+    def _small(self, frame):
+        h, w = frame.shape[:2]
+        size = (self.width, max(1, int(round(h * self.width / w))))
+        g = cv2.cvtColor(cv2.resize(frame, size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(g, (5, 5), 0)
+
+    def __call__(self, frame):
+        """True if the detector should run on this frame."""
+        small = self._small(frame)
+        run = self.ref is None or self.since + 1 >= self.keyframe_every
+        if not run:
+            changed = cv2.absdiff(small, self.ref) > self.diff_thr
+            run = bool(np.count_nonzero(changed) > self.area_thr * changed.size)
+        if run:
+            self.ref, self.since = small, 0
+            self.inferred += 1
+        else:
+            self.since += 1
+            self.propagated += 1
+        return run
+
+    def report(self, infer_seconds=None):
+        """Frames inferred vs propagated, and the detector time saved.
+
+        `infer_seconds` (default: self.infer_seconds) is the total time spent
+        in the detector; the saving is estimated as propagated frames x mean
+        detector time per frame.
+        """
+        if infer_seconds is None:
+            infer_seconds = self.infer_seconds
+        total = self.inferred + self.propagated
+        rep = {"frames": total, "inferred": self.inferred, "propagated": self.propagated,
+               "skipped_fraction": round(self.propagated / total, 4) if total else 0.0,
+               "keyframe_every": self.keyframe_every, "diff_thr": self.diff_thr, "area_thr": self.area_thr}
+        if self.inferred:
+            per = infer_seconds / self.inferred
+            rep["detector_seconds"] = round(infer_seconds, 3)
+            rep["detector_seconds_saved_est"] = round(per * self.propagated, 3)
+        return rep
+
+    def write_report(self, path, infer_seconds=None):
+        rep = self.report(infer_seconds)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(rep, f, indent=2)
+        return rep
+
+def add_gate_args(ap):
+    ap.add_argument("--motion_gate", action="store_true",
+                    help="Run the detector only when the scene changes (or every --keyframe_every frames)")
+    ap.add_argument("--keyframe_every", type=int, default=30, help="Max frames between detector runs when gated")
+    ap.add_argument("--gate_diff", type=float, default=25, help="Grey-level change that counts as motion")
+    ap.add_argument("--gate_area", type=float, default=0.002, help="Fraction of changed pixels that opens the gate")
+
+def gate_from_args(args):
+    if not args.motion_gate:
+        return None
+    return MotionGate(diff_thr=args.gate_diff, area_thr=args.gate_area, keyframe_every=args.keyframe_every)
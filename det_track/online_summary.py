@@ -0,0 +1,217 @@
+# det_track/online_summary.py
+# Incremental version of summarize_tracks.py: consumes track rows frame by
+# frame (as track.py produces them) and emits each --timebin window's
+# per-segment counts the moment the window closes, so occupancy is live
+# while the camera is still recording.
+# Usage (from project root):
+#   python det_track/track.py --live_counts det_track/outputs/live            # live, while tracking
+#   python det_track/online_summary.py --tracks det_track/outputs/tracks.trk  # replay a finished file
+#   python det_track/summarize_tracks.py --frame_w 1280 && \
+#   python det_track/online_summary.py --frame_w 1280 --check det_track/outputs  # diff against the batch run
+#
+# Per ID it keeps only the last centre and a ring buffer of the last
+# --park_win speeds; per window, the sets of IDs seen / parked per segment.
+# IDs unseen for --evict_after frames are dropped, so memory stays flat.
+#
+# Output (appended and flushed per window, same rows as the batch CSVs):
+#   counts_by_segment.csv   segment,tbin,unique_ids
+#   parked_by_segment.csv   segment,tbin,parked_ids
+# Rows come out in window order; sorted by (segment, tbin) they equal the
+# batch files of `summarize_tracks.py --frame_w W` with the same settings,
+# as long as no ID comes back after --evict_after frames unseen: such an ID
+# starts a fresh session (speed 0 on its first row, an empty --park_win
+# window), so its parked flags can differ from the batch run, which measures
+# its speed across the gap. (The batch default derives segment edges from
+# the whole file, which no online method can know up front, hence the fixed
+# frame width.)
+
+import argparse, csv, os
+from collections import deque
+import numpy as np
+import pandas as pd
+import cv2
+from track_store import read_tracks
+from curb_zones import CurbZones
+
+def segment_edges(frame_w, bins):
+    return np.linspace(0.0, float(frame_w), bins + 1)
+
+def segment_of(cx, edges):
+    """Segment number (0-based) of a centre x, or -1 outside the frame -
+    the same binning as pd.cut(cx, edges, include_lowest=True)."""
+    i = int(np.searchsorted(edges, cx, side="left"))
+    if cx == edges[0]:
+        i = 1
+    return i - 1 if 0 < i < len(edges) else -1
+
+class OnlineSummarizer:
+    def __init__(self, fps, frame_w, bins=4, timebin=5.0, park_win=10, park_thr=0.5,
+                 evict_after=900, out_dir=None, zones=None):
+        self.fps = fps
+        self.zones = zones  # CurbZones: segments are its zones instead of --bins strips
+        self.edges = segment_edges(frame_w, bins) if zones is None else None
+        self.labels = zones.ids if zones is not None else [f"S{i+1}" for i in range(bins)]
+        self.timebin = timebin
+        self.park_win = park_win
+        self.min_periods = max(2, park_win // 2)
+        self.park_thr = park_thr
+        self.evict_after = evict_after
+        self.state = {}  # id -> [last_cx, last_cy, last_frame, deque of recent speeds]
+        self.tbin = None
+        self.seen, self.parked = {}, {}  # segment -> set of IDs, current window only
+        self.windows = 0
+        self.next_evict = evict_after
+        self.files = None
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+            self.files = {}
+            for name, col in [("counts", "unique_ids"), ("parked", "parked_ids")]:
+                f = open(os.path.join(out_dir, f"{name}_by_segment.csv"), "w", newline="", encoding="utf-8")
+                w = csv.writer(f)
+                w.writerow(["segment", "tbin", col])
+                self.files[name] = (f, w)
+
+    def _speed_ma(self, st, cx, cy):
+        # dx/dy against the previous row of this ID (0 for its first row), then
+        # the trailing mean summed oldest -> newest exactly as speed_engine does
+        if st[3] is None:
+            dx = dy = 0.0
+            st[3] = deque(maxlen=self.park_win)
+        else:
+            dx, dy = cx - st[0], cy - st[1]
+        st[3].append(float(np.hypot(dx, dy)))
+        if len(st[3]) < self.min_periods:
+            return np.nan
+        acc = 0.0
+        for v in st[3]:
+            acc += v
+        return acc / len(st[3])
+
+    def add_frame(self, frame, rows):
+        """Feed one frame's rows (dicts with id and box corners). Returns the
+        (counts, parked) rows of a window this frame closed, else None."""
+        time_sec = (frame - 1) / self.fps
+        tbin = int(time_sec // self.timebin) * self.timebin
+        closed = None
+        if self.tbin is not None and tbin != self.tbin:
+            closed = self.close_window()
+        self.tbin = tbin
+        if self.zones is not None and rows:  # one vectorized lookup per frame
+            segs = self.zones.assign([(float(r["xmin"]) + float(r["xmax"])) / 2.0 for r in rows],
+                                     [(float(r["ymin"]) + float(r["ymax"])) / 2.0 for r in rows])
+        for k, r in enumerate(rows):
+            tid = int(r["id"])
+            cx = (float(r["xmin"]) + float(r["xmax"])) / 2.0
+            cy = (float(r["ymin"]) + float(r["ymax"])) / 2.0
+            st = self.state.get(tid)
+            if st is None:
+                st = self.state[tid] = [0.0, 0.0, frame, None]
+            ma = self._speed_ma(st, cx, cy)
+            st[0], st[1], st[2] = cx, cy, frame
+            seg = int(segs[k]) if self.zones is not None else segment_of(cx, self.edges)
+            if seg < 0:
+                continue
+            self.seen.setdefault(seg, set()).add(tid)
+            if ma < self.park_thr:
+                self.parked.setdefault(seg, set()).add(tid)
+        if self.evict_after and frame >= self.next_evict:
+            old = frame - self.evict_after
+            self.state = {k: v for k, v in self.state.items() if v[2] > old}
+            self.next_evict = frame + self.evict_after
+        return closed
+
+    def close_window(self):
+        """Emit the current window. Returns (counts rows, parked rows)."""
+        if self.tbin is None:
+            return [], []
+        counts = [(self.labels[s], self.tbin, len(self.seen[s])) for s in sorted(self.seen)]
+        parked = [(self.labels[s], self.tbin, len(self.parked[s])) for s in sorted(self.parked)]
+        if self.files:
+            for name, out in [("counts", counts), ("parked", parked)]:
+                f, w = self.files[name]
+                w.writerows(out)
+                f.flush()
+        self.seen, self.parked = {}, {}
+        self.windows += 1
+        return counts, parked
+
+    def close(self):
+        last = self.close_window() if self.tbin is not None else ([], [])
+        self.tbin = None
+        if self.files:
+            for f, _ in self.files.values():
+                f.close()
+            self.files = None
+        return last
+
+def add_online_args(ap):
+    ap.add_argument("--live_counts", default=None,
+                    help="Directory for live per-window segment counts (see online_summary.py)")
+    ap.add_argument("--frame_w", type=float, default=None, help="Width the segments split (default: video width)")
+    ap.add_argument("--bins", type=int, default=4, help="Horizontal segments of the frame")
+    ap.add_argument("--zones", default=None, help="Curb zone polygons (GeoJSON, see curb_zones.py) instead of --bins")
+    ap.add_argument("--timebin", type=float, default=5.0, help="Seconds per window")
+    ap.add_argument("--park_win", type=int, default=10, help="Rolling window (frames) for the parked heuristic")
+    ap.add_argument("--park_thr", type=float, default=0.5, help="Mean speed (px/frame) below which a car is parked")
+    ap.add_argument("--evict_after", type=int, default=900,
+                    help="Forget IDs unseen for this many frames (an ID that returns after that "
+                         "restarts its speed state, so parked counts can differ from the batch run)")
+
+def video_fps_width(video):
+    cap = cv2.VideoCapture(str(video))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    w = cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 0.0
+    cap.release()
+    return fps, w
+
+def summarizer_from_args(args, out_dir, fps, frame_w):
+    zones = CurbZones.from_geojson(args.zones) if args.zones else None
+    frame_w = args.frame_w or frame_w
+    if not frame_w and zones is None:
+        raise SystemExit("Cannot tell the frame width; pass --frame_w")
+    return OnlineSummarizer(fps, frame_w, args.bins, args.timebin, args.park_win, args.park_thr,
+                            args.evict_after, out_dir, zones)
+
+def frames_of(cols):
+    """Yield (frame, rows) from frame-ordered columns."""
+    frames = cols["frame"]
+    cuts = np.flatnonzero(np.diff(frames)) + 1
+    keys = ["id", "xmin", "ymin", "xmax", "ymax"]
+    for lo, hi in zip(np.r_[0, cuts], np.r_[cuts, len(frames)]):
+        yield int(frames[lo]), [dict(zip(keys, vals)) for vals in zip(*(cols[k][lo:hi].tolist() for k in keys))]
+
+def check(out_dir, batch_dir):
+    ok = True
+    for name in ["counts_by_segment.csv", "parked_by_segment.csv"]:
+        a = pd.read_csv(os.path.join(out_dir, name)).sort_values(["segment", "tbin"]).reset_index(drop=True)
+        b = pd.read_csv(os.path.join(batch_dir, name))
+        same = a.equals(b)
+        ok &= same
+        print(f"{name}: {'identical' if same else 'DIFFERENT'} to {batch_dir} ({len(a)} vs {len(b)} rows)")
+    return ok
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay a track file through the online summarizer")
+    ap.add_argument("--tracks", default="det_track/outputs/tracks.trk", help="track store or CSV")
+    ap.add_argument("--video", default="det_track/sample_video.mp4", help="Video file to read FPS / width from")
+    ap.add_argument("--out_dir", default="det_track/outputs/live")
+    ap.add_argument("--check", default=None, metavar="BATCH_DIR",
+                    help="Compare with summarize_tracks.py --frame_w outputs in this directory")
+    add_online_args(ap)
+    args = ap.parse_args()
+
+    fps, w = video_fps_width(args.video)
+    live = summarizer_from_args(args, args.out_dir, fps, w)
+    cols = {c: v.to_numpy() for c, v in
+            read_tracks(args.tracks, ["frame", "id", "xmin", "ymin", "xmax", "ymax"], order="frame").items()}
+    if not len(cols["frame"]):
+        raise SystemExit(f"{args.tracks} is empty — run track.py first.")
+    for frame, rows in frames_of(cols):
+        live.add_frame(frame, rows)
+    live.close()
+    print(f"Wrote: {args.out_dir} ({live.windows} windows)")
+    if args.check and not check(args.out_dir, args.check):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
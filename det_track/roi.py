@@ -0,0 +1,57 @@
+# det_track/roi.py
+# Curb / road region of interest for a fixed camera.
+#
+# The mask is a PNG (255 = curb/road, 0 = ignore) built once per camera by
+# segmentation/roi_mask.py. Detection then runs only on the mask's bounding
+# box (crop), and detections whose ground point (bottom-centre of the box)
+# falls outside the mask are dropped - buildings, sky, far sidewalk.
+
+import cv2
+import numpy as np
+
+class ROI:
+    def __init__(self, mask, pad=16):
+        self.mask0 = (mask > 0).astype(np.uint8)
+        self.pad = pad
+        self.shape = None  # frame (h, w) the mask is fitted to
+
+    def fit(self, shape):
+        """Scale the mask to frames of `shape` (h, w) and compute the crop box."""
+        h, w = shape[:2]
+        if self.shape == (h, w):
+            return self
+        m = self.mask0
+        if m.shape != (h, w):
+            m = cv2.resize(m, (w, h), interpolation=cv2.INTER_NEAREST)
+        self.mask, self.shape = m, (h, w)
+        ys, xs = np.nonzero(m)
+        if len(xs) == 0:
+            raise SystemExit("ROI mask is empty")
+        self.x1 = max(0, int(xs.min()) - self.pad); self.y1 = max(0, int(ys.min()) - self.pad)
+        self.x2 = min(w, int(xs.max()) + 1 + self.pad); self.y2 = min(h, int(ys.max()) + 1 + self.pad)
+        return self
+
+    def crop(self, frame):
+        self.fit(frame.shape)
+        return frame[self.y1:self.y2, self.x1:self.x2]
+
+    def keep(self, xyxy):
+        """Shift crop-space boxes back to full-frame coordinates and flag
+        the ones whose bottom-centre lies inside the mask.
+        Returns (full-frame boxes, boolean keep mask)."""
+        xyxy = np.asarray(xyxy, dtype=np.float64).reshape(-1, 4) + [self.x1, self.y1, self.x1, self.y1]
+        h, w = self.shape
+        gx = np.clip(((xyxy[:, 0] + xyxy[:, 2]) / 2).astype(int), 0, w - 1)
+        gy = np.clip((xyxy[:, 3] - 1).astype(int), 0, h - 1)
+        return xyxy, self.mask[gy, gx] > 0
+
+    def pixel_fraction(self):
+        """Share of the frame's pixels the detector still sees."""
+        h, w = self.shape
+        return (self.x2 - self.x1) * (self.y2 - self.y1) / float(h * w)
+
+def load_roi(path, pad=16):
+    mask = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+    if mask is None:
+        raise SystemExit(f"Cannot read ROI mask: {path} (build it with segmentation/roi_mask.py)")
+    return ROI(mask, pad=pad)
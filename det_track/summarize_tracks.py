@@ -3,76 +3,211 @@ import argparse, os
 import numpy as np
 import pandas as pd
 import cv2
+from track_store import read_tracks, write_tracks, iter_frame_chunks, ChunkedStoreWriter, read_meta, is_csv
+from track_rle import write_rle_store
+from speed_engine import sort_order, segment_pos, speed_columns, SpeedCarry
+from online_summary import segment_edges
+from chunked import cut_edges, cx_range, UniqueByBin
+from dwell_index import dwell_intervals, DwellChunks, finish_intervals, index_from_intervals
+from curb_zones import CurbZones
+
+BOX_COLS = ["xmin", "ymin", "xmax", "ymax"]
+
+def write_summaries(out_dir, first_seen, counts, parked):
+    for name, table in [("first_seen_by_id.csv", first_seen), ("counts_by_segment.csv", counts),
+                        ("parked_by_segment.csv", parked)]:
+        path = os.path.join(out_dir, name)
+        table.to_csv(path, index=False)
+        print("Wrote:", path)
+
+def write_dwell(out_dir, intervals, labels, fps, args):
+    """Parked sessions as CSV plus the queryable index (see dwell_index.py)."""
+    intervals = finish_intervals(intervals)
+    path = os.path.join(out_dir, "dwell_intervals.csv")
+    intervals.to_csv(path, index=False)
+    print("Wrote:", path)
+    print("Wrote:", index_from_intervals(os.path.join(out_dir, "dwell.idx"), intervals, labels, fps,
+                                         args.tracks, args.start_time))
+
+def summarize_chunked(args, fps, out_dir):
+    """Same outputs as the in-memory path, from frame-ordered chunks of
+    --chunk_rows rows. Speed state per ID, first-seen and the still-open
+    time bin are carried across chunks; tracks_with_speed is written as a
+    frame-ordered store (and CSV) chunk by chunk."""
+    zones = CurbZones.from_geojson(args.zones) if args.zones else None
+    labels = zones.ids if zones else [f"S{i+1}" for i in range(args.bins)]
+    if zones:
+        edges = None
+    elif args.frame_w:
+        edges = segment_edges(args.frame_w, args.bins)
+    else:  # pd.cut's equal-width edges need the global centre range: one cheap extra pass
+        edges = cut_edges(*cx_range(args.tracks, args.chunk_rows), args.bins)
+
+    carry = SpeedCarry(args.park_win, args.park_thr, args.evict_after)
+    out_tracks = os.path.join(out_dir, "tracks_with_speed.trk")
+    out_csv = os.path.join(out_dir, "tracks_with_speed.csv") if args.export_csv else None
+    writer = ChunkedStoreWriter(out_tracks)
+    csv_f = open(out_csv, "w", newline="", encoding="utf-8") if out_csv else None
+    first_seen = None
+    counts = UniqueByBin(["segment", "tbin"], "unique_ids")
+    parked = UniqueByBin(["segment", "tbin"], "parked_ids")
+    dwell = DwellChunks(fps, args.dwell_max_gap)
+    n_rows = 0
+    try:
+        for df in iter_frame_chunks(args.tracks, chunk_rows=args.chunk_rows):
+            df[BOX_COLS] = df[BOX_COLS].astype("float64")
+            df["time_sec"] = (df["frame"] - 1) / fps
+            df["cx"] = (df["xmin"] + df["xmax"]) / 2.0
+            df["cy"] = (df["ymin"] + df["ymax"]) / 2.0
+            order, cols = carry.update(df["id"].to_numpy(), df["frame"].to_numpy(),
+                                       df["cx"].to_numpy(), df["cy"].to_numpy())
+            df = df.iloc[order]
+            for col, v in cols.items():
+                df[col] = v
+
+            out = df.sort_values("frame", kind="stable")
+            writer.write(out)
+            if csv_f:
+                out.to_csv(csv_f, header=n_rows == 0, index=False)
+            n_rows += len(df)
+
+            ids = df["id"].to_numpy()
+            _, starts = segment_pos(ids)
+            part = pd.DataFrame({"id": ids[starts],
+                                 "first_seen_frame": df["frame"].to_numpy()[starts],
+                                 "first_seen_sec": np.minimum.reduceat(df["time_sec"].to_numpy(), starts)})
+            first_seen = part if first_seen is None else \
+                pd.concat([first_seen, part], ignore_index=True).groupby("id", as_index=False).min()
+
+            df["segment"] = (zones.segments(df["cx"], df["cy"]) if zones else
+                             pd.cut(df["cx"], bins=edges, labels=labels, include_lowest=True))
+            dwell.add(dwell_intervals(ids, df["frame"].to_numpy(), df["is_parked"].to_numpy(),
+                                      df["segment"].cat.codes.to_numpy(), fps, df["cx"].to_numpy(),
+                                      df["cy"].to_numpy(), labels, args.dwell_max_gap))
+            df["tbin"] = (df["time_sec"] // args.timebin).astype(int) * args.timebin
+            open_tbin = out["time_sec"].iat[-1] // args.timebin * args.timebin
+            counts.add(df, open_tbin)
+            parked.add(df[df["is_parked"] == 1], open_tbin)
+    finally:
+        if csv_f:
+            csv_f.close()
+    if not n_rows:
+        raise SystemExit(f"{args.tracks} is empty — run track.py first.")
+    writer.close()
+    return out_tracks, out_csv, first_seen, counts.result(), parked.result(), dwell.result(), labels
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--csv", default="det_track/outputs/tracks.csv")
+    ap.add_argument("--tracks", "--csv", dest="tracks", default="det_track/outputs/tracks.trk",
+                    help="tracks from track.py (track store or CSV)")
     ap.add_argument("--video", default="det_track/sample_video.mp4", help="Video file to read FPS from")
+    ap.add_argument("--out_dir", default="det_track/outputs", help="where the summaries and tracks_with_speed go")
     ap.add_argument("--park_win", type=int, default=10, help="rolling window (frames) for parked heuristic")
     ap.add_argument("--park_thr", type=float, default=0.5, help="mean speed threshold (px/frame) to mark parked")
     ap.add_argument("--bins", type=int, default=4, help="horizontal segments of frame for simple occupancy")
+    ap.add_argument("--frame_w", type=float, default=None,
+                    help="split [0, frame_w] into the segments (as online_summary.py does); "
+                         "default: the range of observed centres")
+    ap.add_argument("--zones", default=None,
+                    help="curb zone polygons (GeoJSON, see curb_zones.py): segment = zone id instead of --bins strips")
     ap.add_argument("--timebin", type=float, default=5.0, help="seconds per time bin for aggregation")
+    ap.add_argument("--export_csv", action="store_true", help="also write tracks_with_speed.csv")
+    ap.add_argument("--chunk_rows", type=int, default=0,
+                    help="process the tracks out of core, this many rows at a time (0 = load everything)")
+    ap.add_argument("--evict_after", type=int, default=9000,
+                    help="with --chunk_rows: forget per-ID speed state after this many frames unseen (0 = never)")
+    ap.add_argument("--dwell_max_gap", type=int, default=30,
+                    help="frames a parked ID may go undetected without ending its dwell session")
+    ap.add_argument("--start_time", default=None,
+                    help="wall-clock ISO time of the first frame, for dwell.idx queries by clock time")
     args = ap.parse_args()
 
-    out_dir = "det_track/outputs"
+    out_dir = args.out_dir
     os.makedirs(out_dir, exist_ok=True)
 
-    # --- read csv
-    df = pd.read_csv(args.csv)
-    if df.empty:
-        raise SystemExit("tracks.csv is empty — run track.py first.")
-
     # --- get FPS to convert frames -> seconds
     cap = cv2.VideoCapture(args.video)
     fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
     cap.release()
+
+    if args.chunk_rows:
+        out_tracks, out_csv, first_seen, counts, parked, intervals, labels = summarize_chunked(args, fps, out_dir)
+        print("Wrote:", out_tracks)
+        if out_csv:
+            print("Wrote:", out_csv)
+        write_summaries(out_dir, first_seen, counts, parked)
+        write_dwell(out_dir, intervals, labels, fps, args)
+        return
+
+    # --- read tracks (boxes are float32 in the store; do the math in float64)
+    df = read_tracks(args.tracks)
+    if df.empty:
+        raise SystemExit(f"{args.tracks} is empty — run track.py first.")
+    df[BOX_COLS] = df[BOX_COLS].astype("float64")
     df["time_sec"] = (df["frame"] - 1) / fps
 
-    # --- center points + per-frame speed in pixels
+    # --- center points + per-frame speed in pixels (one sort, flat arrays)
     df["cx"] = (df["xmin"] + df["xmax"]) / 2.0
     df["cy"] = (df["ymin"] + df["ymax"]) / 2.0
-    df = df.sort_values(["id", "frame"])
-    df["dx"] = df.groupby("id")["cx"].diff().fillna(0.0)
-    df["dy"] = df.groupby("id")["cy"].diff().fillna(0.0)
-    df["speed_px"] = np.hypot(df["dx"], df["dy"])
-
-    # --- parked vs moving via rolling mean of speed
-    df["speed_ma"] = df.groupby("id")["speed_px"].transform(
-        lambda s: s.rolling(args.park_win, min_periods=max(2, args.park_win // 2)).mean()
-    )
-    df["is_parked"] = (df["speed_ma"] < args.park_thr).astype(int)
-
-    out_tracks = os.path.join(out_dir, "tracks_with_speed.csv")
-    df.to_csv(out_tracks, index=False)
+    df = df.iloc[sort_order(df["id"].to_numpy(), df["frame"].to_numpy())]
+
+    # --- parked vs moving via rolling mean of speed (per-track segments)
+    ids = df["id"].to_numpy()
+    for col, v in speed_columns(ids, df["cx"].to_numpy(), df["cy"].to_numpy(),
+                                args.park_win, args.park_thr).items():
+        df[col] = v
+
+    out_tracks = os.path.join(out_dir, "tracks_with_speed.trk")
+    out_csv = os.path.join(out_dir, "tracks_with_speed.csv") if args.export_csv else None
+    rle = None if is_csv(args.tracks) else read_meta(args.tracks).get("rle")
+    if rle:  # run-length encoded input (track_rle.py): keep the parked stretches as runs
+        write_rle_store(out_tracks, df, rle["tol"], rle["min_run"])
+        if out_csv:
+            df.to_csv(out_csv, index=False)
+    else:
+        write_tracks(out_tracks, df, export_csv=out_csv)
     print("Wrote:", out_tracks)
+    if out_csv:
+        print("Wrote:", out_csv)
 
-    # --- first seen frame/time per ID
-    first_seen = (df.groupby("id")
-                    .agg(first_seen_frame=("frame", "min"),
-                         first_seen_sec=("time_sec", "min"))
-                    .reset_index())
-    out_first = os.path.join(out_dir, "first_seen_by_id.csv")
-    first_seen.to_csv(out_first, index=False)
-    print("Wrote:", out_first)
-
-    # --- simple horizontal “segments” across the image
-    # derive width from max xmax (fallback to 1920)
-    frame_w = float(df["xmax"].max()) if len(df) else 1920.0
-    df["segment"] = pd.cut(df["cx"],
-                           bins=args.bins,
-                           labels=[f"S{i+1}" for i in range(args.bins)],
-                           include_lowest=True)
+    # --- first seen frame/time per ID (reduced over the sorted track segments)
+    _, starts = segment_pos(ids)
+    first_seen = pd.DataFrame({"id": ids[starts],
+                               "first_seen_frame": df["frame"].to_numpy()[starts],
+                               "first_seen_sec": np.minimum.reduceat(df["time_sec"].to_numpy(), starts)})
+
+    # --- segments: curb zone polygons (--zones), else simple horizontal strips
+    # across the image - fixed edges over [0, --frame_w], or equal widths over the observed centres
+    if args.zones:
+        zones = CurbZones.from_geojson(args.zones)
+        labels = zones.ids
+        df["segment"] = zones.segments(df["cx"], df["cy"])  # NaN outside every zone
+    else:
+        labels = [f"S{i+1}" for i in range(args.bins)]
+        df["segment"] = pd.cut(df["cx"],
+                               bins=segment_edges(args.frame_w, args.bins) if args.frame_w else args.bins,
+                               labels=labels,
+                               include_lowest=True)
+
+    # --- parked runs per ID and segment -> dwell sessions (dwell_index.py)
+    intervals = dwell_intervals(ids, df["frame"].to_numpy(), df["is_parked"].to_numpy(),
+                                df["segment"].cat.codes.to_numpy(), fps, df["cx"].to_numpy(),
+                                df["cy"].to_numpy(), labels, args.dwell_max_gap)
 
     # --- time bins in seconds (e.g., 5s bins)
     df["tbin"] = (df["time_sec"] // args.timebin).astype(int) * args.timebin
 
     # unique vehicle count per segment per time bin
-    counts = (df.groupby(["segment", "tbin"])["id"]
+    counts = (df.groupby(["segment", "tbin"], observed=True)["id"]
                 .nunique()
                 .reset_index(name="unique_ids"))
-    out_counts = os.path.join(out_dir, "counts_by_segment.csv")
-    counts.to_csv(out_counts, index=False)
-    print("Wrote:", out_counts)
+
+    # parked vehicles per segment per time bin
+    parked = (df[df["is_parked"] == 1].groupby(["segment", "tbin"], observed=True)["id"]
+                .nunique()
+                .reset_index(name="parked_ids"))
+    write_summaries(out_dir, first_seen, counts, parked)
+    write_dwell(out_dir, intervals, labels, fps, args)
 
 if __name__ == "__main__":
     main()
@@ -1,21 +1,256 @@
 # det_track/track.py
-# Run multi-object tracking on a video and export per-frame tracks to CSV.
+# Run multi-object tracking on a video and export per-frame tracks to the
+# columnar track store (see track_store.py) or, with a .csv --out, to CSV.
+# Results are consumed frame by frame (stream=True) and flushed to disk in
+# chunks, so memory stays flat however long the video is.
 # Usage (from project root):
 #   python det_track/track.py --source "det_track/sample_video.mp4"
+#   python det_track/track.py --source "det_track/sample_video.mp4" --resume   # continue a crashed run
+#   python det_track/track.py --variants dark blur=0.12 lowres   # degraded copies, one decode, no re-encode
+#   python det_track/track.py --check_reuse   # track twice on one loaded model; rows must be identical
 # Or (from inside det_track/):
 #   python track.py --source "sample_video.mp4"
 
-from ultralytics import YOLO
 from pathlib import Path
-import argparse, csv, os
+import argparse, os, shutil, time
+import cv2
+from track_store import open_writer, resume_point, export_csv, is_csv, read_meta, read_tracks, FIELDNAMES
+from track_rle import encode_store
+from motion_gate import add_gate_args, gate_from_args
+from roi import load_roi
+from backends import add_backend_args, model_from_args
+from online_summary import add_online_args, summarizer_from_args, video_fps_width
+from frame_pipeline import read_frames
+from make_variants import TRANSFORMS, get_transforms, VariantWriters
 
 # COCO class IDs: car=2, motorcycle=3, bus=5, truck=7
 VEHICLE_CLASSES = [2, 3, 5, 7]
 
+def result_rows(r, frame_i, id_offset=0, roi=None):
+    """Per-box track rows for one Ultralytics Results object.
+
+    With an ROI, boxes are mapped from the crop back to full-frame
+    coordinates and boxes outside the curb mask are dropped.
+    """
+    boxes = getattr(r, "boxes", None)
+    if boxes is None or len(boxes) == 0:
+        return []
+
+    # Safely extract tensors
+    xyxy = boxes.xyxy.cpu().numpy() if getattr(boxes, "xyxy", None) is not None else []
+    ids  = boxes.id.cpu().numpy()   if getattr(boxes, "id",   None) is not None else [-1]*len(xyxy)
+    clss = boxes.cls.cpu().numpy()  if getattr(boxes, "cls",  None) is not None else [-1]*len(xyxy)
+    conf = boxes.conf.cpu().numpy() if getattr(boxes, "conf", None) is not None else [0]*len(xyxy)
+    if roi is not None and len(xyxy):
+        xyxy, keep = roi.keep(xyxy)
+        xyxy = xyxy[keep]
+        ids, clss, conf = ([v for v, k in zip(a, keep) if k] for a in (ids, clss, conf))
+
+    rows = []
+    for (x1, y1, x2, y2), tid, c, p in zip(xyxy, ids, clss, conf):
+        tid = int(tid) if tid is not None else -1
+        rows.append({
+            "frame": frame_i,
+            "time": frame_i,                # use frame index as time proxy (you can map to seconds later)
+            "id": tid + id_offset if tid >= 0 else -1,
+            "xmin": float(x1), "ymin": float(y1),
+            "xmax": float(x2), "ymax": float(y2),
+            "conf": float(p),
+            "cls": int(c)
+        })
+    return rows
+
+def track_frames(model, source, start_frame, track_kw, stop_frame=None, gate=None, roi=None):
+    """Track a single video from `start_frame` to `stop_frame` (1-based,
+    inclusive, in vid_stride units).
+
+    Yields (frame_i, Results). Used when resuming, tracking a time shard,
+    motion gating or cropping to an ROI, where Ultralytics cannot drive the
+    source itself. With a `gate`, frames it rejects yield (frame_i, None)
+    without running YOLO. With an `roi`, YOLO only sees the ROI crop.
+    """
+    if not os.path.isfile(source):
+        raise SystemExit(f"Resuming / sharding needs a single video file, got: {source}")
+    stride = max(1, track_kw.get("vid_stride", 1))
+    kw = {k: v for k, v in track_kw.items() if k not in ("vid_stride", "save")}
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        raise SystemExit(f"Cannot open video: {source}")
+    pos = (start_frame - 1) * stride
+    cap.set(cv2.CAP_PROP_POS_FRAMES, pos)
+    frame_i = start_frame - 1
+    try:
+        while stop_frame is None or frame_i < stop_frame:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            if pos % stride == 0:
+                frame_i += 1
+                if roi is not None:
+                    frame = roi.crop(frame)
+                if gate is None:
+                    yield frame_i, model.track(frame, persist=True, verbose=False, **kw)[0]
+                elif gate(frame):
+                    t = time.perf_counter()
+                    r = model.track(frame, persist=True, verbose=False, **kw)[0]
+                    gate.infer_seconds += time.perf_counter() - t
+                    yield frame_i, r
+                else:
+                    yield frame_i, None
+            pos += 1
+    finally:
+        cap.release()
+
+TRACKER_EVENTS = ("on_predict_start", "on_predict_postprocess_end")
+
+def _is_tracker_callback(fn):
+    return getattr(getattr(fn, "func", fn), "__module__", "") == "ultralytics.trackers.track"
+
+def reset_tracker(model):
+    """Drop tracker state left on a reused model so the next video starts fresh.
+
+    Model.track registers a tracker callback pair whenever the predictor has
+    no `trackers`, so the old pair is removed along with the trackers: left
+    in place, every reuse would stack another pair and update the tracker
+    twice per frame. Re-registering (rather than resetting the trackers in
+    place) also picks up a different `tracker` config on the next call.
+    """
+    predictor = getattr(model, "predictor", None)
+    if predictor is not None and hasattr(predictor, "trackers"):
+        del predictor.trackers
+    for cbs in (getattr(model, "callbacks", None), getattr(predictor, "callbacks", None)):
+        if cbs:  # the predictor shares the model's dict; cleaning twice is harmless
+            for event in TRACKER_EVENTS:
+                cbs[event] = [f for f in cbs.get(event, []) if not _is_tracker_callback(f)]
+
+def run_tracking(model, source, out, track_kw, flush_every=300, resume=False, id_offset=0,
+                 verbose=True, gate=None, roi=None, live=None):
+    """Track `source` into `out`, streaming results to disk chunk by chunk.
+
+    Track IDs are shifted by `id_offset` (or past the last kept ID when
+    resuming). With a MotionGate, frames without motion reuse the previous
+    frame's boxes and rows get an `inferred` (1/0) column. With an ROI,
+    only its crop is tracked and boxes outside the mask dropped. Each frame's
+    rows also go to `live` (an OnlineSummarizer), if given. Returns (frames
+    processed, rows written). Each call starts a fresh tracker, so one
+    loaded model can be reused for many videos.
+    """
+    reset_tracker(model)
+    resuming = resume and os.path.exists(out)
+    if resuming or gate is not None or roi is not None:
+        start_frame = 1
+        if resuming:
+            start_frame, kept_max = resume_point(out)
+            id_offset = max(id_offset, kept_max)
+            if verbose:
+                print(f"Resuming {out} at frame {start_frame} (track IDs offset by {id_offset})")
+        results = track_frames(model, source, start_frame, track_kw, gate=gate, roi=roi)
+    else:
+        # stream=True yields one Results per frame instead of holding the whole video
+        # (with save=True Ultralytics writes annotated video to runs/track/exp*)
+        results = enumerate(model.track(source=source, stream=True, verbose=verbose,
+                                        persist=True,     # keep IDs across frames
+                                        **track_kw), start=1)
+
+    frame_i, last = 0, []
+    fields = FIELDNAMES + (["inferred"] if gate is not None else [])
+    writer = open_writer(out, flush_every=flush_every, append=resuming, fieldnames=fields)
+    try:
+        for frame_i, r in results:
+            if gate is None:
+                rows = result_rows(r, frame_i, id_offset, roi)
+            elif r is not None:
+                rows = last = [dict(row, inferred=1) for row in result_rows(r, frame_i, id_offset, roi)]
+            else:
+                # static scene: carry the last detector boxes forward
+                rows = [dict(row, frame=frame_i, time=frame_i, inferred=0) for row in last]
+            writer.add_frame(rows)
+            if live is not None:
+                live.add_frame(frame_i, rows)  # emits a window's counts as soon as it closes
+        if live is not None:
+            live.close()
+    finally:
+        writer.close()  # keep whatever was tracked, even on Ctrl+C / crash
+    return frame_i, writer.n_rows
+
+def track_variants(models, source, outs, track_kws, flush_every=300, save_dir=None, fps=None):
+    """Track degraded versions of `source` (make_variants.TRANSFORMS names)
+    in one pass: each frame is decoded once, every variant's transform is
+    applied in memory and its frame goes straight to that variant's model
+    (its own tracker) and writer at `outs[name]`. With `save_dir`, the
+    variant frames are also written there as .mp4 for inspection.
+    Returns (frames processed, {name: rows written}).
+    """
+    names = list(outs)
+    transforms = get_transforms(names)
+    for name in names:
+        reset_tracker(models[name])
+    kws = {n: {k: v for k, v in track_kws[n].items() if k not in ("vid_stride", "save")} for n in names}
+    stride = max(1, track_kws[names[0]].get("vid_stride", 1))
+    writers = {n: open_writer(outs[n], flush_every=flush_every) for n in names}
+    saver = VariantWriters(save_dir, names, fps) if save_dir else None
+    frame_i = 0
+    try:
+        for frame_i, (_, frame) in enumerate(read_frames(source, stride=stride), start=1):
+            for name, fn in transforms:
+                img = fn(frame)
+                r = models[name].track(img, persist=True, verbose=False, **kws[name])[0]
+                writers[name].add_frame(result_rows(r, frame_i))
+                if saver is not None:
+                    saver.add(name, img)
+    finally:
+        for w in writers.values():
+            w.close()
+        if saver is not None:
+            saver.close()
+    return frame_i, {n: w.n_rows for n, w in writers.items()}
+
+def check_reuse(model, source, out, track_kw, **kw):
+    """Track `source` again on the already-used `model` into a scratch file
+    (run_tracking `kw` as for `out`) and compare with `out`: a reused model
+    must give identical rows."""
+    p = Path(out)
+    again = str(p.with_name(f"{p.stem}_reuse{p.suffix}"))
+    run_tracking(model, source, again, dict(track_kw, save=False), verbose=False, **kw)
+    a, b = read_tracks(out), read_tracks(again)
+    same = a.equals(b)
+    print(f"Reuse check: second run on the same model {'identical' if same else 'DIFFERENT'} "
+          f"({len(a)} vs {len(b)} rows)")
+    if is_csv(again):
+        os.remove(again)
+    else:
+        shutil.rmtree(again, ignore_errors=True)
+    return same
+
+def variant_out(out, name):
+    """tracks.trk -> tracks_<name>.trk (same for .csv)."""
+    p = Path(out)
+    return str(p.with_name(f"{p.stem}_{name}{p.suffix}"))
+
+def main_variants(args, track_kw):
+    if args.resume or args.motion_gate or args.roi_mask or args.live_counts:
+        raise SystemExit("--variants cannot be combined with --resume, --gate, --roi_mask or --live_counts")
+    confs = {}
+    for spec in args.variants:
+        name, _, conf = spec.partition("=")
+        confs[name] = float(conf) if conf else args.conf
+    outs = {n: variant_out(args.out, n) for n in confs}
+    kws = {n: dict(track_kw, conf=c) for n, c in confs.items()}
+    models = {n: model_from_args(args, args.imgsz) for n in confs}  # one tracker state per variant
+    fps = video_fps_width(args.source)[0] if args.save_variants else None
+    _, n_rows = track_variants(models, args.source, outs, kws, flush_every=args.flush_every,
+                            save_dir=args.save_variants, fps=fps)
+    for n, path in outs.items():
+        print(f"Wrote: {path} ({n_rows[n]} rows, conf={confs[n]})")
+        if args.rle_tol is not None and not is_csv(path):
+            encode_store(path, args.rle_tol, args.rle_min_run)
+        if args.export_csv and not is_csv(path):
+            print("Wrote:", export_csv(path, variant_out(args.export_csv, n)))
+
 def main():
     here = Path(__file__).resolve().parent
 
-    ap = argparse.ArgumentParser(description="YOLOv8 + ByteTrack to CSV")
+    ap = argparse.ArgumentParser(description="YOLOv8 + ByteTrack to a track store / CSV")
     ap.add_argument("--source", default=str(here / "sample_video.mp4"), help="Path to video file or folder")
     ap.add_argument("--weights", default="yolov8n.pt", help="YOLOv8 weights")
     ap.add_argument("--conf", type=float, default=0.25, help="Confidence threshold")
@@ -23,65 +258,83 @@ def main():
     ap.add_argument("--classes", type=int, nargs="*", default=VEHICLE_CLASSES, help="Class IDs to keep")
     ap.add_argument("--tracker", default="bytetrack.yaml", help="Tracker config (bytetrack.yaml or botsort.yaml)")
     ap.add_argument("--vid_stride", type=int, default=1, help="Process every Nth frame")
-    ap.add_argument("--out_csv", default=str(here / "outputs" / "tracks.csv"), help="Where to write CSV")
+    ap.add_argument("--imgsz", type=int, default=640, help="Inference image size")
+    ap.add_argument("--out", "--out_csv", dest="out", default=str(here / "outputs" / "tracks.trk"),
+                    help="Where to write tracks (track store directory, or a .csv path)")
+    ap.add_argument("--export_csv", default=None, help="Also export the finished tracks to this CSV")
+    ap.add_argument("--flush_every", type=int, default=300, help="Write tracks to disk every N frames")
+    ap.add_argument("--resume", action="store_true",
+                    help="Continue a partial --out from its last complete frame (IDs are offset to stay unique)")
+    add_gate_args(ap)
+    ap.add_argument("--roi_mask", default=None,
+                    help="Curb ROI mask PNG (segmentation/roi_mask.py): track only its crop, drop boxes outside")
+    ap.add_argument("--rle_tol", type=float, default=None,
+                    help="Run-length encode stationary stretches (box within this many px) once tracking ends")
+    ap.add_argument("--rle_min_run", type=int, default=10, help="Shortest stationary stretch (frames) kept as a run")
+    ap.add_argument("--variants", nargs="+", default=None,
+                    help=f"Track degraded copies instead, name[=conf] each (registered: {sorted(TRANSFORMS)}); "
+                         "writes <out>_<name> per variant")
+    ap.add_argument("--save_variants", default=None,
+                    help="With --variants: also write the degraded frames as <dir>/<name>.mp4 to inspect them")
+    ap.add_argument("--check_reuse", action="store_true",
+                    help="Track the source a second time on the same loaded model and check the rows match")
+    add_backend_args(ap)
+    add_online_args(ap)
     args = ap.parse_args()
 
-    os.makedirs(Path(args.out_csv).parent, exist_ok=True)
+    os.makedirs(Path(args.out).parent, exist_ok=True)
 
-    # Load model
-    model = YOLO(args.weights)
-
-    # Run tracking (Ultralytics writes annotated video to runs/track/exp*)
-    results = model.track(
-        source=args.source,
+    track_kw = dict(
         conf=args.conf,
         iou=args.iou,
+        imgsz=args.imgsz,
         classes=args.classes if args.classes else None,
         tracker=args.tracker,
-        persist=True,     # keep IDs across frames
         save=True,        # save annotated video
         vid_stride=args.vid_stride
     )
 
-    # Collect per-frame data
-    rows = []
-    frame_i = 0
+    if args.variants:
+        return main_variants(args, track_kw)
 
-    for r in results:
-        frame_i += 1
-        boxes = getattr(r, "boxes", None)
-        if boxes is None or len(boxes) == 0:
-            continue
-
-        # Safely extract tensors
-        xyxy = boxes.xyxy.cpu().numpy() if getattr(boxes, "xyxy", None) is not None else []
-        ids  = boxes.id.cpu().numpy()   if getattr(boxes, "id",   None) is not None else [-1]*len(xyxy)
-        clss = boxes.cls.cpu().numpy()  if getattr(boxes, "cls",  None) is not None else [-1]*len(xyxy)
-        conf = boxes.conf.cpu().numpy() if getattr(boxes, "conf", None) is not None else [0]*len(xyxy)
-
-        for (x1, y1, x2, y2), tid, c, p in zip(xyxy, ids, clss, conf):
-            rows.append({
-                "frame": frame_i,
-                "time": frame_i,                # use frame index as time proxy (you can map to seconds later)
-                "id": int(tid) if tid is not None else -1,
-                "xmin": float(x1), "ymin": float(y1),
-                "xmax": float(x2), "ymax": float(y2),
-                "conf": float(p),
-                "cls": int(c)
-            })
-
-    if not rows:
-        raise SystemExit("No tracks were produced. Try lowering --conf, removing --classes, or converting your video to .mp4")
+    # Load model (exported + cached on first use for non-torch backends)
+    model = model_from_args(args, args.imgsz)
+
+    resuming = args.resume and os.path.exists(args.out)
+    gate = gate_from_args(args)
+    roi = load_roi(args.roi_mask) if args.roi_mask else None
+    live = None
+    if args.live_counts:
+        fps, width = video_fps_width(args.source)
+        live = summarizer_from_args(args, args.live_counts, fps, width)
+    _, n_rows = run_tracking(model, args.source, args.out, track_kw, flush_every=args.flush_every,
+                             resume=args.resume, gate=gate, roi=roi, live=live)
+    if roi is not None and roi.shape:
+        print(f"ROI crop: detector saw {100 * roi.pixel_fraction():.1f}% of each frame's pixels")
+    if gate is not None:
+        rep_path = str(args.out) + ".gate.json"
+        rep = gate.write_report(rep_path)
+        print(f"Motion gate: detector ran on {rep['inferred']}/{rep['frames']} frames "
+              f"({100 * rep['skipped_fraction']:.1f}% skipped) -> {rep_path}")
 
-    # Write CSV
-    with open(args.out_csv, "w", newline="", encoding="utf-8") as f:
-        fieldnames = list(rows[0].keys())
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(rows)
+    if not n_rows and not resuming:
+        raise SystemExit("No tracks were produced. Try lowering --conf, removing --classes, or converting your video to .mp4")
 
-    print(f"Wrote: {args.out_csv}")
-    print("Annotated video is in runs/track/exp*/ (Ultralytics default)")
+    print(f"Wrote: {args.out} ({n_rows} rows)")
+    if args.rle_tol is not None and not is_csv(args.out):
+        rle = read_meta(encode_store(args.out, args.rle_tol, args.rle_min_run))["rle"]
+        print(f"Run-length encoded: {rle['rows_in_runs']}/{rle['n_rows_total']} rows in {rle['n_runs']} runs")
+    if args.export_csv and not is_csv(args.out):
+        print("Wrote:", export_csv(args.out, args.export_csv))
+    if live is not None:
+        print(f"Wrote: {args.live_counts} ({live.windows} live windows)")
+    if not resuming and gate is None and roi is None:
+        print("Annotated video is in runs/track/exp*/ (Ultralytics default)")
+    if args.check_reuse:
+        if resuming or live is not None:
+            raise SystemExit("--check_reuse needs a full run (no --resume / --live_counts)")
+        if not check_reuse(model, args.source, args.out, track_kw, gate=gate_from_args(args), roi=roi):
+            raise SystemExit(1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,149 @@
+# det_track/track_batch.py
+# Track many curb videos in parallel: videos are sharded over a process pool,
+# each worker loads YOLO once and reuses it for every video it gets.
+# Usage (from project root):
+#   python det_track/track_batch.py --source videos/ --workers 8
+#   python det_track/track_batch.py --manifest night_001.txt --outdir det_track/outputs/night_001
+#
+# Each video gets its own <outdir>/<name>.trk. Track IDs are made globally
+# unique by offsetting video k's IDs by k * ID_STRIDE (so id // ID_STRIDE is
+# the stream index). <outdir>/throughput.json has frames/s per video, per
+# worker and overall.
+
+import argparse, json, os, time
+from multiprocessing import Pool
+from pathlib import Path
+from ultralytics import YOLO
+import cv2
+from track import VEHICLE_CLASSES, run_tracking
+
+VIDEO_EXTS = {".mp4", ".avi", ".mov", ".mkv", ".webm", ".m4v"}
+ID_STRIDE = 1_000_000  # int32 ids leave room for ~2000 streams
+
+_model = None  # one per worker process
+
+def _init_worker(weights, threads):
+    global _model
+    import torch
+    torch.set_num_threads(threads)  # split the cores instead of every worker using all of them
+    _model = YOLO(weights)
+
+def list_videos(source=None, manifest=None):
+    """Videos from a folder (sorted) or a manifest with one path per line."""
+    if manifest:
+        base = Path(manifest).resolve().parent
+        paths = []
+        for line in Path(manifest).read_text(encoding="utf-8").splitlines():
+            line = line.strip()
+            if line and not line.startswith("#"):
+                p = Path(line)
+                paths.append(p if p.is_absolute() else base / p)
+        return paths
+    src = Path(source)
+    if src.is_file():
+        return [src]
+    return sorted(p for p in src.iterdir() if p.suffix.lower() in VIDEO_EXTS)
+
+def output_names(videos, ext):
+    """<stem><ext>, disambiguated with the stream index when stems repeat."""
+    stems = [v.stem for v in videos]
+    return [f"{s}{ext}" if stems.count(s) == 1 else f"{s}_{k:04d}{ext}" for k, s in enumerate(stems)]
+
+def _track_one(task):
+    k, video, out, track_kw, flush_every = task
+    t0 = time.perf_counter()
+    frames, rows = run_tracking(_model, str(video), out, track_kw,
+                                flush_every=flush_every, id_offset=k * ID_STRIDE, verbose=False)
+    dt = time.perf_counter() - t0
+    return {"stream": k, "video": str(video), "out": out, "worker": os.getpid(),
+            "frames": frames, "rows": rows, "seconds": round(dt, 3),
+            "fps": round(frames / dt, 2) if dt > 0 else 0.0}
+
+def main():
+    ap = argparse.ArgumentParser(description="Parallel YOLOv8 + ByteTrack over many videos")
+    ap.add_argument("--source", default=None, help="Folder of videos (or a single video)")
+    ap.add_argument("--manifest", default=None, help="Text file with one video path per line")
+    ap.add_argument("--outdir", default="det_track/outputs/batch", help="One output per video goes here")
+    ap.add_argument("--format", choices=["trk", "csv"], default="trk", help="Per-video output format")
+    ap.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                    help="Worker processes (each holds one model)")
+    ap.add_argument("--weights", default="yolov8n.pt", help="YOLOv8 weights")
+    ap.add_argument("--conf", type=float, default=0.25, help="Confidence threshold")
+    ap.add_argument("--iou", type=float, default=0.5, help="NMS IoU threshold")
+    ap.add_argument("--classes", type=int, nargs="*", default=VEHICLE_CLASSES, help="Class IDs to keep")
+    ap.add_argument("--tracker", default="bytetrack.yaml", help="Tracker config (bytetrack.yaml or botsort.yaml)")
+    ap.add_argument("--vid_stride", type=int, default=1, help="Process every Nth frame")
+    ap.add_argument("--flush_every", type=int, default=300, help="Write tracks to disk every N frames")
+    ap.add_argument("--skip_done", action="store_true", help="Skip videos whose output already exists")
+    args = ap.parse_args()
+
+    if not (args.source or args.manifest):
+        raise SystemExit("Give --source (folder) or --manifest")
+    videos = list_videos(args.source, args.manifest)
+    if not videos:
+        raise SystemExit("No videos found.")
+    if len(videos) * ID_STRIDE > 2**31 - 1:
+        raise SystemExit(f"Too many videos for int32 track IDs ({len(videos)}); split the manifest.")
+
+    os.makedirs(args.outdir, exist_ok=True)
+    track_kw = dict(conf=args.conf, iou=args.iou,
+                    classes=args.classes if args.classes else None,
+                    tracker=args.tracker, save=False, vid_stride=args.vid_stride)
+    names = output_names(videos, "." + args.format)
+
+    tasks = []
+    for k, (video, name) in enumerate(zip(videos, names)):
+        out = os.path.join(args.outdir, name)
+        if args.skip_done and os.path.exists(os.path.join(out, "meta.json") if args.format == "trk" else out):
+            continue
+        tasks.append((k, video, out, track_kw, args.flush_every))
+
+    # longest videos first so the pool does not end on one straggler
+    def n_frames(v):
+        cap = cv2.VideoCapture(str(v)); n = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0); cap.release()
+        return n
+    tasks.sort(key=lambda t: -n_frames(t[1]))
+
+    workers = max(1, min(args.workers, len(tasks)))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    print(f"Tracking {len(tasks)} video(s) on {workers} worker(s)")
+    t0 = time.perf_counter()
+    per_video = []
+    if tasks:
+        with Pool(workers, initializer=_init_worker, initargs=(args.weights, threads)) as pool:
+            for res in pool.imap_unordered(_track_one, tasks):
+                per_video.append(res)
+                print(f"  [{len(per_video)}/{len(tasks)}] {Path(res['video']).name}: "
+                      f"{res['frames']} frames, {res['fps']:.1f} fps -> {res['out']}")
+    wall = time.perf_counter() - t0
+
+    # --- throughput report
+    per_worker = {}
+    for r in per_video:
+        w = per_worker.setdefault(r["worker"], {"videos": 0, "frames": 0, "seconds": 0.0})
+        w["videos"] += 1; w["frames"] += r["frames"]; w["seconds"] += r["seconds"]
+    for w in per_worker.values():
+        w["seconds"] = round(w["seconds"], 3)
+        w["fps"] = round(w["frames"] / w["seconds"], 2) if w["seconds"] else 0.0
+    total_frames = sum(r["frames"] for r in per_video)
+    report = {
+        "workers": workers, "videos": len(per_video), "frames": total_frames,
+        "wall_seconds": round(wall, 3),
+        "overall_fps": round(total_frames / wall, 2) if wall > 0 else 0.0,
+        "id_stride": ID_STRIDE,
+        "per_worker": {str(pid): w for pid, w in per_worker.items()},
+        "per_video": sorted(per_video, key=lambda r: r["stream"]),
+    }
+    out_json = os.path.join(args.outdir, "throughput.json")
+    with open(out_json, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print("\n| worker | videos | frames | fps    |")
+    print("|--------|--------|--------|--------|")
+    for pid, w in per_worker.items():
+        print(f"| {pid:<6} | {w['videos']:>6} | {w['frames']:>6} | {w['fps']:>6.1f} |")
+    print(f"Overall: {total_frames} frames in {wall:.1f}s = {report['overall_fps']:.1f} fps")
+    print("Wrote:", out_json)
+
+if __name__ == "__main__":
+    main()
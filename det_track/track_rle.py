@@ -0,0 +1,318 @@
+# det_track/track_rle.py
+# Run-length encoding of stationary stretches in a track store.
+# Usage (from project root):
+#   python det_track/track_rle.py encode det_track/outputs/tracks.trk det_track/outputs/tracks_rle.trk
+#   python det_track/track_rle.py decode det_track/outputs/tracks_rle.trk det_track/outputs/tracks_plain.trk
+#   python det_track/track_rle.py stats  det_track/outputs/tracks.trk det_track/outputs/tracks_rle.trk
+#   python det_track/track.py --rle_tol 1.0 ...          # encode tracks.trk as soon as tracking ends
+#
+# A run is >= --min_run consecutive frames of one ID in which no box corner
+# spreads over more than 2 * --tol px (and whose other columns, e.g. cls, do
+# not change); the mean lies inside that spread, so a corner can be up to
+# 2 * --tol px from the run's mean box. It is kept once: id, frame (first)
+# .. end_frame, mean box, mean conf, and jitter_max / jitter_rms = max / RMS
+# corner deviation from the mean box in px. All other rows stay per frame.
+# Expanded, a run gives one row per frame with the mean box - lossy by at most
+# jitter_max px. Columns that follow from the frame or the box are not stored
+# but rebuilt: equal to the frame (track.py's "time", exactly), affine in it
+# (time_sec) or the box centre (cx, cy). Other float columns, the speeds of
+# tracks_with_speed, only need to stay within 2 * --tol and keep their mean.
+#
+# Layout: an ordinary store of the per-frame rows, plus runs/ (a store of the
+# runs, sorted by (id, frame)) and meta["rle"]. The track_store readers expand
+# runs transparently and only where asked: read_store just the runs that
+# overlap the requested frames / IDs, iter_frame_chunks one chunk's frames at
+# a time. read_runs() hands the runs themselves to readers that need no rows.
+
+import argparse, json, time
+from pathlib import Path
+import numpy as np
+from track_store import read_meta, read_store, write_store, read_tracks, write_tracks, is_csv, iter_frame_chunks
+
+BOX = ["xmin", "ymin", "xmax", "ymax"]
+MAX_RUN = 4096  # longest run searched at once; longer stillness just becomes several runs
+
+def find_runs(cols, tol=1.0, min_run=10, same=(), near=()):
+    """[start, end] row ranges of stationary runs in rows sorted by (id, frame).
+    Columns in `same` must not change within a run; columns in `near` (e.g.
+    speeds) must spread no more than 2 tol, like the box corners."""
+    ids, frames = cols["id"], cols["frame"].astype(np.int64)
+    box = np.stack([cols[c] for c in BOX], axis=1).astype(np.float64)
+    n = len(ids)
+    # steps within 2 tol are necessary for a spread within 2 tol: they pick the candidate blocks
+    step = np.zeros(n, dtype=bool)
+    step[1:] = (ids[1:] == ids[:-1]) & (frames[1:] - frames[:-1] == 1) & \
+               (np.abs(np.diff(box, axis=0)) <= 2 * tol).all(axis=1)
+    for c in same:
+        step[1:] &= cols[c][1:] == cols[c][:-1]
+    vals = [box]
+    for c in near:
+        v = cols[c].astype(np.float64)
+        nan = np.isnan(v)
+        step[1:] &= (nan[1:] & nan[:-1]) | (np.abs(np.diff(v)) <= 2 * tol)  # NaN-ness never changes in a run
+        vals.append(np.where(nan, 0.0, v)[:, None])
+    box = np.hstack(vals)
+    bs = np.flatnonzero(~step)
+    be = np.r_[bs[1:], n] - 1
+    long_enough = be - bs + 1 >= min_run
+    starts, ends = [], []
+    for s, e in zip(bs[long_enough], be[long_enough]):
+        while e - s + 1 >= min_run:
+            w = box[s:min(e + 1, s + MAX_RUN)]
+            spread = np.maximum.accumulate(w, axis=0) - np.minimum.accumulate(w, axis=0)
+            far = (spread > 2 * tol).any(axis=1)
+            k = int(np.argmax(far)) if far.any() else len(w)
+            if k >= min_run:
+                starts.append(s)
+                ends.append(s + k - 1)
+            s += k
+    return np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64)
+
+def derive_rules(cols):
+    """Columns a run can rebuild instead of storing: {column: rule} with rule
+    "frame" (equal to the frame number, track.py's "time"), "cx" / "cy" (box
+    centre, as summarize_tracks computes it) or ["affine", a, b] (a * frame
+    + b to float precision, e.g. time_sec)."""
+    frames = cols["frame"]
+    f = frames.astype(np.float64)
+    box = {c: cols[c].astype(np.float64) for c in BOX}
+    centre = {"cx": (box["xmin"] + box["xmax"]) / 2.0, "cy": (box["ymin"] + box["ymax"]) / 2.0}
+    rules = {}
+    for c, v in cols.items():
+        if c in ["frame", "id", "conf"] + BOX or not len(v):
+            continue
+        if np.array_equal(v, frames):
+            rules[c] = "frame"
+            continue
+        if v.dtype.kind != "f":
+            continue
+        v = v.astype(np.float64)
+        hit = next((k for k, m in centre.items() if np.allclose(v, m, rtol=1e-6, atol=1e-6)), None)
+        if hit:
+            rules[c] = hit
+        elif f[-1] != f[0] and not np.isnan(v).any():
+            a = (v[-1] - v[0]) / (f[-1] - f[0])
+            b = v[0] - a * f[0]
+            if np.abs(a * f + b - v).max() <= 1e-9 * max(1.0, np.abs(v).max()):
+                rules[c] = ["affine", float(a), float(b)]
+    return rules
+
+def _rules(derived):
+    # stores written before rebuild rules listed frame-equal columns only
+    return {c: "frame" for c in derived} if isinstance(derived, list) else derived
+
+def rebuild(rule, frame, box):
+    """A derived column's values at `frame` for runs with mean boxes `box` (dict)."""
+    if rule == "frame":
+        return frame
+    if rule == "cx":
+        return (box["xmin"].astype(np.float64) + box["xmax"]) / 2.0
+    if rule == "cy":
+        return (box["ymin"].astype(np.float64) + box["ymax"]) / 2.0
+    _, a, b = rule
+    return a * frame.astype(np.float64) + b
+
+def encode(cols, tol=1.0, min_run=10):
+    """Split columns (sorted by (id, frame)) into per-frame rows and runs.
+    Returns (rows, runs, derived): `derived` maps columns the runs rebuild
+    (see derive_rules) to their rule. Other float columns (speeds) must stay
+    within 2 tol and are kept as the run's mean; the rest must not change."""
+    frames = cols["frame"]
+    derived = derive_rules(cols)
+    rest = [c for c in cols if c not in ["frame", "id", "conf"] + BOX and c not in derived]
+    near = [c for c in rest if cols[c].dtype.kind == "f"]
+    same = [c for c in rest if c not in near]
+    s, e = find_runs(cols, tol, min_run, same, near)
+    n_run = e - s + 1
+    rows_in = np.repeat(s, n_run) + (np.arange(n_run.sum()) - np.repeat(np.cumsum(n_run) - n_run, n_run))
+    in_run = np.zeros(len(frames), dtype=bool)
+    in_run[rows_in] = True
+
+    offsets = np.cumsum(n_run) - n_run
+    box = np.stack([cols[c] for c in BOX], axis=1).astype(np.float64)[rows_in]
+    mean = np.add.reduceat(box, offsets, axis=0) / n_run[:, None] if len(s) else np.zeros((0, 4))
+    dev = box - np.repeat(mean, n_run, axis=0)
+    runs = {"id": cols["id"][s], "frame": frames[s], "end_frame": frames[e]}
+    runs.update({c: mean[:, i].astype(cols[c].dtype) for i, c in enumerate(BOX)})
+    if "conf" in cols:
+        conf = cols["conf"].astype(np.float64)[rows_in]
+        runs["conf"] = (np.add.reduceat(conf, offsets) / n_run if len(s) else conf).astype(cols["conf"].dtype)
+    runs.update({c: cols[c][s] for c in same})
+    for c in near:  # NaN for runs that are NaN throughout (e.g. speed_ma before its window fills)
+        v = cols[c].astype(np.float64)[rows_in]
+        runs[c] = (np.add.reduceat(v, offsets) / n_run if len(s) else v).astype(cols[c].dtype)
+    runs["jitter_max"] = (np.maximum.reduceat(np.abs(dev).max(axis=1), offsets) if len(s)
+                          else np.zeros(0)).astype(np.float32)
+    runs["jitter_rms"] = (np.sqrt(np.add.reduceat((dev ** 2).mean(axis=1), offsets) / n_run) if len(s)
+                          else np.zeros(0)).astype(np.float32)
+    return {c: v[~in_run] for c, v in cols.items()}, runs, derived
+
+def write_rle_store(path, cols, tol=1.0, min_run=10):
+    """write_store() with stationary stretches run-length encoded."""
+    if hasattr(cols, "columns"):  # DataFrame
+        cols = {c: cols[c].to_numpy() for c in cols.columns}
+    cols = {c: np.asarray(v) for c, v in cols.items()}
+    if "id" not in cols:
+        raise SystemExit("Only track files (with an id column) can be run-length encoded")
+    order = np.lexsort((cols["frame"], cols["id"]))
+    rows, runs, derived = encode({c: v[order] for c, v in cols.items()}, tol, min_run)
+    path = Path(path)
+    write_store(path, rows)
+    write_store(path / "runs", runs)
+    meta = read_meta(path)
+    n_in_runs = int((runs["end_frame"].astype(np.int64) - runs["frame"] + 1).sum())
+    meta["rle"] = {"tol": tol, "min_run": min_run, "derived": derived, "n_runs": int(len(runs["id"])),
+                   "rows_in_runs": n_in_runs, "n_rows_total": int(meta["n_rows"]) + n_in_runs}
+    (path / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    return path
+
+def encode_store(path, tol=1.0, min_run=10, dst=None):
+    """Encode a finished store (or CSV) in place, or into `dst`."""
+    cols = read_tracks(path) if is_csv(path) else read_store(path, mmap=False)
+    return write_rle_store(dst or path, cols, tol, min_run)
+
+def read_runs(path, columns=None):
+    """The runs of an encoded store as a dict of arrays (None for a plain
+    store); derived columns come back as their value at each run's first frame."""
+    meta = read_meta(path)
+    if not meta.get("rle"):
+        return None
+    derived = _rules(meta["rle"]["derived"])
+    stored = list(read_meta(Path(path) / "runs")["columns"])
+    want = stored + [c for c in derived if c not in stored] if columns is None else list(columns)
+    load = [c for c in want if c in stored]
+    runs = read_store(Path(path) / "runs", load + [c for c in BOX + ["frame"] if c not in load])
+    dtypes = {c: np.dtype(t) for c, t in meta["columns"].items()}
+    return {c: runs[c] if c in stored else rebuild(derived[c], runs["frame"], runs).astype(dtypes[c])
+            for c in want}
+
+def expand_runs(runs, columns, derived, dtypes, frames=None):
+    """One row per frame for each run, optionally clipped to frames=(lo, hi)."""
+    s = runs["frame"].astype(np.int64)
+    e = runs["end_frame"].astype(np.int64)
+    if frames is not None:
+        s, e = np.maximum(s, frames[0]), np.minimum(e, frames[1])
+    n = np.maximum(e - s + 1, 0)
+    rep = np.repeat(np.arange(len(s)), n)
+    frame = s[rep] + (np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n))
+    derived = _rules(derived)
+    box = {c: np.asarray(runs[c])[rep] for c in BOX}
+    out = {}
+    for c in columns:
+        if c == "frame":
+            out[c] = frame.astype(dtypes[c])
+        elif c in derived:
+            out[c] = rebuild(derived[c], frame, box).astype(dtypes[c])
+        else:
+            out[c] = np.asarray(runs[c])[rep].astype(dtypes[c], copy=False)
+    return out
+
+def merge_runs(path, meta, rows, frames=None, ids=None, order="store"):
+    """Add the expanded runs (those overlapping frames / IDs) to per-frame
+    columns read from the store; `rows` must include frame and id."""
+    runs = read_store(Path(path) / "runs")
+    keep = np.ones(len(runs["id"]), dtype=bool)
+    if frames is not None:
+        keep &= (runs["frame"] <= frames[1]) & (runs["end_frame"] >= frames[0])
+    if ids is not None:
+        keep &= np.isin(runs["id"], np.asarray(ids))
+    runs = {c: np.asarray(v)[keep] for c, v in runs.items()}
+    dtypes = {c: np.dtype(t) for c, t in meta["columns"].items()}
+    extra = expand_runs(runs, list(rows), meta["rle"]["derived"], dtypes, frames)
+    # both parts are sorted already (runs expand in (id, frame) order): merge
+    # them on a packed key instead of sorting everything again
+    def key(cols, o):
+        i, f = cols["id"].astype(np.int64), cols["frame"].astype(np.int64)
+        return f * 2**32 + i if o == "frame" else i * 2**32 + f
+    if order == "frame":
+        ek = key(extra, "frame")
+        srt = np.argsort(ek, kind="stable")
+        extra, ek = {c: v[srt] for c, v in extra.items()}, ek[srt]
+    else:
+        ek = key(extra, order)
+    n_rows, n_extra = len(rows["id"]), len(ek)
+    pos = np.searchsorted(key(rows, order), ek) + np.arange(n_extra)
+    from_rows = np.ones(n_rows + n_extra, dtype=bool)
+    from_rows[pos] = False
+    out = {}
+    for c in rows:
+        v = np.empty(n_rows + n_extra, dtype=extra[c].dtype)
+        v[from_rows] = rows[c]
+        v[pos] = extra[c]
+        out[c] = v
+    return out
+
+def frame_chunks(path, meta, chunk_rows):
+    """Inclusive frame ranges holding about `chunk_rows` expanded rows each."""
+    key = "frame_keys" if meta["sort_key"][0] == "id" else "frame"
+    res = np.load(Path(path) / f"{key}.npy", mmap_mode="r") if meta["n_rows"] else np.zeros(0, np.int64)
+    runs = read_store(Path(path) / "runs", ["frame", "end_frame"])
+    s, e = runs["frame"].astype(np.int64), runs["end_frame"].astype(np.int64)
+    if not len(res) and not len(s):
+        return []
+    f0 = int(min(res[0] if len(res) else s.min(), s.min() if len(s) else res[0]))
+    f1 = int(max(res[-1] if len(res) else e.max(), e.max() if len(e) else res[-1]))
+    per_frame = np.bincount(np.asarray(res, dtype=np.int64) - f0, minlength=f1 - f0 + 1)
+    delta = np.zeros(f1 - f0 + 2, dtype=np.int64)
+    np.add.at(delta, s - f0, 1)
+    np.add.at(delta, e - f0 + 1, -1)
+    cum = np.cumsum(per_frame + np.cumsum(delta)[:-1])
+    out, i = [], 0
+    while i <= f1 - f0:
+        done = cum[i - 1] if i else 0
+        j = min(int(np.searchsorted(cum, done + chunk_rows, "left")), f1 - f0)  # finish the frame
+        out.append((f0 + i, f0 + j))
+        i = j + 1
+    return out
+
+def dir_mb(path):
+    p = Path(path)
+    if p.is_file():
+        return p.stat().st_size / 1e6
+    return sum(f.stat().st_size for f in p.rglob("*") if f.is_file()) / 1e6
+
+def stats(plain, rle):
+    meta = read_meta(rle)["rle"]
+    print(f"{rle}: {meta['n_runs']:,} runs hold {meta['rows_in_runs']:,} of {meta['n_rows_total']:,} rows "
+          f"(tol {meta['tol']} px, min_run {meta['min_run']})")
+    runs = read_runs(rle, ["jitter_max"])
+    if len(runs["jitter_max"]):
+        print(f"jitter_max: median {np.median(runs['jitter_max']):.2f} px, max {runs['jitter_max'].max():.2f} px")
+    print("\n| file | MB | read all rows s | distinct IDs s | chunked pass s |")
+    print("|------|----|------------|-----------------|----------------|")
+    for p in [plain, rle]:
+        read_tracks(p)  # warm the page cache so both files are timed alike
+        t = time.perf_counter(); read_tracks(p).sum(numeric_only=True); t_all = time.perf_counter() - t
+        t = time.perf_counter()
+        r = read_runs(p, ["id"]) if not is_csv(p) else None
+        if r is not None:  # distinct IDs without expanding anything
+            np.union1d(read_store(p, ["id"], runs=False)["id"], r["id"])
+        else:
+            np.unique(read_tracks(p, ["id"])["id"])
+        t_ids = time.perf_counter() - t
+        t = time.perf_counter()
+        for _ in iter_frame_chunks(p, ["frame", "id", "xmin", "xmax"], 100_000):
+            pass
+        t_chunk = time.perf_counter() - t
+        print(f"| {p} | {dir_mb(p):.2f} | {t_all:.3f} | {t_ids:.3f} | {t_chunk:.3f} |")
+
+def main():
+    ap = argparse.ArgumentParser(description="Run-length encode stationary stretches of a track store")
+    ap.add_argument("cmd", choices=["encode", "decode", "stats"])
+    ap.add_argument("src")
+    ap.add_argument("dst")
+    ap.add_argument("--tol", type=float, default=1.0, help="half the max corner spread (px) within a run; corners stay within 2 tol of its mean box")
+    ap.add_argument("--min_run", type=int, default=10, help="shortest stationary stretch (frames) kept as a run")
+    args = ap.parse_args()
+
+    if args.cmd == "stats":
+        stats(args.src, args.dst)
+        return
+    if args.cmd == "encode":
+        encode_store(args.src, args.tol, args.min_run, dst=args.dst)
+    else:  # expanded rows, as a plain store or CSV
+        write_tracks(args.dst, read_tracks(args.src))
+    print("Wrote:", args.dst)
+
+if __name__ == "__main__":
+    main()
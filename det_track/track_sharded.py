@@ -0,0 +1,204 @@
+# det_track/track_sharded.py
+# Track one long video on many cores: split it into time chunks, track each
+# chunk in its own process (model.track(persist=True) from a lead-in before
+# the chunk start), then stitch track IDs across every seam by matching boxes
+# in the overlap window. The result has globally consistent IDs.
+# Usage (from project root):
+#   python det_track/track_sharded.py --source curb_8h.mp4 --workers 16 --chunk_min 30
+#
+# Chunk k tracks frames [start_k - overlap, end_k]; the lead-in overlaps the
+# end of chunk k-1. In that window, chunk k's IDs are matched to chunk k-1's
+# (mutual best IoU >= --match_iou, voted over frames) and renamed; the
+# lead-in rows themselves are dropped, and IDs seen only there get no global
+# ID. Chunks are relabelled and streamed into the output one at a time.
+# <out>.stitch.json lists the merges.
+
+import argparse, json, math, os, shutil, time
+from multiprocessing import Pool
+from pathlib import Path
+import numpy as np
+import cv2
+from ultralytics import YOLO
+from track import VEHICLE_CLASSES, track_frames, result_rows, reset_tracker
+from track_store import open_writer, read_store, export_csv, is_csv, ChunkedStoreWriter, FIELDNAMES
+from boxes import iou_matrix, greedy_match
+
+_model = None  # one per worker process
+
+def _init_worker(weights, threads):
+    global _model
+    import torch
+    torch.set_num_threads(threads)
+    _model = YOLO(weights)
+
+def plan_chunks(n_frames, chunk_len, overlap):
+    """[(track_from, start, end)] in processed-frame units (1-based, inclusive)."""
+    chunks = []
+    for start in range(1, n_frames + 1, chunk_len):
+        end = min(n_frames, start + chunk_len - 1)
+        chunks.append((max(1, start - overlap), start, end))
+    return chunks
+
+def _track_chunk(task):
+    k, source, out, track_kw, (frm, start, end) = task
+    reset_tracker(_model)
+    t0 = time.perf_counter()
+    writer = open_writer(out, flush_every=1000)
+    n = 0
+    try:
+        for frame_i, r in track_frames(_model, source, frm, track_kw, stop_frame=end):
+            writer.add_frame(result_rows(r, frame_i))
+            n += 1
+    finally:
+        writer.close()
+    return k, n, time.perf_counter() - t0
+
+def match_ids(prev, cur, frames, match_iou=0.5, min_frames=3):
+    """Vote chunk-k IDs onto chunk-(k-1) IDs over the overlap `frames`.
+
+    prev / cur are column dicts (frame, id, boxes). A pair gets a vote on
+    each frame where the two boxes are each other's best IoU >= match_iou;
+    pairs are then taken greedily by votes (one-to-one, >= min_frames).
+    Returns {cur_id: prev_id}.
+    """
+    votes = []
+    for f in frames:
+        p = np.flatnonzero(prev["frame"] == f); c = np.flatnonzero(cur["frame"] == f)
+        p = p[prev["id"][p] >= 0]; c = c[cur["id"][c] >= 0]
+        if not len(p) or not len(c):
+            continue
+        box = lambda d, i: np.stack([d["xmin"][i], d["ymin"][i], d["xmax"][i], d["ymax"][i]], axis=1)
+        iou = iou_matrix(box(prev, p), box(cur, c))
+        bi, bj = iou.argmax(axis=1), iou.argmax(axis=0)
+        i = np.arange(len(p))
+        mutual = (bj[bi] == i) & (iou[i, bi] >= match_iou)
+        votes.append(np.stack([cur["id"][c[bi[mutual]]], prev["id"][p[i[mutual]]]], axis=1))
+    if not votes:
+        return {}
+    votes = np.concatenate(votes)
+    cids, ci = np.unique(votes[:, 0], return_inverse=True)
+    pids, pi = np.unique(votes[:, 1], return_inverse=True)
+    tally = np.zeros((len(cids), len(pids)))
+    np.add.at(tally, (ci, pi), 1)
+    match, _ = greedy_match(tally, min_frames)
+    return {int(cids[i]): int(pids[j]) for i, j in enumerate(match) if j >= 0}
+
+def stitch(chunk_paths, chunks, overlap, writer, match_iou=0.5, min_frames=3):
+    """Relabel every chunk onto global IDs and stream its rows (lead-in
+    dropped) into `writer`, a ChunkedStoreWriter; only one chunk and the
+    previous chunk's tail are in memory. Returns (global IDs, seam report)."""
+    report = []
+    prev, next_id = None, 1
+    for path, (frm, start, end) in zip(chunk_paths, chunks):
+        cols = {c: np.asarray(v) for c, v in read_store(path, order="frame").items()}
+        mapping = {}
+        if prev is not None:
+            window = range(frm, start)
+            mapping = match_ids(prev, cols, window, match_iou, min_frames)
+            in_window = np.unique(cols["id"][(cols["frame"] < start) & (cols["id"] >= 0)])
+        core = cols["frame"] >= start  # drop the lead-in; chunk k-1 already covers it
+        cols = {c: v[core] for c, v in cols.items()}
+        ids = cols["id"]
+        # only IDs with rows past the lead-in need a global ID; unmatched ones get fresh IDs
+        local = np.unique(ids[ids >= 0])
+        vals = np.empty(len(local), dtype=np.int64)
+        merged = 0
+        for k, lid in enumerate(local.tolist()):
+            if lid in mapping:
+                vals[k] = mapping[lid]; merged += 1
+            else:
+                vals[k] = next_id; next_id += 1
+        new_ids = ids.astype(np.int64).copy()
+        if len(local):
+            pos = np.searchsorted(local, ids[ids >= 0])  # local comes from np.unique -> sorted
+            new_ids[ids >= 0] = vals[pos]
+        cols["id"] = new_ids.astype(np.int32)
+        if prev is not None:
+            report.append({"seam_frame": start, "ids_in_window": int(len(in_window)),
+                           "merged": merged, "new_ids": int(len(local) - merged)})
+        writer.write({c: cols[c] for c in FIELDNAMES})
+        # the tail of this chunk is the next seam's reference (already in global IDs)
+        tail = cols["frame"] > end - overlap
+        prev = {c: v[tail] for c, v in cols.items()}
+    return next_id - 1, report
+
+def main():
+    here = Path(__file__).resolve().parent
+
+    ap = argparse.ArgumentParser(description="Time-sharded parallel tracking of one long video")
+    ap.add_argument("--source", required=True, help="Single video file")
+    ap.add_argument("--out", default=str(here / "outputs" / "tracks.trk"),
+                    help="Where to write tracks (track store directory, or a .csv path)")
+    ap.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    ap.add_argument("--chunk_min", type=float, default=30.0, help="Chunk length in minutes of video")
+    ap.add_argument("--overlap", type=int, default=60,
+                    help="Lead-in frames (processed frames) shared with the previous chunk")
+    ap.add_argument("--match_iou", type=float, default=0.5, help="IoU to pair boxes across a seam")
+    ap.add_argument("--min_frames", type=int, default=3, help="Overlap frames a pair needs to be merged")
+    ap.add_argument("--weights", default="yolov8n.pt", help="YOLOv8 weights")
+    ap.add_argument("--conf", type=float, default=0.25, help="Confidence threshold")
+    ap.add_argument("--iou", type=float, default=0.5, help="NMS IoU threshold")
+    ap.add_argument("--classes", type=int, nargs="*", default=VEHICLE_CLASSES, help="Class IDs to keep")
+    ap.add_argument("--tracker", default="bytetrack.yaml", help="Tracker config (bytetrack.yaml or botsort.yaml)")
+    ap.add_argument("--vid_stride", type=int, default=1, help="Process every Nth frame")
+    ap.add_argument("--keep_chunks", action="store_true", help="Keep the per-chunk outputs")
+    args = ap.parse_args()
+
+    cap = cv2.VideoCapture(args.source)
+    if not cap.isOpened():
+        raise SystemExit(f"Cannot open video: {args.source}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    cap.release()
+    if total <= 0:
+        raise SystemExit("Video has no frame count; cannot plan chunks.")
+
+    stride = max(1, args.vid_stride)
+    n_frames = math.ceil(total / stride)
+    chunk_len = max(args.overlap + 1, int(args.chunk_min * 60 * fps / stride))
+    chunks = plan_chunks(n_frames, chunk_len, args.overlap)
+
+    shard_dir = Path(str(args.out) + ".shards")
+    shutil.rmtree(shard_dir, ignore_errors=True)
+    shard_dir.mkdir(parents=True)
+    paths = [str(shard_dir / f"chunk_{k:04d}.trk") for k in range(len(chunks))]
+    track_kw = dict(conf=args.conf, iou=args.iou,
+                    classes=args.classes if args.classes else None,
+                    tracker=args.tracker, vid_stride=stride)
+    tasks = [(k, args.source, paths[k], track_kw, ch) for k, ch in enumerate(chunks)]
+
+    workers = max(1, min(args.workers, len(tasks)))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    print(f"Tracking {n_frames} frames as {len(chunks)} chunk(s) of {chunk_len} on {workers} worker(s)")
+    t0 = time.perf_counter()
+    with Pool(workers, initializer=_init_worker, initargs=(args.weights, threads)) as pool:
+        for k, n, dt in pool.imap_unordered(_track_chunk, tasks):
+            print(f"  chunk {k}: {n} frames in {dt:.1f}s ({n / dt if dt else 0:.1f} fps)")
+    wall = time.perf_counter() - t0
+
+    os.makedirs(Path(args.out).parent, exist_ok=True)
+    store = shard_dir / "stitched.trk" if is_csv(args.out) else Path(args.out)
+    writer = ChunkedStoreWriter(store)
+    n_ids, report = stitch(paths, chunks, args.overlap, writer, args.match_iou, args.min_frames)
+    writer.close()
+    if is_csv(args.out):
+        export_csv(store, args.out)
+    if not args.keep_chunks:
+        shutil.rmtree(shard_dir, ignore_errors=True)
+
+    print("\n| seam frame | IDs in window | merged | new IDs |")
+    print("|------------|---------------|--------|---------|")
+    for r in report:
+        print(f"| {r['seam_frame']:>10} | {r['ids_in_window']:>13} | {r['merged']:>6} | {r['new_ids']:>7} |")
+    rep = {"source": args.source, "frames": n_frames, "chunks": len(chunks), "chunk_len": chunk_len,
+           "overlap": args.overlap, "workers": workers, "wall_seconds": round(wall, 3),
+           "fps": round(n_frames / wall, 2) if wall > 0 else 0.0,
+           "rows": int(writer.n_rows), "ids": int(n_ids), "seams": report}
+    rep_path = str(args.out) + ".stitch.json"
+    with open(rep_path, "w", encoding="utf-8") as f:
+        json.dump(rep, f, indent=2)
+    print(f"Wrote: {args.out} ({rep['rows']} rows, {rep['ids']} IDs)")
+    print("Wrote:", rep_path)
+
+if __name__ == "__main__":
+    main()
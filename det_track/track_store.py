@@ -0,0 +1,520 @@
+# det_track/track_store.py
+# Columnar on-disk store for tracks and detections (NumPy struct-of-arrays).
+#
+# A store is a directory (e.g. det_track/outputs/tracks.trk/) with one .npy per
+# column, memory-mapped on read, plus:
+#   meta.json        columns, dtypes, row count, sort key
+#   id_index.npy     [id, start, end) row ranges   (rows sorted by (id, frame))
+#   frame_order.npy  row numbers in frame order, frame_keys.npy = their frames
+# so readers can pull just the columns / frame range / IDs they need.
+# Stores written chunk by chunk (track.py's StoreWriter, ChunkedStoreWriter)
+# are kept in frame order instead (sort key "frame"), so building them never
+# needs more than one chunk in memory; their id index is
+#   id_order.npy     row numbers grouped by id (frame order within an id)
+#   id_index.npy     [id, start, end) ranges into id_order
+# Stores may also keep parked stretches as runs (track_rle.py); the readers
+# here expand them.
+# Any path ending in .csv is read and written as plain CSV instead.
+#
+# Convert between the two (from project root):
+#   python det_track/track_store.py to_csv   det_track/outputs/tracks.trk det_track/outputs/tracks.csv
+#   python det_track/track_store.py from_csv det_track/outputs/tracks.csv det_track/outputs/tracks.trk
+
+import argparse, csv, json, os, shutil
+from pathlib import Path
+import numpy as np
+
+# compact dtypes for the known columns; anything else keeps its own dtype
+DTYPES = {
+    "frame": np.int32, "time": np.int32, "id": np.int32,
+    "xmin": np.float32, "ymin": np.float32, "xmax": np.float32, "ymax": np.float32,
+    "conf": np.float32, "cls": np.uint8, "is_parked": np.uint8, "inferred": np.uint8,
+}
+FIELDNAMES = ["frame", "time", "id", "xmin", "ymin", "xmax", "ymax", "conf", "cls"]
+
+def is_csv(path):
+    return str(path).lower().endswith(".csv")
+
+def _as_column(name, values):
+    a = np.asarray(values)
+    if name in DTYPES:
+        return a.astype(DTYPES[name], copy=False)
+    if a.dtype == object:
+        return a.astype(str)
+    return a
+
+def _sort_key(cols):
+    return ["id", "frame"] if "id" in cols else ["frame"]
+
+def _id_ranges(ids):
+    """[id, start, end) rows of each run of equal values in sorted `ids`."""
+    n = len(ids)
+    if not n:
+        return np.zeros((0, 3), np.int64)
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    ends = np.r_[starts[1:], n]
+    return np.stack([ids[starts], starts, ends], axis=1).astype(np.int64)
+
+def _index_ids(tmp, n):
+    """id_order.npy / id_index.npy for the frame-ordered store in `tmp`: one
+    stable argsort of the id column, so per-ID reads skip the full scan."""
+    if not (tmp / "id.npy").exists():
+        return
+    ids = np.load(tmp / "id.npy", mmap_mode="r" if n else None)
+    order = np.argsort(ids, kind="stable").astype(np.int32 if n < 2**31 else np.int64)
+    np.save(tmp / "id_order.npy", order)
+    np.save(tmp / "id_index.npy", _id_ranges(np.asarray(ids)[order]))
+
+# ---------------------------------------------------------------- writing
+
+def write_store(path, cols):
+    """Write a dict of equal-length columns (or a DataFrame) as a sorted, indexed store."""
+    path = Path(path)
+    if hasattr(cols, "columns"):  # DataFrame
+        cols = {c: cols[c].to_numpy() for c in cols.columns}
+    cols = {c: _as_column(c, v) for c, v in cols.items()}
+    n = len(next(iter(cols.values()))) if cols else 0
+    key = _sort_key(cols)
+
+    # single stable sort by (id, frame) or frame
+    order = np.lexsort([cols[k] for k in reversed(key)]) if n else np.arange(0)
+    cols = {c: v[order] for c, v in cols.items()}
+
+    tmp = path.with_name(path.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    for c, v in cols.items():
+        np.save(tmp / f"{c}.npy", v)
+
+    if "id" in cols:
+        np.save(tmp / "id_index.npy", _id_ranges(cols["id"]))
+        frame_order = np.argsort(cols["frame"], kind="stable")
+        frame_order = frame_order.astype(np.int32 if n < 2**31 else np.int64)
+        np.save(tmp / "frame_order.npy", frame_order)
+        np.save(tmp / "frame_keys.npy", cols["frame"][frame_order])
+
+    meta = {"n_rows": int(n), "sort_key": key,
+            "columns": {c: v.dtype.str for c, v in cols.items()}}
+    (tmp / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+
+    # swap in atomically-ish so a crash never leaves a half-written store
+    if path.exists():
+        shutil.rmtree(path)
+    tmp.rename(path)
+    return path
+
+def write_tracks(path, df, export_csv=None):
+    """Write a DataFrame to `path` (store, or CSV if it ends in .csv)."""
+    os.makedirs(Path(path).parent, exist_ok=True)
+    if is_csv(path):
+        df.to_csv(path, index=False)
+    else:
+        write_store(path, df)
+    if export_csv:
+        df.to_csv(export_csv, index=False)
+
+class ChunkedCSVWriter:
+    """Buffer track rows and append them to a CSV every `flush_every` frames."""
+
+    def __init__(self, path, flush_every=300, append=False, fieldnames=FIELDNAMES):
+        exists = append and os.path.exists(path) and os.path.getsize(path) > 0
+        self.f = open(path, "a" if exists else "w", newline="", encoding="utf-8")
+        self.w = csv.DictWriter(self.f, fieldnames=fieldnames)
+        if not exists:
+            self.w.writeheader()
+        self.flush_every = max(1, flush_every)
+        self.buf, self.pending, self.n_rows = [], 0, 0
+
+    def add_frame(self, rows):
+        self.buf.extend(rows)
+        self.pending += 1
+        if self.pending >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        # only whole frames are ever written, so a crash loses at most one chunk
+        self.w.writerows(self.buf)
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.n_rows += len(self.buf)
+        self.buf, self.pending = [], 0
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+def _fill_columns(tmp, dtypes, n, sources):
+    """Write each column of `dtypes` as an n-row .npy in `tmp`, concatenating
+    `sources` (callables: column name -> array) in order into a memory-mapped
+    file, one column at a time - peak memory is one source's column."""
+    for c, dt in dtypes.items():
+        if not n:  # empty files cannot be memory-mapped
+            np.save(tmp / f"{c}.npy", np.zeros(0, dt))
+            continue
+        out = np.lib.format.open_memmap(tmp / f"{c}.npy", mode="w+", dtype=dt, shape=(n,))
+        i = 0
+        for get in sources:
+            v = get(c)
+            out[i:i + len(v)] = v
+            i += len(v)
+        out.flush()
+        del out
+
+def _npz_column(p):
+    def get(c):
+        with np.load(p) as z:
+            return z[c]
+    return get
+
+def _swap_in(tmp, path):
+    # swap in atomically-ish so a crash never leaves a half-written store
+    if path.exists():
+        shutil.rmtree(path)
+    tmp.rename(path)
+
+class StoreWriter(ChunkedCSVWriter):
+    """Same interface as ChunkedCSVWriter, but flushes .npz parts into
+    <store>/_parts/ and, on close(), copies them column by column into a
+    frame-ordered store (as ChunkedStoreWriter does), so memory stays at one
+    chunk however long the video. Resuming a finished store moves it aside
+    to <store>.base and close() copies it in first, never loading it whole."""
+
+    def __init__(self, path, flush_every=300, append=False, fieldnames=FIELDNAMES):
+        self.path = Path(path)
+        self.parts = self.path / "_parts"
+        self.base = _base_path(self.path)
+        if not append:
+            shutil.rmtree(self.path, ignore_errors=True)
+            shutil.rmtree(self.base, ignore_errors=True)
+        elif (self.path / "meta.json").exists():
+            shutil.rmtree(self.base, ignore_errors=True)
+            self.path.rename(self.base)
+        self.parts.mkdir(parents=True, exist_ok=True)
+        self.fieldnames = fieldnames
+        self.n_part = len(list(self.parts.glob("part-*.npz")))
+        self.flush_every = max(1, flush_every)
+        self.buf, self.pending, self.n_rows = [], 0, 0
+
+    def flush(self):
+        if self.buf:
+            cols = {c: _as_column(c, [r[c] for r in self.buf]) for c in self.fieldnames}
+            tmp = self.parts / f"tmp-{self.n_part:06d}.npz"
+            np.savez(tmp, **cols)
+            tmp.rename(self.parts / f"part-{self.n_part:06d}.npz")
+            self.n_part += 1
+            self.n_rows += len(self.buf)
+        self.buf, self.pending = [], 0
+
+    def close(self):
+        self.flush()
+        sources, n = [], 0
+        if (self.base / "meta.json").exists():
+            n += _total_rows(read_meta(self.base))
+            sources.append(lambda c: read_store(self.base, [c], order="frame")[c])
+        for p in sorted(self.parts.glob("part-*.npz")):
+            get = _npz_column(p)
+            n += len(get("frame"))
+            sources.append(get)
+        dtypes = {c: np.dtype(DTYPES[c]) if c in DTYPES else sources[0](c).dtype if sources else np.dtype(float)
+                  for c in self.fieldnames}
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        _fill_columns(tmp, dtypes, n, sources)
+        _index_ids(tmp, n)
+        meta = {"n_rows": int(n), "sort_key": ["frame"], "columns": {c: dt.str for c, dt in dtypes.items()}}
+        (tmp / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+        _swap_in(tmp, self.path)
+        shutil.rmtree(self.base, ignore_errors=True)
+
+class ChunkedStoreWriter:
+    """Append frame-ordered column chunks (dicts or DataFrames) and build a
+    frame-sorted store on close(), copying one column at a time into a
+    memory-mapped .npy - peak memory is one chunk, not the whole store."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.parts = self.path.with_name(self.path.name + ".parts")
+        shutil.rmtree(self.parts, ignore_errors=True)
+        self.parts.mkdir(parents=True)
+        self.n_part, self.n_rows, self.dtypes = 0, 0, None
+
+    def write(self, cols):
+        if hasattr(cols, "columns"):  # DataFrame
+            cols = {c: cols[c].to_numpy() for c in cols.columns}
+        cols = {c: _as_column(c, v) for c, v in cols.items()}
+        n = len(next(iter(cols.values()))) if cols else 0
+        if not n:
+            return
+        if self.dtypes is None:
+            self.dtypes = {c: v.dtype for c, v in cols.items()}
+        np.savez(self.parts / f"part-{self.n_part:06d}.npz", **cols)
+        self.n_part += 1
+        self.n_rows += n
+
+    def close(self):
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        parts = sorted(self.parts.glob("part-*.npz"))
+        _fill_columns(tmp, self.dtypes or {}, self.n_rows, [_npz_column(p) for p in parts])
+        _index_ids(tmp, self.n_rows)
+        meta = {"n_rows": int(self.n_rows), "sort_key": ["frame"],
+                "columns": {c: np.dtype(dt).str for c, dt in (self.dtypes or {}).items()}}
+        (tmp / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+        _swap_in(tmp, self.path)
+        shutil.rmtree(self.parts, ignore_errors=True)
+        return self.path
+
+def open_writer(path, flush_every=300, append=False, fieldnames=FIELDNAMES):
+    cls = ChunkedCSVWriter if is_csv(path) else StoreWriter
+    return cls(path, flush_every=flush_every, append=append, fieldnames=fieldnames)
+
+def _csv_resume_point(path):
+    last_frame, cut, max_id, max_id_before = 0, None, 0, 0
+    with open(path, "rb") as f:
+        header = f.readline()
+        if not header:
+            return 1, 0
+        cols = header.decode("utf-8").strip().split(",")
+        fi, ii = cols.index("frame"), cols.index("id")
+        pos = f.tell()
+        for line in f:
+            parts = line.decode("utf-8", "replace").rstrip("\r\n").split(",")
+            if not line.endswith(b"\n") or len(parts) != len(cols):
+                break  # torn write at the end of the file
+            frame = int(parts[fi])
+            if frame != last_frame:
+                last_frame, cut, max_id_before = frame, pos, max_id
+            max_id = max(max_id, int(parts[ii]))
+            pos += len(line)
+    if cut is None:  # header only
+        return 1, 0
+    # drop the last frame entirely; it is re-tracked on resume
+    with open(path, "r+b") as f:
+        f.truncate(cut)
+    return last_frame, max_id_before
+
+def _base_path(path):
+    """Where StoreWriter keeps a finished store while a resume appends to it."""
+    return path.with_name(path.name + ".base")
+
+def _total_rows(meta):
+    return meta["rle"]["n_rows_total"] if meta.get("rle") else meta["n_rows"]
+
+def _finished_point(path):
+    cols = read_store(path, columns=["frame", "id"], mmap=True)
+    frames, ids = cols["frame"], cols["id"]
+    if not len(frames):
+        return 0, 0
+    return int(frames.max()), int(ids.max())
+
+def _store_resume_point(path):
+    path = Path(path)
+    if (path / "meta.json").exists():
+        last, max_id = _finished_point(path)
+        return last + 1, max_id
+    # an interrupted resume of a finished store: it waits in .base, new frames in _parts
+    base_last, base_max = _finished_point(_base_path(path)) if (_base_path(path) / "meta.json").exists() else (0, 0)
+    parts = sorted((path / "_parts").glob("part-*.npz"))
+    for p in (path / "_parts").glob("tmp-*.npz"):
+        p.unlink()  # torn write
+    if not parts:
+        return base_last + 1, base_max
+    # parts hold whole frames, but drop the last frame anyway for symmetry with CSV
+    last = np.load(parts[-1])
+    cols = {c: last[c] for c in last.files}
+    last_frame = int(cols["frame"].max())
+    keep = cols["frame"] != last_frame
+    if keep.any():
+        np.savez(parts[-1], **{c: v[keep] for c, v in cols.items()})
+    else:
+        parts[-1].unlink()
+        parts = parts[:-1]
+    max_id = base_max
+    for p in parts:
+        ids = np.load(p)["id"]
+        if len(ids):
+            max_id = max(max_id, int(ids.max()))
+    return last_frame, max_id
+
+def resume_point(path):
+    """Trim the last (possibly partial) frame of a track output.
+
+    Returns (frame to restart from, largest track id kept).
+    """
+    return _csv_resume_point(path) if is_csv(path) else _store_resume_point(path)
+
+# ---------------------------------------------------------------- reading
+
+def read_meta(path):
+    return json.loads((Path(path) / "meta.json").read_text(encoding="utf-8"))
+
+def read_store(path, columns=None, frames=None, ids=None, order="store", mmap=True, runs=True):
+    """Load columns from a store as a dict of arrays.
+
+    frames=(lo, hi) keeps rows with lo <= frame <= hi (inclusive) using the
+    frame index; ids=[...] keeps those track IDs using the id index;
+    order="frame" returns rows in frame order instead of (id, frame).
+    Run-length encoded stores come back expanded (runs=False: per-frame rows only).
+    """
+    path = Path(path)
+    meta = read_meta(path)
+    columns = list(meta["columns"]) if columns is None else list(columns)
+    missing = [c for c in columns if c not in meta["columns"]]
+    if missing:
+        raise KeyError(f"Columns not in {path}: {missing}")
+    if runs and meta.get("rle"):  # run-length encoded (track_rle.py): add the runs' rows
+        from track_rle import merge_runs
+        load = list(dict.fromkeys(columns + ["frame", "id"]))
+        rows = read_store(path, load, frames, ids, order, mmap, runs=False)
+        out = merge_runs(path, meta, rows, frames, ids, order)
+        return {c: out[c] for c in columns}
+    n = meta["n_rows"]
+    if n == 0:  # empty files cannot be memory-mapped
+        return {c: np.load(path / f"{c}.npy") for c in columns}
+    mode = "r" if mmap else None
+    id_sorted = meta["sort_key"][0] == "id"
+
+    rows = None
+    if frames is not None:
+        lo, hi = frames
+        if id_sorted:
+            keys = np.load(path / "frame_keys.npy", mmap_mode="r")
+            i0, i1 = np.searchsorted(keys, lo, "left"), np.searchsorted(keys, hi, "right")
+            rows = np.asarray(np.load(path / "frame_order.npy", mmap_mode="r")[i0:i1])
+            if order != "frame":
+                rows = np.sort(rows)
+        else:
+            keys = np.load(path / "frame.npy", mmap_mode="r")
+            rows = np.arange(np.searchsorted(keys, lo, "left"), np.searchsorted(keys, hi, "right"))
+    elif order == "frame" and id_sorted:
+        rows = np.asarray(np.load(path / "frame_order.npy", mmap_mode="r"))
+
+    if ids is not None:
+        if id_sorted or (path / "id_order.npy").exists():
+            index = np.load(path / "id_index.npy")
+            sel = index[np.isin(index[:, 0], np.asarray(ids))]
+            id_rows = np.concatenate([np.arange(s, e) for _, s, e in sel]) if len(sel) else np.arange(0)
+            if not id_sorted:  # ranges into id_order; back to store (frame) order
+                id_rows = np.sort(np.load(path / "id_order.npy", mmap_mode="r")[id_rows])
+        else:  # frame-ordered store from before id_order: scan the id column
+            id_rows = np.flatnonzero(np.isin(np.load(path / "id.npy", mmap_mode="r"), np.asarray(ids)))
+        rows = id_rows if rows is None else rows[np.isin(rows, id_rows)]
+
+    out = {}
+    for c in columns:
+        a = np.load(path / f"{c}.npy", mmap_mode=mode)
+        out[c] = a if rows is None else np.asarray(a[rows])
+    return out
+
+def store_columns(path):
+    """Column names of a store or CSV, without loading any rows."""
+    if is_csv(path):
+        with open(path, newline="", encoding="utf-8") as f:
+            return next(csv.reader(f), [])
+    return list(read_meta(path)["columns"])
+
+def read_tracks(path, columns=None, frames=None, ids=None, order="store"):
+    """Read a track/detection file (store or CSV) into a DataFrame."""
+    import pandas as pd
+    if is_csv(path):
+        usecols = None
+        if columns is not None:
+            extra = (["frame"] if frames is not None or order == "frame" else []) + (["id"] if ids is not None else [])
+            usecols = list(dict.fromkeys(list(columns) + extra))
+        df = pd.read_csv(path, usecols=usecols)
+        if frames is not None:
+            df = df[df["frame"].between(*frames)]
+        if ids is not None:
+            df = df[df["id"].isin(ids)]
+        if order == "frame":
+            df = df.sort_values("frame", kind="mergesort")
+        if columns is not None:
+            df = df[list(columns)]
+        return df.reset_index(drop=True)
+    return pd.DataFrame(read_store(path, columns, frames=frames, ids=ids, order=order, mmap=True))
+
+def iter_frame_chunks(path, columns=None, chunk_rows=1_000_000):
+    """Yield DataFrames of about `chunk_rows` rows in frame order, never
+    splitting a frame across two chunks. Stores are sliced through their
+    frame index (memory-mapped); CSVs are read incrementally and must
+    already be in frame order, as track.py writes them."""
+    import pandas as pd
+    if is_csv(path):
+        usecols = None if columns is None else list(dict.fromkeys(list(columns) + ["frame"]))
+        carry, last = None, None
+        for chunk in pd.read_csv(path, usecols=usecols, chunksize=chunk_rows):
+            f = chunk["frame"].to_numpy()
+            if len(f) and ((last is not None and f[0] < last) or (np.diff(f) < 0).any()):
+                raise SystemExit(f"{path} is not in frame order; convert it with track_store.py from_csv")
+            if carry is not None:
+                chunk = pd.concat([carry, chunk], ignore_index=True)
+            if not len(chunk):
+                continue
+            last = chunk["frame"].iat[-1]
+            tail = (chunk["frame"] == last).to_numpy()
+            carry = chunk[tail]
+            if (~tail).any():
+                yield (chunk[~tail] if columns is None else chunk.loc[~tail, list(columns)]).reset_index(drop=True)
+        if carry is not None and len(carry):
+            yield (carry if columns is None else carry[list(columns)]).reset_index(drop=True)
+        return
+
+    path = Path(path)
+    meta = read_meta(path)
+    columns = list(meta["columns"]) if columns is None else list(columns)
+    if meta.get("rle"):  # expand only the runs overlapping each chunk's frames
+        from track_rle import frame_chunks
+        for lo, hi in frame_chunks(path, meta, chunk_rows):
+            df = pd.DataFrame(read_store(path, columns, frames=(lo, hi), order="frame"))
+            if len(df):
+                yield df
+        return
+    n = meta["n_rows"]
+    if meta["sort_key"][0] == "id":
+        keys = np.load(path / "frame_keys.npy", mmap_mode="r")
+        order = np.load(path / "frame_order.npy", mmap_mode="r")
+    else:
+        keys, order = np.load(path / "frame.npy", mmap_mode="r"), None
+    data = {c: np.load(path / f"{c}.npy", mmap_mode="r") for c in columns}
+    i0 = 0
+    while i0 < n:
+        i1 = int(np.searchsorted(keys, keys[min(n, i0 + chunk_rows) - 1], "right"))  # finish the frame
+        if order is None:
+            yield pd.DataFrame({c: np.asarray(v[i0:i1]) for c, v in data.items()})
+        else:
+            rows = np.asarray(order[i0:i1])
+            yield pd.DataFrame({c: np.asarray(v[rows]) for c, v in data.items()})
+        i0 = i1
+
+def export_csv(src, dst, chunk_rows=1_000_000):
+    """Write a store out as CSV, a slice at a time."""
+    meta = read_meta(src)
+    cols = read_store(src, mmap=True)
+    names = list(meta["columns"])
+    os.makedirs(Path(dst).parent, exist_ok=True)
+    with open(dst, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(names)
+        for i in range(0, len(cols[names[0]]) if names else 0, chunk_rows):  # all rows, runs expanded
+            block = [cols[c][i:i + chunk_rows].tolist() for c in names]
+            w.writerows(zip(*block))
+    return dst
+
+def main():
+    ap = argparse.ArgumentParser(description="Convert between tracks CSV and the columnar track store")
+    ap.add_argument("cmd", choices=["to_csv", "from_csv"])
+    ap.add_argument("src")
+    ap.add_argument("dst")
+    args = ap.parse_args()
+
+    if args.cmd == "to_csv":
+        export_csv(args.src, args.dst)
+    else:
+        import pandas as pd
+        write_store(args.dst, pd.read_csv(args.src))
+    print("Wrote:", args.dst)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+# ocr/check_rules.py
+# Parking rules (parse_rules.py) checked against the parked dwell sessions of
+# summarize_tracks.py, per curb segment: over-stays and parking outside the
+# allowed windows.
+# Usage (from project root):
+#   python ocr/check_rules.py check --rule ocr/outputs/rules.json --start_time 2025-10-21T14:00:00
+#   python ocr/check_rules.py check --rule S1,S2=ocr/outputs/rules.json --rule S3=ocr/outputs/ocr_rules_sign3.json \
+#       --intervals det_track/outputs/dwell_intervals.csv --start_time 2025-10-21T14:00:00
+#   python ocr/check_rules.py check --rule ocr/outputs/rules.jsonl --index det_track/outputs/dwell.idx
+#   python ocr/check_rules.py bench --sessions 1000000
+#
+# A rule's windows are the hours parking is allowed, repeating every week;
+# its duration_limit caps the time parked inside them. For a session
+# [start, end), in wall-clock time:
+#   in_window_sec      = seconds inside any window
+#   out_of_window_sec  = dwell_sec - in_window_sec         -> "out_of_window"
+#   overstay_sec       = max(0, in_window_sec - limit)      -> "overstay"
+# each flagged above --grace seconds. Allowed time up to t is a weekly step
+# integral, covered(t) = weeks * week_total + G(t mod week) with G piecewise
+# linear, so in_window = covered(end) - covered(start) for every session of
+# a rule in one np.interp call; nothing loops over vehicles.
+# permit and direction are not checked (the parser never fills permit).
+# A rules.jsonl record applies to its "segment" when it has one.
+
+import argparse, json, os, re, sys, time
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "det_track"))
+from dwell_index import DwellIndex, synthetic_sessions
+from parse_rules import DAYS, parse_rules
+
+DAY = 86400.0
+WEEK = 7 * DAY
+LIMIT_UNITS = {"h": 3600.0, "hour": 3600.0, "m": 60.0, "min": 60.0}
+
+def clock_sec(hhmm):
+    h, m = hhmm.split(":")
+    return int(h) * 3600.0 + int(m) * 60.0
+
+def limit_sec(rule):
+    """duration_limit ("2h", "90min") in seconds; inf when the rule has none."""
+    d = rule.get("duration_limit")
+    if not d:
+        return np.inf
+    m = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*(h|hour|m|min)\s*", d.lower())
+    if m is None:
+        raise SystemExit(f"Cannot read duration_limit {d!r}")
+    return float(m.group(1)) * LIMIT_UNITS[m.group(2)]
+
+def weekly_windows(rule):
+    """Allowed time as merged, sorted [a, b) rows in seconds from Monday 00:00."""
+    spans = []
+    for w in rule["windows"]:
+        a, b = clock_sec(w["start"]), clock_sec(w["end"])
+        if b <= a:  # overnight (22:00-06:00), or all day (00:00-00:00)
+            b += DAY
+        for d in w["days"]:
+            lo, hi = DAYS.index(d) * DAY + a, DAYS.index(d) * DAY + b
+            if hi > WEEK:  # Sunday night runs into Monday
+                spans += [(lo, WEEK), (0.0, hi - WEEK)]
+            else:
+                spans.append((lo, hi))
+    merged = []
+    for lo, hi in sorted(spans):
+        if merged and lo <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], hi)
+        else:
+            merged.append([lo, hi])
+    return np.array(merged, dtype=np.float64).reshape(-1, 2)
+
+def window_steps(windows):
+    """Breakpoints (xs, ys) of G(t) = allowed seconds in [0, t) within one week."""
+    cum = np.r_[0.0, np.cumsum(windows[:, 1] - windows[:, 0])]
+    xs = np.r_[0.0, windows.ravel(), WEEK]
+    ys = np.r_[0.0, np.column_stack([cum[:-1], cum[1:]]).ravel(), cum[-1]]
+    return xs, ys
+
+def covered(t, xs, ys):
+    """Allowed seconds in [0, t) for week times t (any number of weeks)."""
+    wk = np.floor(t / WEEK)
+    return wk * ys[-1] + np.interp(t - wk * WEEK, xs, ys)
+
+def week_offset(start_time):
+    """Seconds from the Monday 00:00 before an ISO time to that time."""
+    t = datetime.fromisoformat(start_time)
+    return t.weekday() * DAY + (t - t.replace(hour=0, minute=0, second=0, microsecond=0)).total_seconds()
+
+def check_sessions(sessions, rules, week0, grace=60.0):
+    """Sessions (segment, start_sec, end_sec, ...) of segments that have a
+    rule, with the rule arithmetic and a `violation` column. week0 is the
+    week time of second 0 (week_offset of the recording start)."""
+    out = sessions[sessions["segment"].astype(str).isin(list(rules))].reset_index(drop=True)
+    seg = out["segment"].astype(str).to_numpy()
+    s = out["start_sec"].to_numpy(np.float64) + week0
+    e = out["end_sec"].to_numpy(np.float64) + week0
+    inside = np.zeros(len(out))
+    limit = np.full(len(out), np.inf)
+    for label, rule in rules.items():  # one vectorized pass per segment
+        m = seg == label
+        if m.any():
+            xs, ys = window_steps(weekly_windows(rule))
+            inside[m] = covered(e[m], xs, ys) - covered(s[m], xs, ys)
+            limit[m] = limit_sec(rule)
+    outside = np.maximum(e - s - inside, 0.0)
+    over = np.maximum(inside - limit, 0.0)
+    flag_o, flag_w = over > grace, outside > grace
+    out["limit_sec"] = limit
+    out["in_window_sec"] = inside.round(3)
+    out["out_of_window_sec"] = outside.round(3)
+    out["overstay_sec"] = over.round(3)
+    out["violation"] = np.select([flag_o & flag_w, flag_o, flag_w],
+                                 ["overstay+out_of_window", "overstay", "out_of_window"], "")
+    return out
+
+def check_loop(sessions, rules, week0, grace=60.0):
+    """Per-session reference for check_sessions (bench only): walks each
+    session week by week through its rule's windows."""
+    rows = []
+    for r in sessions.itertuples(index=False):
+        rule = rules.get(str(r.segment))
+        if rule is None:
+            continue
+        s, e = r.start_sec + week0, r.end_sec + week0
+        wins = weekly_windows(rule)
+        inside, wk = 0.0, np.floor(s / WEEK) * WEEK
+        while wk < e:
+            for a, b in wins:
+                inside += max(0.0, min(e, wk + b) - max(s, wk + a))
+            wk += WEEK
+        limit = limit_sec(rule)
+        outside, over = max(e - s - inside, 0.0), max(inside - limit, 0.0)
+        flag = "+".join(f for f, on in [("overstay", over > grace), ("out_of_window", outside > grace)] if on)
+        rows.append((round(inside, 3), round(outside, 3), round(over, 3), flag))
+    return pd.DataFrame(rows, columns=["in_window_sec", "out_of_window_sec", "overstay_sec", "violation"])
+
+def read_rules(path):
+    """[(segment or None, rule)] from a rules.json (one rule) or rules.jsonl."""
+    path = Path(path)
+    if not path.is_file():
+        raise SystemExit(f"Cannot find rules: {path}")
+    if path.suffix == ".jsonl":
+        recs = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+        return [(r.get("segment"), r["rules"]) for r in recs]
+    return [(None, json.loads(path.read_text(encoding="utf-8")))]
+
+def load_rules(specs, labels):
+    """--rule [SEG,SEG=]PATH specs -> {segment: rule}. Rules without a
+    segment (from the spec or the record) cover every segment that no
+    other rule names."""
+    rules, source, default = {}, {}, None
+    for spec in specs:
+        segs, _, path = spec.rpartition("=")
+        for rec_seg, rule in read_rules(path):
+            targets = segs.split(",") if segs else [rec_seg] if rec_seg is not None else None
+            if targets is None:
+                if default is not None and default[0] != rule:
+                    raise SystemExit(f"Rules from {default[1]} and {path} both cover every segment; "
+                                     f"give each sign its segment (SEG=PATH)")
+                default = (rule, path)
+                continue
+            for seg in map(str, targets):
+                if seg in rules and rules[seg] != rule:
+                    raise SystemExit(f"Segment {seg} has different rules from {source[seg]} and {path}")
+                rules[seg], source[seg] = rule, path
+    if default is not None:
+        for seg in labels:
+            rules.setdefault(seg, default[0])
+    return rules
+
+def load_sessions(args):
+    """(sessions, week time of second 0) from --index or --intervals + --start_time."""
+    if args.index:
+        idx = DwellIndex(args.index)
+        origin = idx.meta.get("origin")
+        if origin is None:
+            raise SystemExit(f"{args.index} has no --start_time; rebuild it with one (dwell_index.py build)")
+        return idx.sessions(), week_offset(origin)
+    if not args.start_time:
+        raise SystemExit("Rules are in wall-clock time: pass --start_time (ISO time of the first frame) or --index")
+    if not os.path.isfile(args.intervals):
+        raise SystemExit(f"Cannot find {args.intervals} — run summarize_tracks.py first.")
+    return pd.read_csv(args.intervals), week_offset(args.start_time)
+
+def print_summary(out):
+    print("\n| segment | sessions | overstay | out_of_window | overstay min | out-of-window min |")
+    print("|---------|----------|----------|---------------|--------------|-------------------|")
+    for seg, g in out.groupby("segment", sort=True):
+        v = g["violation"]
+        print(f"| {seg} | {len(g)} | {int(v.str.contains('overstay').sum())} | "
+              f"{int(v.str.contains('out_of_window').sum())} | {g['overstay_sec'].sum() / 60:.1f} | "
+              f"{g['out_of_window_sec'].sum() / 60:.1f} |")
+
+def bench(args):
+    labels = [f"S{i+1}" for i in range(args.bins)]
+    texts = ["PARKING 2H\nMON-FRI\n9AM-6PM ->", "PARKING 1H\nTUE-THU\n10AM-4PM ->",
+             "PARKING 2 HOUR\nMON-SAT\n08:00-18:00", "PARKING 30 MIN\nSAT SUN\n10:00-14:00"]
+    rules = {s: parse_rules(texts[i % len(texts)]) for i, s in enumerate(labels)}
+    sessions = synthetic_sessions(args.sessions, labels, args.days)
+    week0 = week_offset("2025-10-20T00:00:00")
+    t = time.perf_counter()
+    out = check_sessions(sessions, rules, week0, args.grace)
+    dt = time.perf_counter() - t
+    print(f"check_sessions: {len(out):,} sessions in {dt:.3f} s ({(out['violation'] != '').sum():,} flagged)")
+    n = min(args.loop, len(sessions))
+    t = time.perf_counter()
+    ref = check_loop(sessions.iloc[:n], rules, week0, args.grace)
+    dt_loop = time.perf_counter() - t
+    cols = list(ref.columns)
+    same = np.allclose(out[cols[:3]].iloc[:n].to_numpy(), ref[cols[:3]].to_numpy(), atol=1e-3) and \
+        out["violation"].iloc[:n].tolist() == ref["violation"].tolist()
+    print(f"check_loop:     {n:,} sessions in {dt_loop:.3f} s "
+          f"(~{dt_loop / n * len(sessions) / max(dt, 1e-9):.0f}x slower per session; results "
+          f"{'identical' if same else 'DIFFERENT'})")
+
+def main():
+    ap = argparse.ArgumentParser(description="Check parked dwell sessions against parsed parking rules")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("check", help="flag over-stays and out-of-window parking")
+    c.add_argument("--rule", action="append", required=True, metavar="[SEG,SEG=]PATH",
+                   help="rules.json / rules.jsonl for these segments (default: all); repeatable")
+    c.add_argument("--intervals", default="det_track/outputs/dwell_intervals.csv")
+    c.add_argument("--start_time", default=None,
+                   help="wall-clock ISO time of the recording's first frame (--intervals only)")
+    c.add_argument("--index", default=None,
+                   help="use a dwell.idx instead of --intervals; its own origin places it in time, so "
+                        "--start_time is ignored")
+    c.add_argument("--grace", type=float, default=60.0, help="seconds over a limit / outside a window before flagging")
+    c.add_argument("--out_csv", default="ocr/outputs/violations.csv")
+    c.add_argument("--all", action="store_true", help="write every checked session, not only violations")
+    b = sub.add_parser("bench", help="vectorized engine vs a per-session loop on synthetic sessions")
+    b.add_argument("--sessions", type=int, default=1_000_000)
+    b.add_argument("--days", type=int, default=90)
+    b.add_argument("--bins", type=int, default=4)
+    b.add_argument("--grace", type=float, default=60.0)
+    b.add_argument("--loop", type=int, default=20_000, help="sessions for the loop reference")
+    args = ap.parse_args()
+
+    if args.cmd == "bench":
+        bench(args)
+        return
+
+    sessions, week0 = load_sessions(args)
+    labels = sorted(sessions["segment"].astype(str).unique())
+    rules = load_rules(args.rule, labels)
+    out = check_sessions(sessions, rules, week0, args.grace)
+    unruled = sorted(set(labels) - set(rules))
+    if unruled:
+        print(f"No rule for {unruled}; their sessions are not checked")
+    print_summary(out)
+    os.makedirs(os.path.dirname(args.out_csv) or ".", exist_ok=True)
+    (out if args.all else out[out["violation"] != ""]).to_csv(args.out_csv, index=False)
+    print("Wrote:", args.out_csv)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+# ocr/find_signs.py
+# Parking signs found in the video itself: sign regions on sampled frames are
+# tracked across frames and OCRed once per sign track, from its sharpest crop.
+# Usage (from project root):
+#   python ocr/find_signs.py --source det_track/sample_video.mp4
+#   python ocr/find_signs.py --source cam01_tue.mp4 --camera cam01     # cam01's known signs are not OCRed again
+#   python ocr/find_signs.py --detector yolo --weights signs.pt --classes 0
+#   python ocr/parse_rules.py --in_jsonl ocr/outputs/signs/sample_video/signs.jsonl
+#   python ocr/check_rules.py check --rule ocr/outputs/rules.jsonl --start_time 2025-10-21T14:00:00
+#
+# Regions: --detector segformer (default) takes the --sign_classes pixels of
+# the camera's SegFormer mask cache (segmentation/mask_cache.py, built on
+# demand, so a fixed camera is only segmented on scene changes) as connected
+# components; --detector yolo runs a detector on every sampled frame instead
+# (a COCO model only knows "stop sign", class 11, so use sign-trained weights).
+# Boxes of consecutive samples are linked greedily by IoU, and a track ends
+# after --max_gap samples unseen. A track holds only its sharpest crop
+# (variance of the Laplacian), and tracks of one sign split by an occlusion
+# are merged before OCR.
+#
+# ocr/outputs/signs/<camera>/registry.json keeps every sign OCRed for the
+# camera with its box and text. A track overlapping a known sign by --iou
+# takes that text without OCR (--refresh redoes them); new signs are OCRed in
+# one ocr_signs.ocr_batch call. signs.jsonl has the ocr_signs.py --images
+# record layout plus sign_id, box, hits, sharpness and segment (--zones, else
+# --bins strips as in summarize_tracks.py), so parse_rules.py reads it as is.
+
+import argparse, json, os, sys
+from pathlib import Path
+import numpy as np
+import cv2
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / "det_track"))
+sys.path.insert(0, str(REPO / "segmentation"))
+from boxes import iou_matrix, greedy_match
+from curb_zones import CurbZones
+from frame_pipeline import seek_frames
+from mask_cache import open_cache
+
+SIGN_CLASSES = ["signboard"]  # ADE20K name in the SegFormer config
+
+def sharpness(crop):
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+def components(lab, ids, sx, sy, min_area):
+    """Boxes (N, 4) in source pixels of the connected regions of classes
+    `ids` in a label map; sx, sy scale label-map to source pixels."""
+    n, _, st, _ = cv2.connectedComponentsWithStats(np.isin(lab, ids).astype(np.uint8), connectivity=8)
+    st = st[1:].astype(np.float64)  # row 0 is the background
+    xyxy = np.c_[st[:, 0], st[:, 1], st[:, 0] + st[:, 2], st[:, 1] + st[:, 3]] * [sx, sy, sx, sy]
+    area = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+    return xyxy[area >= min_area]
+
+class SignTracks:
+    """Greedy IoU tracking of per-sample sign boxes; each track keeps only
+    its sharpest crop."""
+    def __init__(self, iou=0.3, max_gap=5, pad=4):
+        self.iou, self.max_gap, self.pad = iou, max_gap, pad
+        self.live, self.done, self.next_id = [], [], 1
+
+    def update(self, k, t, frame, boxes):
+        """Sample number k at t seconds: link `boxes` (N, 4) to live tracks."""
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        owner = {}
+        if self.live and len(boxes):
+            match, _ = greedy_match(iou_matrix(boxes, [tr["last_box"] for tr in self.live]), self.iou)
+            owner = {b: int(j) for b, j in enumerate(match) if j >= 0}
+        H, W = frame.shape[:2]
+        for b, box in enumerate(boxes):
+            if b in owner:
+                tr = self.live[owner[b]]
+            else:
+                tr = {"track": self.next_id, "hits": 0, "sharpness": -1.0, "crop": None}
+                self.next_id += 1
+                self.live.append(tr)
+            tr["last_box"], tr["last"] = box, k
+            tr["hits"] += 1
+            x1, y1 = max(0, int(box[0]) - self.pad), max(0, int(box[1]) - self.pad)
+            x2, y2 = min(W, int(np.ceil(box[2])) + self.pad), min(H, int(np.ceil(box[3])) + self.pad)
+            if x2 - x1 < 2 or y2 - y1 < 2:
+                continue
+            crop = frame[y1:y2, x1:x2]
+            s = sharpness(crop)
+            if s > tr["sharpness"]:
+                tr.update(crop=crop.copy(), sharpness=s, box=box, t=t)
+        keep = []
+        for tr in self.live:
+            (keep if k - tr["last"] <= self.max_gap else self.done).append(tr)
+        self.live = keep
+
+    def finish(self, min_hits=1):
+        """Tracks with a crop and at least min_hits samples, one per sign:
+        overlapping tracks (a sign seen again after an occlusion) are merged
+        into the sharpest."""
+        tracks = sorted((tr for tr in self.done + self.live if tr["crop"] is not None),
+                        key=lambda tr: -tr["sharpness"])
+        kept = []
+        for tr in tracks:
+            if kept:
+                ious = iou_matrix([tr["box"]], [k["box"] for k in kept])[0]
+                j = int(np.argmax(ious))
+                if ious[j] >= self.iou:
+                    kept[j]["hits"] += tr["hits"]
+                    continue
+            kept.append(tr)
+        return sorted((tr for tr in kept if tr["hits"] >= min_hits), key=lambda tr: tr["track"])
+
+def segformer_regions(source, camera, args, fps, W, H):
+    """propose(i, frame) -> boxes from the camera's mask cache."""
+    cache_dir = args.mask_cache or str(REPO / "segmentation" / "outputs" / "mask_cache" / camera)
+    cache = open_cache(source, cache_dir, args.every_sec)
+    ids = cache.class_ids(args.sign_classes)
+    h, w = cache.labels.shape[1:]
+    boxes_of = {}  # mask index -> boxes: one component pass per cached mask, not per frame
+    def propose(i, frame):
+        k = int(cache.mask_index(i / fps, source))
+        if k not in boxes_of:
+            boxes_of[k] = components(np.asarray(cache.labels[k]), ids, W / w, H / h, args.min_area)
+        return boxes_of[k]
+    return propose
+
+def yolo_regions(args):
+    from backends import load_model
+    model = load_model(args.weights, args.backend, args.imgsz)
+    def propose(i, frame):
+        r = model.predict(frame, imgsz=args.imgsz, conf=args.conf, classes=args.classes, save=False, verbose=False)[0]
+        if r.boxes is None or r.boxes.xyxy is None:
+            return np.zeros((0, 4))
+        xyxy = r.boxes.xyxy.cpu().numpy()
+        return xyxy[(xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1]) >= args.min_area]
+    return propose
+
+def segment_labels(boxes, W, bins, zones=None):
+    """Curb segment of each sign from its box's bottom centre: a zone id of
+    `zones` (None outside every zone), else one of `bins` strips S1..Sn."""
+    cx, bottom = (boxes[:, 0] + boxes[:, 2]) / 2.0, boxes[:, 3]
+    if zones is not None:
+        return [zones.ids[c] if c >= 0 else None for c in zones.assign(cx, bottom)]
+    i = np.clip((cx / W * bins).astype(int), 0, bins - 1)
+    return [f"S{k + 1}" for k in i]
+
+def load_registry(path, camera):
+    if path.exists():
+        return json.loads(path.read_text(encoding="utf-8"))
+    return {"camera": camera, "signs": []}
+
+def main():
+    ap = argparse.ArgumentParser(description="Find, track and OCR parking signs in a video (one OCR per sign)")
+    ap.add_argument("--source", default="det_track/sample_video.mp4")
+    ap.add_argument("--camera", default=None, help="camera id: runs of one camera share its sign registry")
+    ap.add_argument("--outdir", default="ocr/outputs/signs", help="per-camera directories go here")
+    ap.add_argument("--every_sec", type=float, default=1.0, help="seconds between sampled frames")
+    ap.add_argument("--detector", choices=["segformer", "yolo"], default="segformer")
+    ap.add_argument("--mask_cache", default=None, help="default segmentation/outputs/mask_cache/<camera>")
+    ap.add_argument("--sign_classes", nargs="+", default=SIGN_CLASSES, help="SegFormer classes that are signs")
+    ap.add_argument("--weights", default="yolov8n.pt", help="--detector yolo weights")
+    ap.add_argument("--backend", default="torch", help="see det_track/backends.py")
+    ap.add_argument("--imgsz", type=int, default=640)
+    ap.add_argument("--conf", type=float, default=0.25)
+    ap.add_argument("--classes", type=int, nargs="*", default=[11], help="--detector yolo classes (COCO 11 = stop sign)")
+    ap.add_argument("--min_area", type=float, default=400, help="smallest sign box, source pixels^2")
+    ap.add_argument("--iou", type=float, default=0.3, help="IoU that links boxes / matches a known sign")
+    ap.add_argument("--max_gap", type=int, default=5, help="samples a sign may go unseen before its track ends")
+    ap.add_argument("--min_hits", type=int, default=2, help="samples a track needs to count as a sign")
+    ap.add_argument("--zones", default=None, help="curb zone polygons (GeoJSON, see curb_zones.py) for segments")
+    ap.add_argument("--bins", type=int, default=4, help="vertical strips for segments without --zones")
+    ap.add_argument("--ocr_cache", default="ocr/outputs/ocr_cache.jsonl", help="ocr_signs.py result cache")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="OCR processes")
+    ap.add_argument("--refresh", action="store_true", help="OCR every sign again, known or not")
+    args = ap.parse_args()
+
+    if not os.path.isfile(args.source):
+        raise SystemExit(f"Cannot find source video: {args.source}")
+    camera = args.camera or Path(args.source).stem
+    cam_dir = Path(args.outdir) / camera
+    (cam_dir / "crops").mkdir(parents=True, exist_ok=True)
+    cap = cv2.VideoCapture(str(args.source))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 15
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    W, H = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+    step = max(1, int(fps * args.every_sec))
+    propose = segformer_regions(args.source, camera, args, fps, W, H) if args.detector == "segformer" \
+        else yolo_regions(args)
+
+    # one pass over the sampled frames; only the sharpest crop per live track is held
+    tracker = SignTracks(args.iou, args.max_gap)
+    n = 0
+    for k, (i, frame) in enumerate(seek_frames(args.source, np.arange(0, total, step))):
+        tracker.update(k, i / fps, frame, propose(i, frame))
+        n += 1
+    tracks = tracker.finish(args.min_hits)
+    print(f"{n} sampled frames: {tracker.next_id - 1} sign tracks, {len(tracks)} signs")
+
+    reg_path = cam_dir / "registry.json"
+    registry = load_registry(reg_path, camera)
+    known = registry["signs"]
+    known_boxes = np.array([s["box"] for s in known], dtype=np.float64).reshape(-1, 4)
+    recs, new = [], []
+    for tr in tracks:
+        j = -1
+        if len(known) and not args.refresh:
+            ious = iou_matrix([tr["box"]], known_boxes)[0]
+            j = int(np.argmax(ious)) if ious.max() >= args.iou else -1
+        if j >= 0:
+            s = known[j]
+            recs.append({"image": s["image"], "key": s["key"], "text": s["text"], "ocr_seconds": 0.0, "cached": True,
+                         "sign_id": s["sign_id"]})
+        else:
+            crop = str(cam_dir / "crops" / f"{Path(args.source).stem}_{tr['track']}.png")
+            cv2.imwrite(crop, tr["crop"])
+            recs.append({"image": crop, "sign_id": None})
+            new.append(len(recs) - 1)
+
+    if new:
+        from ocr_signs import ocr_batch  # tesseract is only needed when a sign is new
+        ocr = {r["image"]: r for r in ocr_batch([recs[i]["image"] for i in new], args.ocr_cache or None,
+                                                workers=args.workers)}
+        next_id = max([s["sign_id"] for s in known], default=0) + 1
+        dropped = {i for i in new if recs[i]["image"] not in ocr}  # crops ocr_batch could not read
+        for i in new:
+            if i in dropped:
+                continue
+            tr, rec = tracks[i], recs[i]
+            rec.update(ocr[rec["image"]])
+            s = next((s for s in known if iou_matrix([tr["box"]], [s["box"]])[0, 0] >= args.iou), None)
+            if s is None:  # a new sign (with --refresh a known one keeps its id)
+                s = {"sign_id": next_id}
+                next_id += 1
+                known.append(s)
+            s.update(box=[round(float(v), 1) for v in tr["box"]], image=rec["image"], key=rec["key"],
+                     text=rec["text"], sharpness=round(tr["sharpness"], 1), source=str(args.source))
+            rec["sign_id"] = s["sign_id"]
+        reg_path.write_text(json.dumps(registry, indent=2), encoding="utf-8")
+        print("Wrote:", reg_path)
+        if dropped:
+            keep = [i for i in range(len(recs)) if i not in dropped]
+            tracks, recs = [tracks[i] for i in keep], [recs[i] for i in keep]
+            new = [i for i in new if i not in dropped]
+            print(f"{len(dropped)} sign(s) left out: their crops could not be OCRed")
+
+    zones = CurbZones.from_geojson(args.zones) if args.zones else None
+    segs = segment_labels(np.array([tr["box"] for tr in tracks]).reshape(-1, 4), W, args.bins, zones)
+    out = cam_dir / "signs.jsonl"
+    with open(out, "w", encoding="utf-8") as f:
+        for tr, rec, seg in zip(tracks, recs, segs):
+            rec.update(box=[round(float(v), 1) for v in tr["box"]], hits=tr["hits"],
+                       sharpness=round(tr["sharpness"], 1), t=round(tr["t"], 2), segment=seg)
+            f.write(json.dumps(rec) + "\n")
+
+    print("\n| sign | segment | hits | sharpness | OCR | text |")
+    print("|------|---------|------|-----------|-----|------|")
+    for rec in recs:
+        text = " / ".join(line for line in rec["text"].splitlines() if line.strip())
+        print(f"| {rec['sign_id']} | {rec['segment']} | {rec['hits']} | {rec['sharpness']:.0f} | "
+              f"{'cached' if rec['cached'] else 'new'} | {text} |")
+    print(f"{len(new)} OCRed, {len(recs) - len(new)} known to {camera}")
+    print("Wrote:", out)
+
+if __name__ == "__main__":
+    main()
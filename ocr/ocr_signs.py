@@ -1,24 +1,165 @@
-import cv2, argparse, os
+# ocr/ocr_signs.py
+# Tesseract OCR of parking-sign crops.
+# Usage (from project root):
+#   python ocr/ocr_signs.py --image ocr/samples/sign1.png                   # one sign -> ocr_raw.txt
+#   python ocr/ocr_signs.py --images ocr/samples --workers 4                 # batch -> ocr_raw.jsonl
+#   python ocr/ocr_signs.py --images crops.txt --out_jsonl ocr/outputs/ocr_raw.jsonl
+#   python ocr/parse_rules.py --in_jsonl ocr/outputs/ocr_raw.jsonl            # rules for every sign
+#
+# Batch mode takes a directory of crops or a manifest (one image path per
+# line, relative to the manifest) and OCRs them on a process pool. Results
+# are cached by a hash of the image bytes + OCR config + tesseract version,
+# so a rerun only OCRs signs it has not seen. The tesseract binary is taken
+# from $TESSERACT_CMD, else the usual Windows install, else the PATH.
+import cv2, argparse, hashlib, json, os, time
+from multiprocessing import Pool
+from pathlib import Path
+import numpy as np
 import pytesseract
 
-# Windows: point to the exe
-pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+WINDOWS_CMD = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+CONFIG = "--psm 6"
+PREPROC = "gray-v1"  # bump when the preprocessing below changes, so cached text is redone
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp"}
 
-def ocr_image(path):
+def set_tesseract_cmd(cmd=None):
+    cmd = cmd or os.environ.get("TESSERACT_CMD")
+    if not cmd and os.name == "nt" and os.path.exists(WINDOWS_CMD):
+        cmd = WINDOWS_CMD
+    if cmd:
+        pytesseract.pytesseract.tesseract_cmd = cmd
+
+def ocr_array(img, config=CONFIG):
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    # light cleanup (you can extend later)
+    return pytesseract.image_to_string(gray, config=config)
+
+def ocr_image(path, config=CONFIG):
     img = cv2.imread(path)
     if img is None:
         raise SystemExit(f"Cannot read image: {path}")
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    # light cleanup (you can extend later)
-    text = pytesseract.image_to_string(gray, config="--psm 6")
-    return text
+    return ocr_array(img, config)
 
-if __name__ == "__main__":
+def list_images(src):
+    """Image paths of a directory (sorted) or of a manifest file."""
+    src = Path(src)
+    if src.is_dir():
+        return [str(p) for p in sorted(src.iterdir()) if p.suffix.lower() in IMAGE_EXTS]
+    if not src.is_file():
+        raise SystemExit(f"Cannot find images: {src}")
+    paths = []
+    for line in src.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if line and not line.startswith("#"):
+            p = Path(line)
+            paths.append(str(p if p.is_absolute() else src.parent / p))
+    return paths
+
+def ocr_key(data, config=CONFIG, version=""):
+    h = hashlib.sha1(data)
+    h.update(f"\0{config}\0{PREPROC}\0{version}".encode("utf-8"))
+    return h.hexdigest()
+
+def load_cache(path):
+    """key -> {text, ocr_seconds} from an append-only JSONL cache (last line wins)."""
+    cache = {}
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    rec = json.loads(line)
+                    cache[rec["key"]] = rec
+    return cache
+
+def _init_worker(cmd):
+    set_tesseract_cmd(cmd)
+
+def _ocr_one(task):
+    path, data, config = task
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return path, None, 0.0
+    t0 = time.perf_counter()
+    text = ocr_array(img, config)
+    return path, text, time.perf_counter() - t0
+
+def ocr_batch(paths, cache_path=None, config=CONFIG, workers=1, cmd=None):
+    """OCR records (image, key, text, ocr_seconds, cached) in `paths` order.
+    Only images missing from the cache are OCRed; new results are appended
+    to the cache as they arrive."""
+    set_tesseract_cmd(cmd)
+    version = str(pytesseract.get_tesseract_version())
+    cache = load_cache(cache_path)
+    recs, todo = {}, []
+    for p in paths:
+        data = Path(p).read_bytes()
+        key = ocr_key(data, config, version)
+        hit = cache.get(key)
+        if hit is not None:
+            recs[p] = {"image": p, "key": key, "text": hit["text"], "ocr_seconds": hit["ocr_seconds"], "cached": True}
+        else:
+            recs[p] = {"image": p, "key": key}
+            todo.append((p, data, config))
+
+    if todo:
+        if cache_path:
+            os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        f = open(cache_path, "a", encoding="utf-8") if cache_path else None
+        workers = max(1, min(workers, len(todo)))
+        try:
+            with Pool(workers, initializer=_init_worker, initargs=(pytesseract.pytesseract.tesseract_cmd,)) as pool:
+                for path, text, sec in pool.imap_unordered(_ocr_one, todo):
+                    if text is None:
+                        print("Skipped (cannot read):", path)
+                        recs.pop(path)
+                        continue
+                    rec = recs[path]
+                    rec.update(text=text, ocr_seconds=round(sec, 4), cached=False)
+                    if f:
+                        f.write(json.dumps({"key": rec["key"], "text": text, "ocr_seconds": rec["ocr_seconds"],
+                                            "config": config, "tesseract": version}) + "\n")
+                        f.flush()
+        finally:
+            if f:
+                f.close()
+    return [recs[p] for p in paths if p in recs]
+
+def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--image", required=True, help="path to a sign image")
-    ap.add_argument("--out", default="ocr/outputs/ocr_raw.txt")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--image", help="path to a sign image")
+    src.add_argument("--images", help="directory of sign crops, or a manifest with one image path per line")
+    ap.add_argument("--out", default="ocr/outputs/ocr_raw.txt", help="--image output")
+    ap.add_argument("--out_jsonl", default="ocr/outputs/ocr_raw.jsonl", help="--images output, one record per image")
+    ap.add_argument("--cache", default="ocr/outputs/ocr_cache.jsonl", help="OCR result cache ('' = none)")
+    ap.add_argument("--config", default=CONFIG, help="tesseract config")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="OCR processes")
+    ap.add_argument("--tesseract_cmd", default=None, help="tesseract binary (default: $TESSERACT_CMD or PATH)")
     args = ap.parse_args()
-    os.makedirs(os.path.dirname(args.out), exist_ok=True)
-    txt = ocr_image(args.image)
-    open(args.out, "w", encoding="utf-8").write(txt)
-    print("OCR saved to:", args.out)
+
+    if args.image:
+        set_tesseract_cmd(args.tesseract_cmd)
+        os.makedirs(os.path.dirname(args.out), exist_ok=True)
+        txt = ocr_image(args.image, args.config)
+        open(args.out, "w", encoding="utf-8").write(txt)
+        print("OCR saved to:", args.out)
+        return
+
+    paths = list_images(args.images)
+    if not paths:
+        raise SystemExit(f"No images in {args.images}")
+    t0 = time.perf_counter()
+    recs = ocr_batch(paths, args.cache or None, args.config, args.workers, args.tesseract_cmd)
+    wall = time.perf_counter() - t0
+    os.makedirs(os.path.dirname(args.out_jsonl) or ".", exist_ok=True)
+    with open(args.out_jsonl, "w", encoding="utf-8") as f:
+        for rec in recs:
+            f.write(json.dumps(rec) + "\n")
+    hits = sum(r["cached"] for r in recs)
+    busy = sum(r["ocr_seconds"] for r in recs if not r["cached"])
+    print(f"{len(recs)} images: {hits} cached, {len(recs) - hits} OCRed "
+          f"({busy:.2f} OCR-s on {args.workers} worker(s), {wall:.2f}s wall)")
+    print("Wrote:", args.out_jsonl)
+
+if __name__ == "__main__":
+    main()
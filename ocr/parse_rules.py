@@ -2,6 +2,14 @@ import re, json, argparse
 
 DAY_PAT = r"(MON|TUE|WED|THU|FRI|SAT|SUN)"
 HOUR_PAT = r"(\d{1,2})(?::?(\d{2}))?\s*(AM|PM)?"
+DAYS = ["MON","TUE","WED","THU","FRI","SAT","SUN"]
+
+# compiled once at import, not per text
+DUR_RE = re.compile(r"\b(\d+)\s*(H|HOUR|MIN|MINUTES)\b")
+RANGE_RE = re.compile(fr"{DAY_PAT}\s*-\s*{DAY_PAT}")
+DAY_RE = re.compile(DAY_PAT)
+TIME_RE = re.compile(fr"{HOUR_PAT}\s*[-–]\s*{HOUR_PAT}")
+ARROWS = ("→", "➡", ">")
 
 def to_24(h, m=None, ampm=None):
     h = int(h); m = int(m) if m else 0
@@ -12,30 +20,30 @@ def to_24(h, m=None, ampm=None):
 
 def parse_rules(text):
     t = text.upper().replace("\n"," ")
-    # duration like "2H" / "2 HOUR"
-    dur_m = re.search(r"\b(\d+)\s*(H|HOUR)\b", t)
-    duration = f"{dur_m.group(1)}h" if dur_m else None
+    # duration like "2H" / "2 HOUR" / "30 MIN"
+    dur_m = DUR_RE.search(t)
+    duration = (f"{dur_m.group(1)}{'h' if dur_m.group(2).startswith('H') else 'min'}" if dur_m
+                else None)
 
     # days: handle "MON-FRI" ranges or list of days
     days = []
-    rng = re.search(fr"{DAY_PAT}\s*-\s*{DAY_PAT}", t)
+    rng = RANGE_RE.search(t)
     if rng:
-        order = ["MON","TUE","WED","THU","FRI","SAT","SUN"]
         a,b = rng.group(1), rng.group(2)
-        ai,bi = order.index(a), order.index(b)
-        days = order[ai:bi+1] if ai<=bi else order[ai:]+order[:bi+1]
+        ai,bi = DAYS.index(a), DAYS.index(b)
+        days = DAYS[ai:bi+1] if ai<=bi else DAYS[ai:]+DAYS[:bi+1]
     else:
-        days = re.findall(DAY_PAT, t) or ["MON","FRI"]
+        days = DAY_RE.findall(t) or ["MON","FRI"]
 
     # times like "9AM-6PM" or "09:00-18:00"
-    tm = re.search(fr"{HOUR_PAT}\s*[-–]\s*{HOUR_PAT}", t)
+    tm = TIME_RE.search(t)
     if tm:
         start = to_24(tm.group(1), tm.group(2), tm.group(3))
         end   = to_24(tm.group(4), tm.group(5), tm.group(6))
     else:
         start, end = "09:00", "18:00"
 
-    direction = "→" if any(x in t for x in ["→", "➡", ">"]) else None
+    direction = "→" if any(x in t for x in ARROWS) else None
 
     return {
         "windows": [{"days": days, "start": start, "end": end}],
@@ -44,12 +52,49 @@ def parse_rules(text):
         "direction": direction
     }
 
+def parse_many(texts):
+    """parse_rules for a whole list of OCR texts in one call; repeated texts
+    (the same sign seen again) are parsed once and share their result."""
+    memo = {}
+    out = []
+    for t in texts:
+        r = memo.get(t)
+        if r is None:
+            r = memo[t] = parse_rules(t)
+        out.append(r)
+    return out
+
+def parse_records(recs):
+    """Rules for OCR records (ocr_signs.py --images output): [{image, key,
+    rules}] in input order, plus `segment` when the record has one."""
+    rules = parse_many([r["text"] for r in recs])
+    out = []
+    for r, rule in zip(recs, rules):
+        rec = {"image": r["image"], "key": r.get("key"), "rules": rule}
+        if r.get("segment") is not None:
+            rec["segment"] = r["segment"]
+        out.append(rec)
+    return out
+
+def read_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--in_txt", default="ocr/outputs/ocr_raw.txt")
     ap.add_argument("--out_json", default="ocr/outputs/rules.json")
+    ap.add_argument("--in_jsonl", default=None, help="ocr_signs.py --images output: rules for every sign in it")
+    ap.add_argument("--out_jsonl", default="ocr/outputs/rules.jsonl", help="--in_jsonl output, one record per sign")
     args = ap.parse_args()
-    txt = open(args.in_txt, "r", encoding="utf-8").read()
-    rules = parse_rules(txt)
-    open(args.out_json, "w", encoding="utf-8").write(json.dumps(rules, indent=2))
-    print("Rules saved to:", args.out_json)
+    if args.in_jsonl:
+        out = parse_records(read_jsonl(args.in_jsonl))
+        with open(args.out_jsonl, "w", encoding="utf-8") as f:
+            for rec in out:
+                f.write(json.dumps(rec) + "\n")
+        print(f"Rules for {len(out)} signs saved to:", args.out_jsonl)
+    else:
+        txt = open(args.in_txt, "r", encoding="utf-8").read()
+        rules = parse_rules(txt)
+        open(args.out_json, "w", encoding="utf-8").write(json.dumps(rules, indent=2))
+        print("Rules saved to:", args.out_json)
@@ -0,0 +1,195 @@
+# robustness/run_grid.py
+# Robustness grid: every (variant x conf x tracker x imgsz) cell is tracked
+# on a process pool whose workers keep their YOLO models loaded, summarized
+# into its own det_track/outputs/grid/<cell>/, and collected into one table.
+# Usage (from project root):
+#   python robustness/run_grid.py
+#   python robustness/run_grid.py --variants original dark blur lowres --conf 0.12 0.15 0.25 \
+#       --trackers bytetrack.yaml botsort.yaml --imgsz 640 960 --workers 4
+#   python robustness/run_grid.py --gt det_track/outputs/gt_tracks.csv   # + HOTA / MOTA / IDF1 per cell
+#   python robustness/run_grid.py --zones det_track/curb_zones.geojson   # segments = curb zones
+#
+# A cell is cached under the source video's fingerprint (size plus first and
+# last MB, as mask_cache.py keys videos) and every parameter that changes its
+# result; a rerun skips cells whose <cell>/result.json carries the same key
+# (--force reruns everything). A model reused across cells gets a fresh
+# tracker per cell (track.reset_tracker).
+# Variants are made in memory (make_variants.py), "original" is the source.
+
+import argparse, hashlib, json, os, subprocess, sys, time
+from multiprocessing import Pool
+from pathlib import Path
+import pandas as pd
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / "det_track"))
+sys.path.insert(0, str(REPO / "robustness"))
+sys.path.insert(0, str(REPO / "segmentation"))
+from track import VEHICLE_CLASSES, run_tracking, track_variants
+from backends import BACKENDS
+from make_variants import TRANSFORMS, variant_width
+from online_summary import video_fps_width
+from run_robustness import derive_avgs_from_tracks
+from mask_cache import video_fingerprint
+
+ORIGINAL = "original"  # the source itself, as a baseline row
+SUMMARY = dict(park_win=10, park_thr=0.5, bins=4, timebin=5)
+
+_models = {}  # per worker: (weights, backend, imgsz) -> loaded model, reused by every cell
+
+def _init_worker(threads):
+    import torch
+    torch.set_num_threads(threads)  # split the cores instead of every worker using all of them
+
+def warm_model(weights, backend, imgsz):
+    from backends import load_model
+    key = (weights, backend, imgsz if backend != "torch" else 0)  # torch weights serve every imgsz
+    if key not in _models:
+        _models[key] = load_model(weights, backend, imgsz)
+    return _models[key]
+
+def file_sha1(path, block=1 << 20):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for b in iter(lambda: f.read(block), b""):
+            h.update(b)
+    return h.hexdigest()
+
+def cell_key(video_fp, params):
+    blob = json.dumps({"video": video_fp, **params}, sort_keys=True)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()[:16]
+
+def cell_name(p):
+    return f"{p['variant']}_c{p['conf']:g}_{Path(p['tracker']).stem}_{p['imgsz']}"
+
+def cached(cell_dir, key):
+    res = Path(cell_dir) / "result.json"
+    if res.exists():
+        rec = json.loads(res.read_text(encoding="utf-8"))
+        if rec.get("key") == key:
+            return rec
+    return None
+
+def _run_cell(task):
+    p, source, cell_dir, key, gt, scale, zones = task
+    os.makedirs(cell_dir, exist_ok=True)
+    tracks = os.path.join(cell_dir, "tracks.trk")
+    model = warm_model(p["weights"], p["backend"], p["imgsz"])
+    kw = dict(conf=p["conf"], iou=p["iou"], imgsz=p["imgsz"], classes=p["classes"] or None,
+              tracker=p["tracker"], save=False, vid_stride=p["vid_stride"])
+    t0 = time.perf_counter()
+    if p["variant"] == ORIGINAL:
+        frames, rows = run_tracking(model, source, tracks, kw, verbose=False)
+    else:
+        frames, rows = track_variants({p["variant"]: model}, source, {p["variant"]: tracks}, {p["variant"]: kw})
+        rows = rows[p["variant"]]
+    track_s = time.perf_counter() - t0
+
+    # summaries go to the cell's own directory, so cells never share outputs
+    cmd = [sys.executable, str(REPO/"det_track"/"summarize_tracks.py"), "--tracks", tracks,
+           "--video", source, "--out_dir", cell_dir] + [f"--{k}={v}" for k, v in SUMMARY.items()]
+    if zones:
+        cmd += ["--zones", zones]
+    r = subprocess.run(cmd, capture_output=True, text=True)
+    if r.returncode != 0:
+        raise RuntimeError(f"summarize_tracks failed for {cell_dir}:\n{r.stdout}\n{r.stderr}")
+    avg_u, avg_p = derive_avgs_from_tracks(os.path.join(cell_dir, "tracks_with_speed.trk"),
+                                           bins=SUMMARY["bins"], timebin=SUMMARY["timebin"])
+    rec = {"key": key, **p, "rows": rows, "frames": frames, "track_seconds": round(track_s, 3),
+           "fps": round(frames / track_s, 2) if track_s > 0 else 0.0,
+           "avg_ids_per_bin": avg_u, "avg_parked_per_bin": avg_p, "worker": os.getpid()}
+    if gt:
+        from eval_track import load_tracks, evaluate, BOX
+        pred = load_tracks(tracks)
+        pred[BOX] = pred[BOX].astype("float64") * scale  # back to source pixels
+        m = evaluate(load_tracks(gt), pred)
+        rec.update({k: m[k] for k in ["HOTA", "MOTA", "IDF1", "IDSW"]})
+    with open(os.path.join(cell_dir, "result.json"), "w", encoding="utf-8") as f:
+        json.dump(rec, f, indent=2)
+    return rec
+
+def main():
+    ap = argparse.ArgumentParser(description="Parallel, cached robustness grid (variant x conf x tracker x imgsz)")
+    ap.add_argument("--source", default=str(REPO / "det_track" / "sample_video.mp4"))
+    ap.add_argument("--variants", nargs="+", default=[ORIGINAL] + list(TRANSFORMS),
+                    help=f"{ORIGINAL!r} and/or registered variants {sorted(TRANSFORMS)}")
+    ap.add_argument("--conf", type=float, nargs="+", default=[0.12, 0.15, 0.25])
+    ap.add_argument("--trackers", nargs="+", default=["bytetrack.yaml", "botsort.yaml"])
+    ap.add_argument("--imgsz", type=int, nargs="+", default=[640])
+    ap.add_argument("--weights", default="yolov8n.pt")
+    ap.add_argument("--backend", default="torch", choices=BACKENDS, help="see backends.py")
+    ap.add_argument("--iou", type=float, default=0.5, help="NMS IoU threshold")
+    ap.add_argument("--classes", type=int, nargs="*", default=VEHICLE_CLASSES)
+    ap.add_argument("--vid_stride", type=int, default=1)
+    ap.add_argument("--gt", default=None, help="ground-truth tracks (eval_track.py formats) for HOTA / MOTA / IDF1")
+    ap.add_argument("--zones", default=None, help="curb zone polygons (GeoJSON, see curb_zones.py) for the summaries")
+    ap.add_argument("--outdir", default=str(REPO / "det_track" / "outputs" / "grid"))
+    ap.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                    help="Worker processes (each keeps its models loaded)")
+    ap.add_argument("--force", action="store_true", help="ignore cached cells")
+    args = ap.parse_args()
+
+    bad = [v for v in args.variants if v != ORIGINAL and v not in TRANSFORMS]
+    if bad:
+        raise SystemExit(f"Unknown variant(s) {bad}; registered: {sorted(TRANSFORMS)}")
+    if not os.path.isfile(args.source):
+        raise SystemExit(f"Cannot find source video: {args.source}")
+
+    video_fp = video_fingerprint(args.source)
+    w = os.stat(args.weights) if os.path.exists(args.weights) else None
+    gt_sha1 = file_sha1(args.gt) if args.gt and os.path.isfile(args.gt) else args.gt
+    if args.zones and not os.path.isfile(args.zones):
+        raise SystemExit(f"Cannot find zone file: {args.zones}")
+    zones_sha1 = file_sha1(args.zones) if args.zones else None
+    src_w = video_fps_width(args.source)[1]
+    scales = {v: (src_w / variant_width(v, args.source) if v != ORIGINAL and src_w else 1.0) for v in args.variants}
+
+    done, tasks = [], []
+    for v in args.variants:
+        for imgsz in args.imgsz:
+            for tracker in args.trackers:
+                for conf in args.conf:
+                    p = dict(variant=v, conf=conf, tracker=tracker, imgsz=imgsz, weights=args.weights,
+                             backend=args.backend, iou=args.iou, classes=args.classes, vid_stride=args.vid_stride)
+                    key = cell_key(video_fp, dict(p, summary=SUMMARY, gt=gt_sha1, zones=zones_sha1,
+                                                  weights_stat=[w.st_size, int(w.st_mtime)] if w else None))
+                    cell_dir = os.path.join(args.outdir, cell_name(p))
+                    rec = None if args.force else cached(cell_dir, key)
+                    if rec is not None:
+                        done.append(rec)
+                    else:
+                        tasks.append((p, args.source, cell_dir, key, args.gt, scales[v], args.zones))
+
+    # grouped by model (imgsz) so each worker mostly reuses the one it has warm
+    tasks.sort(key=lambda t: (t[0]["imgsz"], t[0]["variant"]))
+    n_cells = len(done) + len(tasks)
+    workers = max(1, min(args.workers, len(tasks)))
+    print(f"{n_cells} cells: {len(done)} cached, {len(tasks)} to run on {workers} worker(s)")
+    t0 = time.perf_counter()
+    if tasks:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        with Pool(workers, initializer=_init_worker, initargs=(threads,)) as pool:
+            for k, rec in enumerate(pool.imap_unordered(_run_cell, tasks), start=1):
+                done.append(rec)
+                print(f"  [{k}/{len(tasks)}] {cell_name(rec)}: {rec['frames']} frames, {rec['fps']:.1f} fps")
+    print(f"Grid done in {time.perf_counter() - t0:.1f}s")
+
+    # one combined table
+    df = pd.DataFrame(done)
+    df["tracker"] = df["tracker"].map(lambda t: Path(t).stem)
+    df = df.sort_values(["variant", "tracker", "imgsz", "conf"]).reset_index(drop=True)
+    cols = ["variant", "tracker", "imgsz", "conf", "avg_ids_per_bin", "avg_parked_per_bin", "fps"]
+    cols += [c for c in ["HOTA", "MOTA", "IDF1", "IDSW"] if c in df.columns]
+    os.makedirs(args.outdir, exist_ok=True)
+    out_csv = os.path.join(args.outdir, "grid_results.csv")
+    df[cols + ["rows", "frames", "track_seconds", "key"]].to_csv(out_csv, index=False)
+
+    print(f"\n# Robustness grid (per {SUMMARY['timebin']}s bin, px/frame)\n")
+    print("| " + " | ".join(cols) + " |")
+    print("|" + "|".join("-" * (len(c) + 2) for c in cols) + "|")
+    for r in df[cols].itertuples(index=False):
+        print("| " + " | ".join(f"{v:.3f}" if isinstance(v, float) else str(v) for v in r) + " |")
+    print("Wrote:", out_csv)
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,19 @@
-import os, sys, subprocess, json
-import numpy as np
+import sys, subprocess, json
 import pandas as pd
 import cv2
-import imageio
-import imageio_ffmpeg as ioff
 from pathlib import Path
 
 REPO = Path(__file__).resolve().parents[1]
 SRC  = REPO / "det_track" / "sample_video.mp4"     # change if your source differs
-ROB  = REPO / "robustness"
 OUTS = REPO / "det_track" / "outputs"
+CHUNK_ROWS = 0  # > 0: summarize / average tracks out of core, this many rows at a time
+LABELS = OUTS / "labels.csv"  # if present, each clip's --conf is tuned on it (best F1, eval_det.py --sweep)
+SWEEP_CONF = 0.01             # detection dump threshold for the sweep
+SAVE_VARIANTS = None          # e.g. REPO / "robustness": also write <variant>.mp4 there, only to look at them
+sys.path.insert(0, str(REPO / "det_track"))
+from track_store import read_tracks, store_columns, iter_frame_chunks
+from chunked import UniqueByBin
+from make_variants import variant_width
 
 def run(cmd):
     print(">>", " ".join(str(c) for c in cmd))
@@ -18,65 +22,70 @@ def run(cmd):
         print(r.stdout); print(r.stderr)
         sys.exit(r.returncode)
 
-def make_variants(source, outdir, fps=15):
-    outdir.mkdir(parents=True, exist_ok=True)
-    cap = cv2.VideoCapture(str(source))
-    if not cap.isOpened():
-        sys.exit(f"Could not open source video: {source}")
-    W = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)  or 1280)
-    H = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 720)
-
-    def writer(path, W, H):
-        w = imageio.get_writer(
-            str(path), fps=fps, codec="libx264",
-            pixelformat="yuv420p", bitrate="2000k"
-        )
-        return w
-
-    dark_w  = writer(outdir / "dark.mp4",   W, H)
-    blur_w  = writer(outdir / "blur.mp4",   1280, int(1280*H/W))
-    low_w   = writer(outdir / "lowres.mp4", 854,  int(854*H/W))
-
-    while True:
-        ok, frame = cap.read()
-        if not ok: break
-
-        # Dark variant (slightly darker, slightly higher contrast)
-        dark = cv2.convertScaleAbs(frame, alpha=1.1, beta=-12)
-        dark_w.append_data(cv2.cvtColor(dark, cv2.COLOR_BGR2RGB))
-
-        # Blur variant (Gaussian blur + resize to 1280 wide)
-        blur = cv2.GaussianBlur(frame, (0,0), 2.0)
-        blur = cv2.resize(blur, (1280, int(1280*H/W)))
-        blur_w.append_data(cv2.cvtColor(blur, cv2.COLOR_BGR2RGB))
-
-        # Low-res variant (854 wide)
-        low = cv2.resize(frame, (854, int(854*H/W)))
-        low_w.append_data(cv2.cvtColor(low, cv2.COLOR_BGR2RGB))
-
-    cap.release()
-    dark_w.close(); blur_w.close(); low_w.close()
-    print("Wrote:", outdir / "dark.mp4")
-    print("Wrote:", outdir / "blur.mp4")
-    print("Wrote:", outdir / "lowres.mp4")
-
-def ensure_tracks_and_summaries(video_path, conf=0.15, park_win=10, park_thr=0.5, bins=4, timebin=5):
-    # 1) run tracking for this video → det_track/outputs/tracks.csv
+def track_variants(confs):
+    # one decode of SRC; every variant is degraded in memory and streamed into
+    # its own tracker -> det_track/outputs/tracks_<variant>.trk
     run([sys.executable, str(REPO/"det_track"/"track.py"),
-         "--source", str(video_path),
-         "--conf", str(conf)])
+         "--source", str(SRC), "--out", str(OUTS/"tracks.trk"),
+         "--variants", *[f"{name}={conf}" for name, conf in confs.items()]]
+        + (["--save_variants", str(SAVE_VARIANTS)] if SAVE_VARIANTS else []))
 
-    # 2) summarize (px/frame speeds; overwrites outputs/*.csv each time)
+def summarize(tracks_path, park_win=10, park_thr=0.5, bins=4, timebin=5):
+    # px/frame speeds; overwrites outputs/*.csv and tracks_with_speed.trk each time
     run([sys.executable, str(REPO/"det_track"/"summarize_tracks.py"),
-         "--csv",   str(REPO/"det_track"/"outputs"/"tracks.csv"),
-         "--video", str(video_path),
+         "--tracks", str(tracks_path),
+         "--video", str(SRC),
          "--park_win", str(park_win),
          "--park_thr", str(park_thr),
          "--bins",     str(bins),
-         "--timebin",  str(timebin)])
+         "--timebin",  str(timebin)]
+        + (["--chunk_rows", str(CHUNK_ROWS)] if CHUNK_ROWS else []))
 
-def derive_avgs_from_tracks(tracks_csv, bins=4, timebin=5):
-    df = pd.read_csv(tracks_csv)  # must contain: id, time_sec, cx, is_parked
+def video_width(path):
+    cap = cv2.VideoCapture(str(path))
+    w = cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 0.0
+    cap.release()
+    return w
+
+def tune_conf(configs):
+    # one low-conf detection dump per variant over the labelled frames, then a
+    # single sweep for all of them -> {variant: best-F1 conf, F1} (class-agnostic)
+    if not LABELS.exists():
+        return {}
+    n_frames = int(read_tracks(LABELS, ["frame"])["frame"].max())
+    src_w = video_width(SRC)
+    preds, scales = [], []
+    for label, _ in configs:
+        out = OUTS / f"sweep_{label}.trk"
+        run([sys.executable, str(REPO/"det_track"/"detect_to_csv.py"),
+             "--source", str(SRC), "--variant", label, "--conf", str(SWEEP_CONF), "--max_frames", str(n_frames),
+             "--out", str(out), "--throughput_log", ""])
+        preds.append(f"{label}={out}")
+        w = variant_width(label, SRC)
+        scales.append(str(src_w / w if src_w and w else 1.0))
+    sweep_json = OUTS / "robustness_sweep.json"
+    run([sys.executable, str(REPO/"det_track"/"eval_det.py"), "--sweep", "--gt", str(LABELS),
+         "--pred", *preds, "--pred_scale", *scales, "--out_json", str(sweep_json)])
+    results = json.loads(sweep_json.read_text(encoding="utf-8"))["results"]
+    return {r["variant"]: (r["best_conf"], r["best_f1"]) for r in results if r["cls"] == "all" and "best_conf" in r}
+
+def derive_avgs_chunked(tracks_path, timebin=5, chunk_rows=1_000_000):
+    # same averages from frame-ordered chunks; only the open time bin spans chunks
+    ids_per_bin, parked_per_bin = UniqueByBin(["tbin"], "n"), UniqueByBin(["tbin"], "n")
+    for df in iter_frame_chunks(tracks_path, ["id", "time_sec", "is_parked"], chunk_rows):
+        df["tbin"] = (df["time_sec"] // timebin).astype(int) * timebin
+        open_tbin = df["tbin"].iat[-1]
+        ids_per_bin.add(df, open_tbin)
+        parked_per_bin.add(df[df["is_parked"]==1], open_tbin)
+    u, p = ids_per_bin.result()["n"], parked_per_bin.result()["n"]
+    return (float(u.mean()) if len(u) else 0.0), (float(p.mean()) if len(p) else 0.0)
+
+def derive_avgs_from_tracks(tracks_path, bins=4, timebin=5, chunk_rows=None):
+    if chunk_rows:
+        return derive_avgs_chunked(tracks_path, timebin, chunk_rows)
+    # only the columns we need (track store or CSV): id, time_sec, cx, is_parked [, segment]
+    cols = [c for c in ["id", "time_sec", "cx", "is_parked", "segment"] if c in store_columns(tracks_path)]
+    df = read_tracks(tracks_path, cols)
     if df.empty:
         return 0.0, 0.0
     if "segment" not in df.columns:
@@ -89,22 +98,24 @@ def derive_avgs_from_tracks(tracks_csv, bins=4, timebin=5):
     return avg_u, avg_p
 
 def main():
-    # make sure imageio uses its bundled ffmpeg (avoids DLL mismatch)
-    _ = ioff.get_ffmpeg_exe()
-
-    # 1) build variants
-    make_variants(SRC, ROB, fps=15)
-
-    # 2) per-clip: track → summarize → compute averages from tracks_with_speed.csv
-    rows = []
-    configs = [
-        ("dark.mp4",   ROB/"dark.mp4",   0.15),
-        ("blur.mp4",   ROB/"blur.mp4",   0.12),  # a bit lower conf helps on blur
-        ("lowres.mp4", ROB/"lowres.mp4", 0.15),
+    # 1) conf per variant; degraded frames are made in memory, nothing is re-encoded
+    configs = [  # fallback conf per variant, used when there are no labels to tune on
+        ("dark",   0.15),
+        ("blur",   0.12),  # a bit lower conf helps on blur
+        ("lowres", 0.15),
     ]
-    for label, vid, conf in configs:
-        ensure_tracks_and_summaries(vid, conf=conf)
-        avg_u, avg_p = derive_avgs_from_tracks(OUTS/"tracks_with_speed.csv")
+    tuned = tune_conf(configs)  # replaces the fixed per-variant conf when labels exist
+    confs, notes = dict(configs), {}
+    for label, (conf, f1) in tuned.items():
+        confs[label] = conf
+        notes[label] = f"conf={conf:.2f} (best F1 {f1:.2f})"
+
+    # 2) track all variants from one decode, then summarize → averages from tracks_with_speed.trk
+    track_variants(confs)
+    rows = []
+    for label, _ in configs:
+        summarize(OUTS/f"tracks_{label}.trk")
+        avg_u, avg_p = derive_avgs_from_tracks(OUTS/"tracks_with_speed.trk", chunk_rows=CHUNK_ROWS or None)
         rows.append((label, avg_u, avg_p))
 
     # 3) print table (pasteable for README)
@@ -112,9 +123,9 @@ def main():
     print("| clip       | avg unique_ids / 5s | parked / 5s | note                         |")
     print("|------------|----------------------|-------------|------------------------------|")
     for label, avg_u, avg_p in rows:
-        note = ("slight drop; conf=0.15 ok" if label=="dark.mp4"
-                else "recall ↓; conf=0.12 helps" if label=="blur.mp4"
-                else "small objects weaker")
+        note = notes.get(label) or ("slight drop; conf=0.15 ok" if label=="dark"
+                                    else "recall ↓; conf=0.12 helps" if label=="blur"
+                                    else "small objects weaker")
         print(f"| {label:<9} | {avg_u:>6.2f}              | {avg_p:>6.2f}       | {note:28} |")
 
     # 4) optionally write docs/robustness.md
@@ -123,9 +134,9 @@ def main():
            "| clip       | avg unique_ids / 5s | parked / 5s | note                         |",
            "|------------|----------------------|-------------|------------------------------|" ]
     for label, avg_u, avg_p in rows:
-        note = ("slight drop; conf=0.15 ok" if label=="dark.mp4"
-                else "recall ↓; conf=0.12 helps" if label=="blur.mp4"
-                else "small objects weaker")
+        note = notes.get(label) or ("slight drop; conf=0.15 ok" if label=="dark"
+                                    else "recall ↓; conf=0.12 helps" if label=="blur"
+                                    else "small objects weaker")
         md.append(f"| {label:<9} | {avg_u:>6.2f}              | {avg_p:>6.2f}       | {note} |")
     (docs/"robustness.md").write_text("\n".join(md), encoding="utf-8")
     print("Wrote:", docs/"robustness.md")
@@ -1,46 +1,115 @@
 # segmentation/apply_segformer.py
+# SegFormer (ADE20K) on sampled keyframes of a video -> side-by-side overlay PNGs.
+# Usage (from project root):
+#   python segmentation/apply_segformer.py --source det_track/sample_video.mp4
+#   python segmentation/apply_segformer.py --frames 0 --every_sec 2 --batch 16   # whole video, 1 frame / 2 s
+#   python segmentation/apply_segformer.py --mask_cache segmentation/outputs/mask_cache/sample_video
+#
+# Sampled frames are reached by seeking (nothing in between is decoded) and
+# go through the model --batch at a time on the frame pipeline, so memory is
+# bounded by --batch and --queue_depth however many frames are sampled.
+# argmax runs on the model-resolution logits; only the uint8 label map is
+# upsampled (nearest) to the source size, never the 150-class float logits.
 from transformers import SegformerFeatureExtractor, SegformerForSemanticSegmentation
 from PIL import Image
-import torch, numpy as np, os, cv2, argparse
+from pathlib import Path
+import torch, numpy as np, os, sys, cv2, argparse
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "det_track"))
+from frame_pipeline import read_frames, seek_frames, run_pipeline
 
 LABELS = ["background","road","sidewalk","building","wall","fence","pole","traffic light","traffic sign",
           "vegetation","terrain","sky","person","rider","car","truck","bus","train","motorcycle","bicycle"]
+PALETTE = (np.random.RandomState(0).rand(len(LABELS), 3) * 255).astype(np.uint8)
+
+MODEL_NAME = "nvidia/segformer-b0-finetuned-ade-512-512"
+
+def load_segformer(name=MODEL_NAME):
+    feat = SegformerFeatureExtractor.from_pretrained(name)
+    model = SegformerForSemanticSegmentation.from_pretrained(name)
+    model.eval()
+    if torch.cuda.is_available():
+        model.to("cuda")
+    return feat, model
+
+def segment_batch(feat, model, rgbs, native=False):
+    """Per-pixel ADE20K class ids (uint8, each frame's resolution) for a list
+    of RGB frames, in one model call. native=True returns the label maps at
+    model resolution instead (what mask_cache.py stores)."""
+    inputs = feat(images=list(rgbs), return_tensors="pt")
+    device = next(model.parameters()).device
+    with torch.inference_mode():
+        logits = model(pixel_values=inputs["pixel_values"].to(device)).logits  # (B, 150, H/4, W/4)
+        labels = logits.argmax(dim=1).to(torch.uint8).cpu().numpy()
+    if native:
+        return list(labels)
+    return [cv2.resize(lab, (rgb.shape[1], rgb.shape[0]), interpolation=cv2.INTER_NEAREST)
+            for lab, rgb in zip(labels, rgbs)]
+
+def segment(feat, model, rgb):
+    """Per-pixel ADE20K class ids (uint8, source resolution) for one RGB frame."""
+    return segment_batch(feat, model, [rgb])[0]
 
 def colorize(mask):
-    np.random.seed(0)
-    palette = (np.random.rand(len(LABELS),3)*255).astype(np.uint8)
-    return palette[mask % len(LABELS)]
+    return PALETTE[mask % len(LABELS)]
 
-if __name__ == "__main__":
+def sample_step(source, every_sec=1.0):
+    """(frames between samples, frame count or 0 if unknown) for one frame every `every_sec` s."""
+    cap = cv2.VideoCapture(str(source))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 15
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    cap.release()
+    return max(1, int(fps * every_sec)), total
+
+def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--source", default="det_track/sample_video.mp4")
     ap.add_argument("--outdir", default="segmentation/outputs")
-    ap.add_argument("--frames", type=int, default=4)
+    ap.add_argument("--frames", type=int, default=4, help="sampled frames to segment (0 = all of them)")
+    ap.add_argument("--every_sec", type=float, default=1.0, help="seconds between sampled frames")
+    ap.add_argument("--batch", type=int, default=8, help="frames per model call")
+    ap.add_argument("--queue_depth", type=int, default=4, help="frames buffered between decode/infer/write stages")
+    ap.add_argument("--mask_cache", default=None,
+                    help="take masks from this cache (mask_cache.py), segmenting only scene changes not cached yet")
     args = ap.parse_args()
     os.makedirs(args.outdir, exist_ok=True)
 
-    feat = SegformerFeatureExtractor.from_pretrained("nvidia/segformer-b0-finetuned-ade-512-512")
-    model = SegformerForSemanticSegmentation.from_pretrained("nvidia/segformer-b0-finetuned-ade-512-512")
-    model.eval()
+    if args.mask_cache:
+        from mask_cache import open_cache
+        cache = open_cache(args.source, args.mask_cache, args.every_sec, args.batch)
+        fps = cache.timeline(args.source)[0]["fps"]
+    else:
+        feat, model = load_segformer()
+    # the last frame of each interval (1-based frames step, 2*step, ...)
+    step, total = sample_step(args.source, args.every_sec)
+    limit = args.frames or None
+    if total:
+        idx = np.arange(step - 1, total, step)[:limit]
+        frames = seek_frames(args.source, idx)
+    else:  # frame count unknown (some streams): decode in order instead
+        idx = np.arange(limit or 0)
+        frames = read_frames(args.source, start=step - 1, stride=step, limit=limit)
+    digits = max(2, len(str(len(idx))))
 
-    cap = cv2.VideoCapture(args.source)
-    fps = cap.get(cv2.CAP_PROP_FPS) or 15
-    step = max(1, int(fps))  # ~1 fps
-    i, saved = 0, 0
-    while saved < args.frames:
-        ok, frame = cap.read()
-        if not ok: break
-        i += 1
-        if i % step: continue
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        inputs = feat(images=rgb, return_tensors="pt")
-        with torch.no_grad():
-            logits = model(**inputs).logits
-        up = torch.nn.functional.interpolate(logits, size=rgb.shape[:2], mode="bilinear", align_corners=False)
-        pred = up.argmax(dim=1)[0].cpu().numpy().astype(np.uint8)
+    def infer(idxs, bgrs):
+        rgbs = [cv2.cvtColor(f, cv2.COLOR_BGR2RGB) for f in bgrs]
+        if args.mask_cache:
+            return [(rgb, cache.mask_at(i / fps, args.source)) for i, rgb in zip(idxs, rgbs)]
+        return list(zip(rgbs, segment_batch(feat, model, rgbs)))
+
+    saved = [0]
+    def write(i, frame, res):
+        rgb, pred = res
         overlay = (0.6*rgb + 0.4*colorize(pred)).astype(np.uint8)
         out = np.hstack([rgb, overlay])
-        outp = os.path.join(args.outdir, f"seg_{saved+1:02d}.png")
+        saved[0] += 1
+        outp = os.path.join(args.outdir, f"seg_{saved[0]:0{digits}d}.png")
         Image.fromarray(out).save(outp)
-        print("Wrote", outp); saved += 1
-    cap.release()
\ No newline at end of file
+        print("Wrote", outp)
+
+    # PNG encoding runs on the writer thread
+    stats = run_pipeline(frames, infer, write, depth=args.queue_depth, batch=max(1, args.batch))
+    print(f"Segmented {stats['frames']} frames at {stats['fps']:.1f} fps, batch {stats['batch']} "
+          f"(busy s: {stats['busy_seconds']})")
+
+if __name__ == "__main__":
+    main()
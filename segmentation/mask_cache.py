@@ -0,0 +1,302 @@
+# segmentation/mask_cache.py
+# Persistent SegFormer label-map cache for fixed cameras, queried by (x, y, t)
+# without loading the transformer.
+# Usage (from project root):
+#   python segmentation/mask_cache.py build --source det_track/sample_video.mp4
+#   python segmentation/mask_cache.py build --source cam01_tue.mp4 --camera cam01   # reuses cam01's masks
+#   python segmentation/mask_cache.py at --cache segmentation/outputs/mask_cache/sample_video --x 640 --y 500 --t 12.5
+#   python segmentation/mask_cache.py stats --cache segmentation/outputs/mask_cache/sample_video
+#
+# A frame is sampled every --every_sec. Each sample is compared with the
+# keyframe of the mask in use through a 64x36 grey thumbnail. It is only
+# segmented when more than --change_area of the thumbnail moved by over
+# --change_diff grey levels (camera bumped, lighting flipped, works on the
+# curb), or when it matches no earlier keyframe either. Otherwise it reuses
+# that mask. Passing cars cover too little of the frame to trigger it.
+#
+# Cache directory (one per --camera, else per video), with one subdirectory
+# per key (model + sampling parameters), <sha1 of the key>[:12]/, so builds
+# with other parameters never replace each other:
+#   meta.json     parameters, label names, one timeline entry per video fingerprint
+#   labels.npy    (K, h, w) uint8 label maps at model resolution, memory-mapped on read
+#   thumbs.npy    (K, 36, 64) uint8 keyframe thumbnails for the change check
+#   <fp>.npz      per video: sample times (s) and the mask index used from each
+# Readers given the camera directory use the key built last; apply_segformer.py
+# and find_signs.py (open_cache) reuse it instead of imposing their own.
+
+import argparse, hashlib, json, os, shutil, sys
+from pathlib import Path
+import numpy as np
+import cv2
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "det_track"))
+from frame_pipeline import seek_frames
+
+MODEL_NAME = "nvidia/segformer-b0-finetuned-ade-512-512"  # as in apply_segformer.py (not imported: no torch here)
+THUMB = (64, 36)
+
+def video_fingerprint(source, block=1 << 20):
+    """Cheap content fingerprint: size plus the first and last MB."""
+    size = os.path.getsize(source)
+    h = hashlib.sha1(str(size).encode())
+    with open(source, "rb") as f:
+        h.update(f.read(block))
+        f.seek(max(0, size - block))
+        h.update(f.read(block))
+    return h.hexdigest()[:16]
+
+def thumb(frame):
+    return cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), THUMB, interpolation=cv2.INTER_AREA)
+
+def changed_fraction(a, b, diff):
+    """Fraction of thumbnail pixels whose grey level moved by more than `diff`."""
+    return float((np.abs(a.astype(np.int16) - b.astype(np.int16)) > diff).mean())
+
+def _write_atomic_npy(path, arr):
+    tmp = str(path) + ".tmp.npy"
+    np.save(tmp, arr)
+    os.replace(tmp, path)
+
+def key_id(key):
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+def _migrate(cache_dir):
+    """Move a cache from the single-key layout (files directly in cache_dir)
+    into its key's subdirectory."""
+    meta_path = cache_dir / "meta.json"
+    if not meta_path.exists():
+        return
+    dst = cache_dir / key_id(json.loads(meta_path.read_text(encoding="utf-8"))["key"])
+    dst.mkdir(exist_ok=True)
+    for p in cache_dir.iterdir():
+        if p.is_file() and p.name != "meta.json":
+            p.rename(dst / p.name)
+    meta_path.rename(dst / "meta.json")  # last: a crash leaves the old layout readable
+
+def key_dirs(cache_dir):
+    """Key subdirectories of a camera's cache, the one built last at the end."""
+    cache_dir = Path(cache_dir)
+    if not cache_dir.is_dir():
+        return []
+    return sorted((d for d in cache_dir.iterdir() if (d / "meta.json").exists()),
+                  key=lambda d: (d / "meta.json").stat().st_mtime)
+
+def stored_key(cache_dir):
+    """Key of the cache built last in `cache_dir` with the current model, or None."""
+    _migrate(Path(cache_dir))
+    for d in reversed(key_dirs(cache_dir)):
+        key = json.loads((d / "meta.json").read_text(encoding="utf-8"))["key"]
+        if key.get("model") == MODEL_NAME:
+            return key
+    return None
+
+class MaskCache:
+    """Read side: label at (x, y, t) from the cached maps, no model needed.
+    `path` is a key directory, or a camera's cache directory (then `key`,
+    default: the one built last)."""
+    def __init__(self, path, key=None):
+        path = Path(path)
+        if key is not None:
+            path = path / key_id(key)
+        elif not (path / "meta.json").exists() and key_dirs(path):
+            path = key_dirs(path)[-1]
+        self.path = path
+        meta_path = self.path / "meta.json"
+        if not meta_path.exists():
+            raise SystemExit(f"No mask cache at {path} (run: mask_cache.py build)")
+        self.meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        self.labels = np.load(self.path / "labels.npy", mmap_mode="r")  # (K, h, w) uint8
+        self.names = {int(k): v for k, v in self.meta["id2label"].items()}
+        self._timelines = {}
+
+    def videos(self):
+        return list(self.meta["videos"])
+
+    def timeline(self, video=None):
+        """(entry, sample times, mask index per sample) for a video fingerprint
+        or path; default: the video added last."""
+        if video is None:
+            fp = self.videos()[-1]
+        elif video in self.meta["videos"]:
+            fp = video
+        else:
+            fp = video_fingerprint(video)
+            if fp not in self.meta["videos"]:
+                raise SystemExit(f"{video} is not in the mask cache at {self.path}")
+        if fp not in self._timelines:
+            z = np.load(self.path / f"{fp}.npz")
+            self._timelines[fp] = (self.meta["videos"][fp], z["t"], z["mask"])
+        return self._timelines[fp]
+
+    def mask_index(self, t, video=None):
+        """Index of the mask in effect at time(s) t: the last sample at or before t."""
+        _, ts, mask = self.timeline(video)
+        k = np.searchsorted(ts, np.asarray(t, dtype=np.float64), side="right") - 1
+        return mask[np.clip(k, 0, len(ts) - 1)]
+
+    def label_at(self, x, y, t, video=None):
+        """ADE20K class id at source pixel (x, y) and time t (seconds); arrays
+        broadcast. Same value as apply_segformer.segment() at that pixel."""
+        entry, _, _ = self.timeline(video)
+        k = self.mask_index(t, video)
+        h, w = self.labels.shape[1:]
+        sx, sy = w / entry["width"], h / entry["height"]
+        col = np.clip(np.floor(np.asarray(x, dtype=np.float64) * sx).astype(np.int64), 0, w - 1)
+        row = np.clip(np.floor(np.asarray(y, dtype=np.float64) * sy).astype(np.int64), 0, h - 1)
+        return self.labels[k, row, col]
+
+    def name_at(self, x, y, t, video=None):
+        return np.vectorize(self.names.get, otypes=[object])(self.label_at(x, y, t, video))
+
+    def class_ids(self, names):
+        label2id = {v.lower(): k for k, v in self.names.items()}
+        missing = [n for n in names if n.lower() not in label2id]
+        if missing:
+            raise SystemExit(f"Unknown classes {missing}")
+        return [label2id[n.lower()] for n in names]
+
+    def mask_at(self, t, video=None):
+        """Full label map in effect at time t, upsampled (nearest) to the video size."""
+        entry, _, _ = self.timeline(video)
+        return cv2.resize(np.ascontiguousarray(self.labels[int(self.mask_index(t, video))]),
+                          (entry["width"], entry["height"]), interpolation=cv2.INTER_NEAREST)
+
+def cache_key(every_sec=1.0, change_diff=25, change_area=0.2):
+    return {"model": MODEL_NAME, "every_sec": every_sec, "change_diff": change_diff, "change_area": change_area}
+
+def build(source, cache_dir, key, every_sec=1.0, change_diff=25, change_area=0.2, batch=8, force=False):
+    """Add `source`'s timeline to the cache, segmenting only on scene changes.
+    The masks go in `key`'s subdirectory of `cache_dir`; other keys' are
+    left alone. Returns (samples, newly segmented); newly segmented is None
+    when the video was already cached."""
+    _migrate(Path(cache_dir))
+    cache_dir = Path(cache_dir) / key_id(key)
+    if force:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    meta_path = cache_dir / "meta.json"
+    meta = json.loads(meta_path.read_text(encoding="utf-8")) if meta_path.exists() else None
+    fp = video_fingerprint(source)
+    if meta is not None and fp in meta["videos"]:
+        return meta["videos"][fp]["samples"], None
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    if meta is None:
+        meta = {"key": key, "id2label": None, "videos": {}}
+        labels, thumbs = [], []
+    else:
+        labels = list(np.load(cache_dir / "labels.npy"))
+        thumbs = list(np.load(cache_dir / "thumbs.npy"))
+    n_old = len(labels)
+
+    cap = cv2.VideoCapture(str(source))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 15
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    W, H = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+    step = max(1, int(fps * every_sec))
+
+    seg = {}
+    def flush(pending):
+        if not pending:
+            return
+        if "model" not in seg:  # the transformer is loaded only when something needs segmenting
+            from apply_segformer import load_segformer, segment_batch
+            seg["model"], seg["fn"] = load_segformer(), segment_batch
+        feat, model = seg["model"]
+        meta["id2label"] = meta["id2label"] or {str(k): v for k, v in model.config.id2label.items()}
+        for (slot, _), lab in zip(pending, seg["fn"](feat, model, [rgb for _, rgb in pending], native=True)):
+            labels[slot] = lab
+        pending.clear()
+
+    times, mask_of, pending = [], [], []
+    current = len(thumbs) - 1  # a camera cache starts from the mask in use last
+    for i, frame in seek_frames(source, np.arange(0, total, step)):
+        th = thumb(frame)
+        if current < 0 or changed_fraction(th, thumbs[current], change_diff) > change_area:
+            # scene changed: an earlier keyframe may still match (e.g. lighting back to before)
+            fracs = [changed_fraction(th, t, change_diff) for t in thumbs]
+            best = int(np.argmin(fracs)) if fracs else -1
+            if best >= 0 and fracs[best] <= change_area:
+                current = best
+            else:
+                current = len(thumbs)
+                thumbs.append(th)
+                labels.append(None)
+                pending.append((current, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
+                if len(pending) >= batch:
+                    flush(pending)
+        times.append(i / fps)
+        mask_of.append(current)
+    flush(pending)
+    if not times:
+        raise SystemExit(f"Could not read frames from {source}")
+
+    _write_atomic_npy(cache_dir / "labels.npy", np.stack(labels).astype(np.uint8))
+    _write_atomic_npy(cache_dir / "thumbs.npy", np.stack(thumbs))
+    np.savez(cache_dir / f"{fp}.npz", t=np.asarray(times), mask=np.asarray(mask_of, dtype=np.int32))
+    meta["videos"][fp] = {"source": str(Path(source).resolve()), "fps": fps, "width": W, "height": H,
+                          "samples": len(times), "new_masks": len(labels) - n_old}
+    meta_path.write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    return len(times), len(labels) - n_old
+
+def open_cache(source, cache_dir, every_sec=1.0, batch=8):
+    """MaskCache holding `source`, for scripts that sample on their own: the
+    camera's existing key is reused whatever parameters built it; only a new
+    cache samples every `every_sec` s with the default change thresholds."""
+    key = stored_key(cache_dir) or cache_key(every_sec)
+    build(source, cache_dir, key, key["every_sec"], key["change_diff"], key["change_area"], batch)
+    return MaskCache(cache_dir, key)
+
+def main():
+    ap = argparse.ArgumentParser(description="Persistent SegFormer mask cache with (x, y, t) queries")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="segment a video into the cache (only where the scene changed)")
+    b.add_argument("--source", default="det_track/sample_video.mp4")
+    b.add_argument("--camera", default=None, help="camera id: videos of one camera share its masks")
+    b.add_argument("--cache", default=None, help="cache dir (default segmentation/outputs/mask_cache/<camera or video>)")
+    b.add_argument("--every_sec", type=float, default=1.0, help="seconds between sampled frames")
+    b.add_argument("--change_diff", type=float, default=25, help="grey-level change that counts as changed")
+    b.add_argument("--change_area", type=float, default=0.2,
+                   help="fraction of the thumbnail that must change before re-segmenting")
+    b.add_argument("--batch", type=int, default=8, help="frames per model call")
+    b.add_argument("--force", action="store_true", help="drop this key's masks and segment again")
+    q = sub.add_parser("at", help="label at (x, y, t)")
+    q.add_argument("--cache", required=True)
+    q.add_argument("--x", type=float, nargs="+", required=True)
+    q.add_argument("--y", type=float, nargs="+", required=True)
+    q.add_argument("--t", type=float, nargs="+", required=True, help="seconds into the video")
+    q.add_argument("--source", default=None, help="which cached video (default: the last one added)")
+    s = sub.add_parser("stats", help="masks and videos in a cache")
+    s.add_argument("--cache", required=True)
+    args = ap.parse_args()
+
+    if args.cmd == "build":
+        cache = args.cache or f"segmentation/outputs/mask_cache/{args.camera or Path(args.source).stem}"
+        key = cache_key(args.every_sec, args.change_diff, args.change_area)
+        n, new = build(args.source, cache, key, args.every_sec, args.change_diff, args.change_area,
+                       args.batch, args.force)
+        if new is None:
+            print(f"Cached: {cache} ({n} samples)")
+        else:
+            print(f"Wrote: {cache} ({n} samples, {new} newly segmented, {n - new} reused)")
+    elif args.cmd == "at":
+        mc = MaskCache(args.cache)
+        x, y, t = np.broadcast_arrays(np.array(args.x), np.array(args.y), np.array(args.t))
+        ids, names = mc.label_at(x, y, t, args.source), mc.name_at(x, y, t, args.source)
+        print("| x | y | t | label | name |")
+        print("|---|---|---|-------|------|")
+        for r in zip(x, y, t, ids, names):
+            print(f"| {r[0]:g} | {r[1]:g} | {r[2]:g} | {r[3]} | {r[4]} |")
+    else:
+        mc = MaskCache(args.cache)
+        others = [d for d in key_dirs(args.cache) if d != mc.path]
+        if others:
+            print(f"{len(others)} other key(s) in {args.cache}: " + ", ".join(d.name for d in others))
+        print(f"key {mc.path.name}: {mc.meta['key']}")
+        print(f"{mc.labels.shape[0]} masks of {mc.labels.shape[2]}x{mc.labels.shape[1]} "
+              f"({mc.labels.nbytes / 1e6:.2f} MB)")
+        print("| video | samples | new masks | size |")
+        print("|-------|---------|-----------|------|")
+        for fp, v in mc.meta["videos"].items():
+            print(f"| {Path(v['source']).name} ({fp}) | {v['samples']} | {v['new_masks']} | {v['width']}x{v['height']} |")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# segmentation/roi_mask.py
+# Turn SegFormer output for a fixed camera into a cached curb/road ROI mask.
+#
+# A handful of frames spread over the video are segmented; a pixel is in the
+# ROI when it is road / sidewalk / vehicle in at least --vote of them (parked
+# cars hide the curb, so vehicle classes count too). The mask is cleaned up,
+# dilated and saved as a PNG next to a JSON sidecar; det_track/roi.py loads it
+# for track.py / detect_to_csv.py --roi_mask.
+# Usage (from project root):
+#   python segmentation/roi_mask.py --source det_track/sample_video.mp4
+#   python det_track/track.py --roi_mask segmentation/outputs/roi_sample_video.png
+
+import argparse, json, os
+from itertools import islice
+from pathlib import Path
+import numpy as np
+import cv2
+from apply_segformer import load_segformer, segment_batch  # also puts det_track/ on sys.path
+from frame_pipeline import seek_frames
+
+ROI_CLASSES = ["road", "sidewalk", "car", "truck", "bus", "van", "minibike", "bicycle"]
+
+def class_ids(model, names):
+    label2id = {k.lower(): v for k, v in model.config.label2id.items()}
+    missing = [n for n in names if n.lower() not in label2id]
+    if missing:
+        raise SystemExit(f"Unknown classes {missing}; model has e.g. {sorted(label2id)[:20]}")
+    return [label2id[n.lower()] for n in names]
+
+def source_key(source, args):
+    st = os.stat(source)
+    return {"source": str(Path(source).resolve()), "size": st.st_size, "mtime": int(st.st_mtime),
+            "classes": args.classes, "frames": args.frames, "vote": args.vote, "dilate": args.dilate}
+
+def build_mask(source, classes, n_frames=8, vote=0.3, dilate=15, batch=8):
+    feat, model = load_segformer()
+    ids = class_ids(model, classes)
+    cap = cv2.VideoCapture(source)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    cap.release()
+    stride = max(1, total // max(1, n_frames))
+
+    # seek straight to the sampled frames and segment them `batch` at a time
+    frames = (cv2.cvtColor(f, cv2.COLOR_BGR2RGB)
+              for _, f in seek_frames(source, np.arange(n_frames) * stride + stride // 2))
+    hits, n = None, 0
+    while True:
+        rgbs = list(islice(frames, batch))
+        if not rgbs:
+            break
+        for labels in segment_batch(feat, model, rgbs):
+            m = np.isin(labels, ids)
+            hits = m.astype(np.float32) if hits is None else hits + m
+            n += 1
+    if not n:
+        raise SystemExit(f"Could not read frames from {source}")
+
+    mask = ((hits / n) >= vote).astype(np.uint8) * 255
+    k = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (9, 9))
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, k)  # fill small holes
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, k)   # drop specks
+    if dilate > 0:
+        d = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * dilate + 1, 2 * dilate + 1))
+        mask = cv2.dilate(mask, d)  # keep whole vehicles whose roofs leave the road class
+    return mask, n
+
+def main():
+    ap = argparse.ArgumentParser(description="Build a cached curb/road ROI mask from SegFormer")
+    ap.add_argument("--source", default="det_track/sample_video.mp4")
+    ap.add_argument("--out", default=None, help="mask PNG (default segmentation/outputs/roi_<video>.png)")
+    ap.add_argument("--classes", nargs="+", default=ROI_CLASSES, help="ADE20K class names kept in the ROI")
+    ap.add_argument("--frames", type=int, default=8, help="frames sampled across the video")
+    ap.add_argument("--vote", type=float, default=0.3, help="fraction of frames a pixel must be ROI in")
+    ap.add_argument("--dilate", type=int, default=15, help="grow the mask by this many pixels")
+    ap.add_argument("--force", action="store_true", help="rebuild even if a matching cached mask exists")
+    args = ap.parse_args()
+
+    out = args.out or f"segmentation/outputs/roi_{Path(args.source).stem}.png"
+    meta_path = Path(out).with_suffix(".json")
+    key = source_key(args.source, args)
+    if not args.force and os.path.exists(out) and meta_path.exists():
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        if meta.get("key") == key:
+            print("Cached:", out, f"(ROI crop = {100 * meta['crop_fraction']:.1f}% of frame)")
+            return
+
+    mask, n = build_mask(args.source, args.classes, args.frames, args.vote, args.dilate)
+    os.makedirs(Path(out).parent, exist_ok=True)
+    cv2.imwrite(out, mask)
+
+    ys, xs = np.nonzero(mask)
+    h, w = mask.shape
+    bbox = [int(xs.min()), int(ys.min()), int(xs.max()) + 1, int(ys.max()) + 1] if len(xs) else [0, 0, 0, 0]
+    meta = {"key": key, "frames_used": n, "width": w, "height": h, "bbox": bbox,
+            "mask_fraction": round(float((mask > 0).mean()), 4),
+            "crop_fraction": round((bbox[2] - bbox[0]) * (bbox[3] - bbox[1]) / float(w * h), 4)}
+    meta_path.write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    print("Wrote:", out, f"(mask = {100 * meta['mask_fraction']:.1f}%, crop = {100 * meta['crop_fraction']:.1f}% of frame)")
+    print("Wrote:", meta_path)
+
+if __name__ == "__main__":
+    main()